@@ -1,17 +1,9 @@
 from django.apps import AppConfig
-import logging
 
 
 class CatalogConfig(AppConfig):
     name = 'rsshistory'
 
     def ready(self):
-        pass
-
-        from .prjconfig import Configuration
-        c = Configuration.get_object(str(CatalogConfig.name))
-        
-        text = "APP ready: {0}".format(CatalogConfig.name)
-        from .models import PersistentInfo
-        PersistentInfo.cleanup()
-        p = PersistentInfo.create(text)
+        """ Only signal handlers are connected. Configuration is created on first use, threads by worker process """
+        from . import signals
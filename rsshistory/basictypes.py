@@ -6,7 +6,6 @@ import os
 import time
 import logging
 import shutil
-import urllib.request, urllib.error, urllib.parse
 
 
 def get_ascii_text(text):
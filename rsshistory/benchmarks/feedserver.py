@@ -0,0 +1,183 @@
+"""
+Local HTTP server with synthetic RSS / Atom feeds, and HTML pages.
+
+Paths:
+    /rss/<number>.xml   RSS 2.0 feed
+    /atom/<number>.xml  Atom feed
+    /page/<number>.html HTML page with links
+    /                   HTML page with links, main page of parsing-type source
+
+Feeds are the same for the same seed, they are sent with ETag and Last-Modified headers,
+and conditional requests are answered with 304.
+"""
+import time
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from email.utils import formatdate, parsedate_to_datetime
+
+
+class FeedServerConfig(object):
+    # publish time of the newest entry, for seed 0, seconds since epoch
+    base_time = 1704067200
+
+    def __init__(self, entries_per_feed = 50, description_size = 500, latency = 0.0, error_rate = 0.0, links_per_page = 100, seed = 0):
+        self.entries_per_feed = entries_per_feed
+        self.description_size = description_size
+        # seconds
+        self.latency = latency
+        # part of requests which fail with 500
+        self.error_rate = error_rate
+        self.links_per_page = links_per_page
+        self.seed = seed
+
+    def get_published_time(self):
+        return self.base_time + self.seed * 24 * 60 * 60
+
+
+class FeedServer(object):
+
+    def __init__(self, config = None, host = "127.0.0.1", port = 0):
+        if config is None:
+            config = FeedServerConfig()
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.random_lock = threading.Lock()
+        self.requests = 0
+        # concurrent requests, to check limits of clients
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    def get_url(self, path = ""):
+        host, port = self.httpd.server_address[:2]
+        return "http://{0}:{1}{2}".format(host, port, path)
+
+    def start(self):
+        self.thread = threading.Thread(target = self.httpd.serve_forever, daemon = True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def is_error(self):
+        with self.random_lock:
+            self.requests += 1
+            return self.random.random() < self.config.error_rate
+
+    def get_description(self, number):
+        text = "Description of entry {0}. ".format(number)
+        repeats = max(1, self.config.description_size // len(text))
+        return (text * repeats)[:self.config.description_size]
+
+    def get_rss(self, number):
+        items = []
+        for index in range(self.config.entries_per_feed):
+            items.append("<item><title>Feed {0} entry {1}</title><link>{2}</link><description>{3}</description><pubDate>{4}</pubDate><guid>{2}</guid></item>".format(
+                number, index, self.get_url("/entry/{0}/{1}".format(number, index)), self.get_description(index), formatdate(self.config.get_published_time() - index * 600)))
+
+        return ('<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>Feed {0}</title><link>{1}</link><description>Synthetic feed</description>{2}</channel></rss>'
+                .format(number, self.get_url("/"), "".join(items)))
+
+    def get_atom(self, number):
+        entries = []
+        for index in range(self.config.entries_per_feed):
+            published = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.config.get_published_time() - index * 600))
+            entries.append('<entry><title>Atom {0} entry {1}</title><link href="{2}"/><id>{2}</id><published>{3}</published><updated>{3}</updated><summary>{4}</summary></entry>'.format(
+                number, index, self.get_url("/atom-entry/{0}/{1}".format(number, index)), published, self.get_description(index)))
+
+        return ('<?xml version="1.0" encoding="utf-8"?><feed xmlns="http://www.w3.org/2005/Atom"><title>Atom {0}</title><id>{1}</id><updated>{2}</updated>{3}</feed>'
+                .format(number, self.get_url("/atom/{0}.xml".format(number)), time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.config.get_published_time())), "".join(entries)))
+
+    def get_page(self, number):
+        links = []
+        for index in range(self.config.links_per_page):
+            links.append('<li><a href="/page/{0}-{1}.html">Page {0} link {1}</a></li>'.format(number, index))
+
+        return ('<!DOCTYPE html><html lang="en"><head><title>Page {0}</title><meta name="description" content="Synthetic page"></head><body><ul>{1}</ul></body></html>'
+                .format(number, "".join(links)))
+
+    def handle(self, handler):
+        with self.random_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            self.handle_request(handler)
+        finally:
+            with self.random_lock:
+                self.in_flight -= 1
+
+    def handle_request(self, handler):
+        if self.config.latency > 0:
+            time.sleep(self.config.latency)
+
+        path = handler.path
+        number = path.rsplit("/", 1)[-1].split(".")[0]
+
+        if self.is_error():
+            self.send(handler, 500, "text/plain", "Synthetic error")
+        elif path.startswith("/rss/"):
+            self.send_feed(handler, "application/rss+xml; charset=utf-8", self.get_rss(number))
+        elif path.startswith("/atom/"):
+            self.send_feed(handler, "application/atom+xml; charset=utf-8", self.get_atom(number))
+        elif path.startswith("/page/") or path == "/":
+            self.send(handler, 200, "text/html; charset=utf-8", self.get_page(number))
+        else:
+            self.send(handler, 404, "text/plain", "Not found")
+
+    def is_not_modified(self, handler, etag, last_modified):
+        if_none_match = handler.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(",")]
+
+        if_modified_since = handler.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= last_modified
+            except (TypeError, ValueError):
+                pass
+
+        return False
+
+    def send_feed(self, handler, content_type, text):
+        etag = '"{0}"'.format(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16])
+        last_modified = self.config.get_published_time()
+        headers = {"ETag" : etag, "Last-Modified" : formatdate(last_modified, usegmt = True)}
+
+        if self.is_not_modified(handler, etag, last_modified):
+            handler.send_response(304)
+            for name, value in headers.items():
+                handler.send_header(name, value)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+        else:
+            self.send(handler, 200, content_type, text, headers)
+
+    def send(self, handler, status, content_type, text, headers = None):
+        data = text.encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        if headers:
+            for name, value in headers.items():
+                handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
@@ -0,0 +1,150 @@
+"""
+Compares single-pass HTML extraction with the previous str.find based code.
+
+The legacy code is faster, but it is not correct: it finds only links written as
+<a href="...">, so links with other attributes first, or with single quotes, are missed,
+and it returns links from comments and scripts. On the synthetic page it finds one
+third of links, see HtmlInfoTest.test_legacy_extractor_misses_links.
+
+Usage:
+    python -m rsshistory.benchmarks.htmlbench [number of links] [repeats]
+"""
+import sys
+import time
+
+from ..htmlinfo import parse_html, parse_full_links
+
+
+def create_page(num_links):
+    parts = []
+    parts.append('<!DOCTYPE html>\n<html lang="pl-PL"><head><meta charset="utf-8">')
+    parts.append('<title>Synthetic page with {0} links</title>'.format(num_links))
+    parts.append('<meta name="description" content="Benchmark page">')
+    parts.append('<link rel="alternate" type="application/rss+xml" href="/feed">')
+    parts.append('<script>var config = {"api": "https://api.example.com/v1", "cdn": "https://cdn.example.com"};</script>')
+    parts.append('</head><body>')
+
+    for index in range(num_links):
+        if index % 3 == 0:
+            parts.append('<div class="item"><a href="https://example.com/{0}-article">Article {0}</a>'.format(index))
+        elif index % 3 == 1:
+            parts.append('<div class="item"><a class="link" href="/{0}-news">News {0}</a>'.format(index))
+        else:
+            parts.append("<div class='item'><a href='https://example.com/{0}-post'>Post {0}</a>".format(index))
+        parts.append('<p>Some paragraph text with <b>bold</b> and <i>italic</i> words, https://example.com/text/{0}</p></div>\n'.format(index))
+
+    parts.append('</body></html>')
+    return "".join(parts)
+
+
+class LegacyExtractor(object):
+    """ Previous implementation from Page and WebLinkParser, kept for comparison """
+
+    def extract_html(self, text, tag, closingtag, wh = None):
+        if not wh:
+            wh = 0
+
+        wh = text.find(tag, wh)
+
+        if wh > 0:
+            wh2 = text.find(closingtag, len(tag) + wh + 1)
+
+            if wh2 > 0:
+                title = text[wh + len(tag):wh2]
+                if title.strip() != "":
+                    return title
+
+    def get_title(self, contents):
+        wh1 = contents.find("<title", 0)
+        wh2 = contents.find("</title", wh1+1)
+        return contents[wh1+7: wh2].strip()
+
+    def get_language(self, contents):
+        whlang = contents.find("lang")
+        if whlang >= 0:
+            return self.extract_html(contents, '"', '"', whlang)
+
+    def parse_a_hrefs(self, page):
+        links = set()
+
+        wh = 1
+        while wh:
+            wh = page.find('<a href="', wh + 1)
+
+            if wh > 0:
+                text = self.extract_html(page, '<a href="', '"', wh)
+                if text:
+                    links.add(text)
+            else:
+                break
+
+        return links
+
+    def parse_full_links(self, html):
+        searchstring = "https://"
+        links = set()
+
+        wh = 1
+        while wh:
+            wh2 = html.find(searchstring, wh)
+
+            where = set()
+            where.add(html.find("\"", wh2+1))
+            where.add(html.find("}", wh2+1))
+            where.add(html.find("<", wh2+1))
+            where.add(html.find(">", wh2+1))
+            where.add(html.find("\\", wh2+1))
+            where.add(html.find(")", wh2+1))
+            where.add(html.find("(", wh2+1))
+            where.discard(-1)
+            val = min(where)
+
+            foundstring = html[wh2: val]
+
+            if foundstring != searchstring:
+                links.add(foundstring)
+
+            if wh2 == -1:
+                break
+
+            wh = wh2 + 1
+
+        return links
+
+
+def measure(function, repeats):
+    start = time.perf_counter()
+    for index in range(repeats):
+        result = function()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def run(num_links = 5000, repeats = 5):
+    page = create_page(num_links)
+    legacy = LegacyExtractor()
+
+    def legacy_all():
+        return (legacy.parse_a_hrefs(page), legacy.parse_full_links(page),
+                legacy.get_title(page), legacy.get_language(page))
+
+    def single_pass():
+        info = parse_html(page)
+        return (info.links, parse_full_links(page), info.title, info.language)
+
+    legacy_time, legacy_result = measure(legacy_all, repeats)
+    new_time, new_result = measure(single_pass, repeats)
+
+    print("Page size: {0} kB, links: {1}".format(len(page) // 1024, num_links))
+    print("Legacy:      {0:8.2f} ms, <a> links: {1} of {2}, full links: {3}".format(legacy_time * 1000, len(legacy_result[0]), num_links, len(legacy_result[1])))
+    print("Single pass: {0:8.2f} ms, <a> links: {1} of {2}, full links: {3}, feeds: {4}".format(new_time * 1000, len(new_result[0]), num_links, len(new_result[1]), len(parse_html(page).feeds)))
+
+
+if __name__ == "__main__":
+    num_links = 5000
+    repeats = 5
+    if len(sys.argv) > 1:
+        num_links = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        repeats = int(sys.argv[2])
+
+    run(num_links, repeats)
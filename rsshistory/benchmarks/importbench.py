@@ -0,0 +1,77 @@
+"""
+Measures import time of modules, each in a new interpreter, and lists heavy modules they load.
+
+Modules which need Django are measured if DJANGO_SETTINGS_MODULE is set, django.setup() time
+is shown separately.
+
+Usage:
+    python -m rsshistory.benchmarks.importbench [repeats]
+"""
+import os
+import sys
+import json
+import subprocess
+
+
+STANDALONE_MODULES = ["rsshistory.htmlinfo",
+                      "rsshistory.httpclient",
+                      "rsshistory.webtools",
+                      "rsshistory.metrics",
+                      "rsshistory.threads"]
+
+DJANGO_MODULES = ["rsshistory.models",
+                  "rsshistory.prjconfig",
+                  "rsshistory.views",
+                  "rsshistory.urls"]
+
+HEAVY_MODULES = ["github", "feedparser", "dateutil", "asyncio", "urllib.request", "concurrent.futures"]
+
+SCRIPT = """
+import sys, json, time, importlib
+start = time.perf_counter()
+if {setup}:
+    import django
+    django.setup()
+setup_seconds = time.perf_counter() - start
+start = time.perf_counter()
+importlib.import_module({module!r})
+seconds = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"setup" : setup_seconds, "import" : seconds, "heavy" : heavy}}))
+"""
+
+
+def measure(module, setup, repeats):
+    """ Returns best result of repeats """
+    best = None
+    for index in range(repeats):
+        script = SCRIPT.format(setup = setup, module = module, heavy = HEAVY_MODULES)
+        output = subprocess.run([sys.executable, "-c", script], capture_output = True, text = True, check = True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        if best is None or result["import"] + result["setup"] < best["import"] + best["setup"]:
+            best = result
+    return best
+
+
+def run(repeats = 5):
+    modules = [(module, False) for module in STANDALONE_MODULES]
+    if os.environ.get("DJANGO_SETTINGS_MODULE"):
+        modules += [(module, True) for module in DJANGO_MODULES]
+    else:
+        print("DJANGO_SETTINGS_MODULE is not set, modules which need Django are skipped")
+
+    for module, setup in modules:
+        try:
+            result = measure(module, setup, repeats)
+        except subprocess.CalledProcessError as E:
+            print("{0:25} failed: {1}".format(module, E.stderr.strip().splitlines()[-1]))
+            continue
+
+        setup_text = "setup {0:7.1f} ms ".format(result["setup"] * 1000) if setup else ""
+        print("{0:25} {1}import {2:7.1f} ms, heavy modules: {3}".format(
+            module, setup_text, result["import"] * 1000, ", ".join(result["heavy"]) or "-"))
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    run(repeats)
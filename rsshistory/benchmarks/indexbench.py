@@ -0,0 +1,123 @@
+"""
+Shows query plans and times of entry table queries, without and with indexes.
+
+Table with synthetic entries is created in a temporary SQLite database. Queries are the ones
+used by daily files, removal of old entries, scheduler, highlights and entry list.
+
+Usage:
+    python -m rsshistory.benchmarks.indexbench [number of entries] [number of sources]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+
+TABLE = "rsshistory_rsssourceentrydatamodel"
+
+INDEXES = [
+    "CREATE INDEX entry_source_date ON {0} (source, date_published)".format(TABLE),
+    "CREATE INDEX entry_persistent_date ON {0} (persistent, date_published)".format(TABLE),
+    "CREATE INDEX entry_date_desc ON {0} (date_published DESC)".format(TABLE),
+]
+
+
+def get_queries(source, day_start, day_end, days_before):
+    return [
+        ("source entries of day",
+         "SELECT * FROM {0} WHERE source = ? AND date_published BETWEEN ? AND ?".format(TABLE), (source, day_start, day_end)),
+        ("old entries of source",
+         "SELECT id FROM {0} WHERE source = ? AND persistent = 0 AND date_published < ?".format(TABLE), (source, days_before)),
+        ("scheduler count",
+         "SELECT COUNT(*) FROM {0} WHERE source = ? AND date_published >= ?".format(TABLE), (source, day_start)),
+        ("highlights of day",
+         "SELECT * FROM {0} WHERE persistent = 1 AND date_published BETWEEN ? AND ?".format(TABLE), (day_start, day_end)),
+        ("entries of day",
+         "SELECT * FROM {0} WHERE date_published BETWEEN ? AND ?".format(TABLE), (day_start, day_end)),
+        ("entry list page",
+         "SELECT * FROM {0} ORDER BY date_published DESC, source ASC, title ASC LIMIT 100".format(TABLE), ()),
+    ]
+
+
+def create_table(connection, num_entries, num_sources):
+    connection.execute("""CREATE TABLE {0} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source VARCHAR(2000) NOT NULL,
+        title VARCHAR(1000) NOT NULL,
+        description VARCHAR(1000) NOT NULL,
+        link VARCHAR(1000) NOT NULL UNIQUE,
+        date_published DATETIME NOT NULL,
+        persistent BOOL NOT NULL,
+        dead BOOL NOT NULL,
+        user VARCHAR(1000) NULL,
+        language VARCHAR(10) NULL,
+        source_obj_id INTEGER NULL)""".format(TABLE))
+
+    generator = random.Random(0)
+    start = datetime(2020, 1, 1)
+    seconds_range = 3 * 365 * 24 * 3600
+
+    def rows():
+        for index in range(num_entries):
+            source = "https://source{0}.example.com/feed".format(generator.randrange(num_sources))
+            date = start + timedelta(seconds = generator.randrange(seconds_range))
+            yield (source, "Entry {0}".format(index), "Description", "https://example.com/entry/{0}".format(index),
+                   date.strftime("%Y-%m-%d %H:%M:%S"), 1 if generator.random() < 0.01 else 0, 0, None, "en")
+
+    connection.executemany("INSERT INTO {0} (source, title, description, link, date_published, persistent, dead, user, language) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)".format(TABLE), rows())
+    connection.commit()
+
+
+def measure(connection, queries, repeats = 3):
+    for name, sql, params in queries:
+        plan = connection.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        plan_text = "; ".join(row[-1] for row in plan)
+
+        best = None
+        for index in range(repeats):
+            start = time.perf_counter()
+            connection.execute(sql, params).fetchall()
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+
+        print("  {0:24} {1:9.2f} ms  {2}".format(name, best * 1000, plan_text))
+
+
+def run(num_entries = 2000000, num_sources = 500):
+    handle, path = tempfile.mkstemp(suffix = ".sqlite3")
+    os.close(handle)
+
+    try:
+        connection = sqlite3.connect(path)
+
+        start = time.perf_counter()
+        create_table(connection, num_entries, num_sources)
+        print("Created {0} entries of {1} sources in {2:.1f} s".format(num_entries, num_sources, time.perf_counter() - start))
+
+        queries = get_queries("https://source7.example.com/feed", "2021-06-01 00:00:00", "2021-06-01 23:59:59", "2021-01-01 00:00:00")
+
+        print("Without indexes:")
+        measure(connection, queries)
+
+        start = time.perf_counter()
+        for sql in INDEXES:
+            connection.execute(sql)
+        connection.execute("ANALYZE")
+        print("Indexes created in {0:.1f} s".format(time.perf_counter() - start))
+
+        print("With indexes:")
+        measure(connection, queries)
+
+        connection.close()
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    num_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    num_sources = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    run(num_entries, num_sources)
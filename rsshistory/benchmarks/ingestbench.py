@@ -0,0 +1,178 @@
+"""
+Ingest benchmark. Sources served by local FeedServer are processed by Configuration.t_process_source.
+
+Runs inside Django, in a separate test database, see management command 'ingestbench'.
+"""
+import io
+import time
+import tempfile
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .feedserver import FeedServer, FeedServerConfig
+
+
+class QueryCounter(object):
+    """ Database execute wrapper, counts queries and time spent in database """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.queries += 1
+                self.seconds += elapsed
+
+
+def percentile(values, part):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(part * (len(values) - 1))))
+    return values[index]
+
+
+class IngestBenchmark(object):
+
+    def __init__(self, config, num_sources = 100, feed_type = "rss", workers = 4, rounds = 1, server_config = None, verbose = False):
+        """ config is Configuration used to process sources """
+        self.config = config
+        self.num_sources = num_sources
+        # rss, atom, or parsing
+        self.feed_type = feed_type
+        self.workers = max(1, workers)
+        self.rounds = rounds
+        self.server_config = server_config if server_config else FeedServerConfig()
+        self.verbose = verbose
+        self.plugin_address = None
+
+    def create_sources(self, server):
+        from ..models import RssSourceDataModel
+
+        if self.feed_type == "parsing":
+            # plugins are selected by domain, so there is one parsing source for server
+            urls = [server.get_url()]
+        else:
+            urls = [server.get_url("/{0}/{1}.xml".format(self.feed_type, index)) for index in range(self.num_sources)]
+
+        sources = []
+        for index, url in enumerate(urls):
+            sources.append(RssSourceDataModel(url = url, title = "Benchmark {0}".format(index), category = "Benchmark", subcategory = "Benchmark", language = "en"))
+
+        RssSourceDataModel.objects.bulk_create(sources)
+        return list(RssSourceDataModel.objects.filter(url__in = urls))
+
+    def register_parsing_plugin(self, server):
+        from ..sources.baseplugin import BasePlugin
+        from ..sources.basepluginbuilder import BasePluginBuilder
+
+        address = server.get_url()
+
+        class BenchmarkParsingPlugin(BasePlugin):
+            def get_address(self):
+                return address
+
+            def get_processing_type(self):
+                return "PARSING"
+
+        BasePluginBuilder.get_registry()[address] = BenchmarkParsingPlugin()
+        self.plugin_address = address
+
+    def unregister_parsing_plugin(self):
+        from ..sources.basepluginbuilder import BasePluginBuilder
+
+        if self.plugin_address:
+            BasePluginBuilder.get_registry().pop(self.plugin_address, None)
+            self.plugin_address = None
+
+    def process(self, source, counter):
+        from django.db import connection
+
+        start = time.perf_counter()
+        error = None
+        try:
+            with connection.execute_wrapper(counter):
+                self.config.t_process_source(source)
+        except Exception as E:
+            error = E
+        finally:
+            connection.close()
+
+        return time.perf_counter() - start, error
+
+    def run_round(self, sources):
+        from ..models import RssSourceEntryDataModel
+
+        counter = QueryCounter()
+        entries_before = RssSourceEntryDataModel.objects.count()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers = self.workers) as executor:
+            results = list(executor.map(lambda source: self.process(source, counter), sources))
+        total_seconds = time.perf_counter() - start
+
+        entries_after = RssSourceEntryDataModel.objects.count()
+
+        latencies = [result[0] for result in results]
+        errors = [result[1] for result in results if result[1] is not None]
+        new_entries = entries_after - entries_before
+
+        return {"sources" : len(sources),
+                "errors" : len(errors),
+                "seconds" : total_seconds,
+                "new_entries" : new_entries,
+                "sources_per_second" : len(sources) / total_seconds if total_seconds else 0.0,
+                "entries_per_second" : new_entries / total_seconds if total_seconds else 0.0,
+                "latency_p50" : percentile(latencies, 0.5),
+                "latency_p99" : percentile(latencies, 0.99),
+                "queries" : counter.queries,
+                "queries_per_source" : counter.queries / len(sources) if sources else 0.0,
+                "db_seconds" : counter.seconds}
+
+    def run(self):
+        """
+        Returns list of round results. Entries are new in first round, in later rounds
+        feeds are not modified, and server answers conditional requests with 304.
+        """
+        from ..rssarchive import RssArchive
+
+        server = FeedServer(self.server_config).start()
+        archive_dir = tempfile.TemporaryDirectory()
+        previous_archive = self.config.rss_archive
+        self.config.rss_archive = RssArchive(archive_dir.name)
+
+        try:
+            if self.feed_type == "parsing":
+                self.register_parsing_plugin(server)
+
+            sources = self.create_sources(server)
+
+            results = []
+            for round_index in range(self.rounds):
+                if self.verbose:
+                    results.append(self.run_round(sources))
+                else:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        results.append(self.run_round(sources))
+
+            return results
+        finally:
+            self.unregister_parsing_plugin()
+            self.config.rss_archive = previous_archive
+            archive_dir.cleanup()
+            server.stop()
+
+    def format_result(self, round_index, result):
+        return ("Round {0}: {1} sources ({2} errors) in {3:.2f} s, {4:.1f} sources/s, {5} new entries, {6:.1f} entries/s, "
+                "latency p50 {7:.1f} ms p99 {8:.1f} ms, {9} queries ({10:.1f} per source, {11:.2f} s in db)").format(
+                round_index, result["sources"], result["errors"], result["seconds"], result["sources_per_second"],
+                result["new_entries"], result["entries_per_second"], result["latency_p50"] * 1000, result["latency_p99"] * 1000,
+                result["queries"], result["queries_per_source"], result["db_seconds"])
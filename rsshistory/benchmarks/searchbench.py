@@ -0,0 +1,126 @@
+"""
+Compares search by LIKE scan with FTS5 index used by SqliteSearchBackend.
+
+Usage:
+    python -m rsshistory.benchmarks.searchbench [number of entries]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+from ..search import SqliteSearchBackend
+from .indexbench import TABLE
+
+
+WORDS = ["python", "django", "election", "weather", "football", "economy", "science", "music",
+         "market", "energy", "health", "travel", "space", "climate", "software", "history"]
+
+# other words are synthetic, their frequency follows Zipf law, as in natural language
+VOCABULARY_SIZE = 20000
+
+# entries list shows 200 rows on a page
+PAGE_SIZE = 200
+
+
+def to_sqlite(sql):
+    """ Django cursor uses %s placeholders """
+    return sql.replace("%s", "?")
+
+
+def create_data(connection, backend, num_entries):
+    generator = random.Random(0)
+
+    vocabulary = WORDS + ["word{0}".format(index) for index in range(VOCABULARY_SIZE)]
+    generator.shuffle(vocabulary)
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    def words(count):
+        return " ".join(generator.choices(vocabulary, cum_weights = cumulative, k = count))
+
+    connection.execute("CREATE TABLE {0} (id INTEGER PRIMARY KEY, title VARCHAR(1000), description VARCHAR(1000))".format(TABLE))
+    for sql in backend.get_create_sql():
+        connection.execute(sql)
+
+    def rows():
+        for index in range(num_entries):
+            title = words(6) + " {0}".format(index)
+            description = words(30)
+            yield (index + 1, title, description)
+
+    batch = []
+    for row in rows():
+        batch.append(row)
+        if len(batch) == 10000:
+            insert(connection, backend, batch)
+            batch = []
+    insert(connection, backend, batch)
+    connection.commit()
+
+
+def insert(connection, backend, batch):
+    connection.executemany("INSERT INTO {0} (id, title, description) VALUES (?, ?, ?)".format(TABLE), batch)
+    connection.executemany(to_sqlite(backend.get_insert_sql()), [(row[0], row[1], row[2], "") for row in batch])
+
+
+def get_search_sql(backend):
+    """ The same query as SearchBackend.filter builds, for the first page of entries list """
+    return ("SELECT {0}.id, {1} AS search_rank FROM {0}, {2} "
+            "WHERE {0}.id IN (SELECT id FROM {0} WHERE id IN ({3}) ORDER BY id DESC LIMIT %s) AND {4} "
+            "ORDER BY search_rank, {0}.id DESC LIMIT %s".format(
+                TABLE, backend.get_rank_sql(), backend.table, backend.get_match_sql(), " AND ".join(backend.get_join_where(TABLE))))
+
+
+def measure(function, repeats = 3):
+    best = None
+    for index in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def run(num_entries = 1000000):
+    backend = SqliteSearchBackend()
+
+    handle, path = tempfile.mkstemp(suffix = ".sqlite3")
+    os.close(handle)
+
+    try:
+        connection = sqlite3.connect(path)
+
+        start = time.perf_counter()
+        create_data(connection, backend, num_entries)
+        print("Created and indexed {0} entries in {1:.1f} s".format(num_entries, time.perf_counter() - start))
+
+        for text in ["climate", "python django", '"space history"', "python 123", "word0"]:
+            words = [word.strip('"') for word in text.split()]
+            like_sql = "SELECT id FROM {0} WHERE {1} LIMIT ?".format(TABLE, " AND ".join(["(title LIKE ? OR description LIKE ?)"] * len(words)))
+            like_params = []
+            for word in words:
+                like_params += ["%" + word + "%", "%" + word + "%"]
+
+            like_time, like_result = measure(lambda: connection.execute(like_sql, like_params + [PAGE_SIZE]).fetchall())
+            query = backend.get_query(text)
+            fts_time, fts_result = measure(lambda: connection.execute(to_sqlite(get_search_sql(backend)), [query, backend.max_candidates, query, PAGE_SIZE]).fetchall())
+
+            print("{0:18} LIKE: {1:9.2f} ms, {2:5} rows   FTS5 ranked: {3:8.2f} ms, {4:5} rows".format(
+                text, like_time * 1000, len(like_result), fts_time * 1000, len(fts_result)))
+
+        connection.close()
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    num_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    run(num_entries)
@@ -0,0 +1,64 @@
+import os
+import socket
+from datetime import timedelta
+
+from .dateutils import DateUtils
+
+
+class DbLock(object):
+    """
+    Lock stored in ProcessLock table. Only one process, on any host, can hold it.
+
+    Owner refreshes the lock by calling acquire again. If owner dies, lock expires
+    after timeout_seconds and another process can take it.
+    """
+
+    timeout_seconds = 120
+
+    def __init__(self, name):
+        self.name = name
+        self.owner = "{0}:{1}".format(socket.gethostname(), os.getpid())
+        self.held_until = None
+
+    def acquire(self):
+        """ Returns True if lock is held by this process. Refreshes held lock """
+        from django.db import IntegrityError, transaction
+        from django.db.models import Q
+        from .models import ProcessLock
+
+        now = DateUtils.get_datetime_now_utc()
+        lock_until = now + timedelta(seconds = self.timeout_seconds)
+
+        free = Q(owner = self.owner) | Q(owner = None) | Q(lock_until__lt = now)
+        updated = ProcessLock.objects.filter(name = self.name).filter(free).update(
+                owner = self.owner, lock_until = lock_until, date_heartbeat = now)
+
+        if updated == 0 and not ProcessLock.objects.filter(name = self.name).exists():
+            try:
+                with transaction.atomic():
+                    ProcessLock.objects.create(name = self.name, owner = self.owner, lock_until = lock_until, date_heartbeat = now)
+                updated = 1
+            except IntegrityError:
+                # other process created it in the meantime
+                updated = 0
+
+        if updated == 0:
+            self.held_until = None
+            return False
+
+        self.held_until = lock_until
+        return True
+
+    def is_held(self):
+        return self.held_until is not None and DateUtils.get_datetime_now_utc() < self.held_until
+
+    def release(self):
+        from .models import ProcessLock
+
+        ProcessLock.objects.filter(name = self.name, owner = self.owner).update(owner = None, lock_until = None)
+        self.held_until = None
+
+    def get_lock(self):
+        """ Returns ProcessLock, or None """
+        from .models import ProcessLock
+        return ProcessLock.objects.filter(name = self.name).first()
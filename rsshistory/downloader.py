@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import hashlib
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from .httpclient import HttpClient
+
+
+class DownloadResponse(object):
+    def __init__(self, url, status = None, contents = None, headers = None):
+        self.url = url
+        self.status = status
+        self.contents = contents
+        if headers is None:
+            headers = {}
+        self.headers = headers
+        self.connect_seconds = 0.0
+        self.download_seconds = 0.0
+        self.bytes_transferred = 0
+
+    def set_transfer_info(self, http_response):
+        self.connect_seconds = http_response.connect_seconds
+        self.download_seconds = http_response.download_seconds
+        self.bytes_transferred = http_response.bytes_transferred
+        return self
+
+    def is_valid(self):
+        return self.status == 200 and self.contents is not None
+
+    def is_not_modified(self):
+        return self.status == 304
+
+    def get_etag(self):
+        return self.headers.get("ETag")
+
+    def get_last_modified(self):
+        return self.headers.get("Last-Modified")
+
+    def get_body_hash(self):
+        if self.contents is not None:
+            return hashlib.sha256(self.contents).hexdigest()
+
+
+class AsyncDownloader(object):
+    """
+    Downloads many urls concurrently, using asyncio.
+    Number of requests in flight is limited for one download call, and for each host.
+    Fetch worker downloads only its batch, so in practice at most
+    workers * batch size feeds are downloaded at the same time, 40 by default.
+
+    Blocking transfers are executed in a thread pool, so all of them can wait for
+    network at the same time. Connections are reused through the shared HttpClient.
+
+    Event loop and thread pool are kept between calls. Object is not thread safe,
+    each worker uses its own downloader.
+    """
+
+    def __init__(self, max_connections = 100, max_per_host = 4):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.loop = None
+        self.executor = None
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+        if self.loop:
+            self.loop.close()
+            self.loop = None
+
+    def get_headers(self):
+        return {'Accept': 'application/rss+xml,application/atom+xml,application/xml;q=0.9,*/*;q=0.8'}
+
+    def download(self, urls, headers = None):
+        """
+        Returns map url -> DownloadResponse.
+        headers is optional map url -> extra request headers, for example conditional headers.
+        """
+        urls = list(dict.fromkeys(urls))
+        if len(urls) == 0:
+            return {}
+
+        if headers is None:
+            headers = {}
+        self._extra_headers = headers
+
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.executor = ThreadPoolExecutor(max_workers = self.max_connections)
+
+        return self.loop.run_until_complete(self.download_async(urls))
+
+    async def download_async(self, urls):
+        self._global_limit = asyncio.Semaphore(self.max_connections)
+        self._host_limits = {}
+
+        tasks = [self.fetch(self.loop, self.executor, url) for url in urls]
+        results = await asyncio.gather(*tasks)
+
+        return dict(zip(urls, results))
+
+    def get_host_limit(self, url):
+        host = urlparse(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_limits[host]
+
+    async def fetch(self, loop, executor, url):
+        async with self.get_host_limit(url):
+            async with self._global_limit:
+                extra_headers = self._extra_headers.get(url)
+                return await loop.run_in_executor(executor, self.fetch_blocking, url, extra_headers)
+
+    def fetch_blocking(self, url, extra_headers = None):
+        hdr = self.get_headers()
+        if extra_headers:
+            hdr.update(extra_headers)
+
+        try:
+            response = HttpClient.get_object().get(url, hdr)
+        except Exception as e:
+            logging.error("Could not download {0}: {1}".format(url, str(e)))
+            return DownloadResponse(url)
+
+        if response.status == 200:
+            return DownloadResponse(url, response.status, response.contents, response.headers).set_transfer_info(response)
+
+        if response.status != 304:
+            logging.error("Could not download {0}: status {1}".format(url, response.status))
+        return DownloadResponse(url, response.status, None, response.headers).set_transfer_info(response)
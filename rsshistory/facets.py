@@ -0,0 +1,93 @@
+"""
+Values of source fields shown in filter forms, with numbers of entries.
+
+Facets are computed by one grouping query, and kept in Django cache. Cache is invalidated when
+sources change, see signals.py. Numbers of entries change with every fetch, they are refreshed
+after cache timeout.
+"""
+import json
+import hashlib
+
+
+class SourceFacets(object):
+
+    fields = ('category', 'subcategory', 'title')
+    version_key = "rsshistory-facets-version"
+
+    def get_timeout():
+        from django.conf import settings
+        return getattr(settings, "RSSHISTORY_FACETS_CACHE_TTL", 600)
+
+    def get_version():
+        from django.core.cache import cache
+
+        version = cache.get(SourceFacets.version_key)
+        if version is None:
+            version = 1
+            cache.add(SourceFacets.version_key, version, None)
+        return version
+
+    def invalidate():
+        """ Called when sources change. Shared cache backend is needed to invalidate other processes """
+        from django.core.cache import cache
+
+        try:
+            cache.incr(SourceFacets.version_key)
+        except ValueError:
+            cache.set(SourceFacets.version_key, 1, None)
+
+    def get_key(filters):
+        text = json.dumps(filters, sort_keys = True)
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        return "rsshistory-facets-{0}-{1}".format(SourceFacets.get_version(), digest)
+
+    def get(filters):
+        """ Returns map field -> list of (value, number of entries) of sources matching filters """
+        from django.core.cache import cache
+
+        key = SourceFacets.get_key(filters)
+
+        facets = cache.get(key)
+        if facets is None:
+            facets = SourceFacets.compute(filters)
+            cache.set(key, facets, SourceFacets.get_timeout())
+
+        return facets
+
+    def compute(filters):
+        """
+        One query, numbers of entries of each field value are summed.
+
+        Entries are counted by source url, as entries are filtered, see EntryChoiceForm.
+        Entries created before source_obj relation existed do not have it.
+        """
+        from django.db.models import Count, IntegerField, OuterRef, Subquery
+        from django.db.models.functions import Coalesce
+        from .models import RssSourceDataModel, RssSourceEntryDataModel
+
+        counts = RssSourceEntryDataModel.objects.filter(source = OuterRef('url')).order_by().values('source').annotate(
+                number = Count('id')).values('number')
+
+        sources = RssSourceDataModel.objects.filter(**filters).order_by()
+        rows = sources.annotate(number_of_entries = Coalesce(Subquery(counts, output_field = IntegerField()), 0)).values(
+                *SourceFacets.fields, 'number_of_entries')
+
+        counts = {field : {} for field in SourceFacets.fields}
+        for row in rows:
+            for field in SourceFacets.fields:
+                value = row[field]
+                if value is not None and value.strip() != "":
+                    counts[field][value] = counts[field].get(value, 0) + row['number_of_entries']
+
+        facets = {}
+        for field in SourceFacets.fields:
+            facets[field] = sorted(counts[field].items())
+
+        return facets
+
+    def get_choices(facets, field):
+        """ Returns choices for select widget, 'Any' is the first """
+        choices = [("Any", "Any")]
+        for value, number_of_entries in facets[field]:
+            choices.append((value, "{0} ({1})".format(value, number_of_entries)))
+        return choices
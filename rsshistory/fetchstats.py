@@ -0,0 +1,61 @@
+import time
+from contextlib import contextmanager
+
+
+class FetchStats(object):
+    """
+    Statistics of one fetch of a source: time spent in each stage, transferred bytes, entry counts.
+    """
+
+    stages = ("connect", "download", "parse", "dedupe", "db")
+
+    def __init__(self):
+        self.seconds = {stage : 0.0 for stage in self.stages}
+        self.bytes_transferred = 0
+        self.num_entries = 0
+        self.num_new_entries = 0
+        self.num_duplicate_entries = 0
+        # pages read from PageCache, they are not counted in transfer statistics
+        self.num_cached_pages = 0
+        self.error = None
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - start
+
+    def add_transfer(self, response):
+        """ Adds statistics of HttpResponse, or DownloadResponse """
+        self.seconds["connect"] += response.connect_seconds
+        self.seconds["download"] += response.download_seconds
+        self.bytes_transferred += response.bytes_transferred
+
+    def add_pages(self, pages, seconds):
+        """
+        Adds statistics of Pages downloaded concurrently in the given number of seconds.
+        The time is split into connect and download in proportion to times of responses.
+        """
+        responses = []
+        for page in pages:
+            if page.response:
+                responses.append(page.response)
+            elif page.from_cache:
+                self.num_cached_pages += 1
+
+        connect_seconds = sum(response.connect_seconds for response in responses)
+        download_seconds = sum(response.download_seconds for response in responses)
+
+        if connect_seconds + download_seconds > 0:
+            connect_share = connect_seconds / (connect_seconds + download_seconds)
+        else:
+            connect_share = 0.0
+
+        self.seconds["connect"] += seconds * connect_share
+        self.seconds["download"] += seconds * (1 - connect_share)
+        self.bytes_transferred += sum(response.bytes_transferred for response in responses)
+
+    def get_seconds(self, stage):
+        return self.seconds[stage]
@@ -1,6 +1,7 @@
 from django import forms
 from .models import RssSourceDataModel, RssSourceEntryDataModel, ConfigurationEntry, RssEntryTagsDataModel
 from .converters import SourcesConverter, EntriesConverter
+from .facets import SourceFacets
 
 # https://docs.djangoproject.com/en/4.1/ref/forms/widgets/
 
@@ -65,11 +66,10 @@ class EntryForm(forms.ModelForm):
         language = self.cleaned_data["language"]
         user = self.cleaned_data["user"]
         
+        p = Page(link)
         if not source:
-            p = Page(link)
             source = p.get_domain()
         if not language:
-            p = Page(link)
             language = p.get_language()
 
         if not source:
@@ -123,6 +123,9 @@ class TagEntryForm(forms.ModelForm):
             model = RssEntryTagsDataModel(link = link, author = author, date = date, tag = tag, link_obj = link_objs[0])
             model.save()
 
+        from . import search
+        search.update_links([link])
+
 
 class ImportSourcesForm(forms.Form):
     """
@@ -169,9 +172,10 @@ class SourcesChoiceForm(forms.Form):
     def create(self):
         # how to unpack dynamic forms
         # https://stackoverflow.com/questions/60393884/how-to-pass-choices-dynamically-into-a-django-form
-        categories = self.get_filtered_objects_values('category')
-        subcategories = self.get_filtered_objects_values('subcategory')
-        title = self.get_filtered_objects_values('title')
+        facets = SourceFacets.get(self.get_filter_args())
+        categories = SourceFacets.get_choices(facets, 'category')
+        subcategories = SourceFacets.get_choices(facets, 'subcategory')
+        title = SourceFacets.get_choices(facets, 'title')
 
         # custom javascript code
         # https://stackoverflow.com/questions/10099710/how-to-manually-create-a-select-field-from-a-modelform-in-django
@@ -194,25 +198,6 @@ class SourcesChoiceForm(forms.Form):
         else:
             return "Any"
 
-    def get_filtered_objects_values(self, field):
-        values = set()
-        values.add("Any")
-
-        for val in self.filtered_objects.values(field):
-            if str(val).strip() != "":
-                values.add(val[field])
-
-        dict_values = self.to_dict(values)
-
-        return dict_values
-
-    def to_dict(self, alist):
-        result = []
-        for item in sorted(alist):
-            if item.strip() != "":
-                result.append((item, item))
-        return result
-
     def get_filter_args(self):
         parameter_map = {}
 
@@ -252,35 +237,33 @@ class EntryChoiceForm(forms.Form):
         self.get_sources()
 
     def get_filtered_objects(self):
-        source_parameter_map = self.get_source_filter_args()
-        entry_parameter_map = self.get_entry_filter_args(False)
+        entries = self.get_filtered_entries()
 
-        self.entries = []
+        search = self.args.get("search")
+        if search and search.strip() != "":
+            from .search import filter_entries
+            entries = filter_entries(entries, search)
 
-        if source_parameter_map == {}:
-            return RssSourceEntryDataModel.objects.filter(**entry_parameter_map)
+        return entries
 
-        if self.sources.exists():
-            index = 0
-            for obj in self.sources:
-                entry_parameter_map["source"] = obj.url
+    def get_filtered_entries(self):
+        """ Sources are filtered by subquery, so that it is one query, which can use index on source """
+        source_parameter_map = self.get_source_filter_args()
+        entry_parameter_map = self.get_entry_filter_args(False)
 
-                if index == 0:
-                    self.entries = RssSourceEntryDataModel.objects.filter(**entry_parameter_map)
-                else:
-                    self.entries = self.entries | RssSourceEntryDataModel.objects.filter(**entry_parameter_map)
-                index += 1
-        else:
-            self.entries = RssSourceEntryDataModel.objects.filter(**entry_parameter_map)
+        if source_parameter_map != {}:
+            entry_parameter_map["source__in"] = self.sources.values('url')
 
+        self.entries = RssSourceEntryDataModel.objects.filter(**entry_parameter_map)
         return self.entries
 
     def create(self):
         # how to unpack dynamic forms
         # https://stackoverflow.com/questions/60393884/how-to-pass-choices-dynamically-into-a-django-form
-        categories = self.get_filtered_objects_values('category')
-        subcategories = self.get_filtered_objects_values('subcategory')
-        title = self.get_filtered_objects_values('title')
+        facets = SourceFacets.get(self.get_source_filter_args())
+        categories = SourceFacets.get_choices(facets, 'category')
+        subcategories = SourceFacets.get_choices(facets, 'subcategory')
+        title = SourceFacets.get_choices(facets, 'title')
 
         # custom javascript code
         # https://stackoverflow.com/questions/10099710/how-to-manually-create-a-select-field-from-a-modelform-in-django
@@ -318,19 +301,6 @@ class EntryChoiceForm(forms.Form):
         source_parameter_map = self.get_source_filter_args()
         self.sources = RssSourceDataModel.objects.filter(**source_parameter_map)
 
-    def get_filtered_objects_values(self, field):
-        values = set()
-        values.add("Any")
-
-        if len(self.sources) > 0:
-            for val in self.sources.values(field):
-                if str(val).strip() != "":
-                    values.add(val[field])
-
-        dict_values = self.to_dict(values)
-
-        return dict_values
-
     def get_source_init(self, column):
         filters = self.get_source_filter_args()
         if column in filters:
@@ -338,13 +308,6 @@ class EntryChoiceForm(forms.Form):
         else:
             return "Any"
 
-    def to_dict(self, alist):
-        result = []
-        for item in sorted(alist):
-            if item.strip() != "":
-                result.append((item, item))
-        return result
-
     def get_source_filter_args(self):
         parameter_map = {}
 
@@ -387,8 +350,7 @@ class EntryChoiceForm(forms.Form):
                parameter_map['tag'] = tag
 
         else:
-            if search:
-                parameter_map["title__icontains"] = search
+            # search is done by full text index, see get_filtered_objects
             if language:
                 parameter_map["language__icontains"] = language
             if user:
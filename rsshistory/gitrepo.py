@@ -1,4 +1,3 @@
-from github import Github
 from pathlib import Path
 import subprocess
 
@@ -0,0 +1,115 @@
+import re
+from html.parser import HTMLParser
+
+
+FULL_LINK_PATTERN = re.compile(r"https://[^\s\"'}<>\\()]+")
+
+FEED_TYPES = ("application/rss+xml", "application/atom+xml", "application/feed+json")
+
+
+class HtmlInfo(object):
+    """
+    Data extracted from HTML page.
+    """
+
+    def __init__(self):
+        self.links = []
+        self.title = None
+        self.language = None
+        self.description = None
+        # list of maps with 'link', 'type', 'title' keys
+        self.feeds = []
+
+
+class HtmlInfoParser(HTMLParser):
+    """
+    Extracts links, title, language, description and feeds in one pass over the page.
+
+    Comments, CDATA sections, quoted attribute values and contents of scripts and styles
+    are handled by the standard HTML tokenizer.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs = True)
+        self.info = HtmlInfo()
+        self._links = {}
+        self._title = None
+
+    # only these tags are read, attributes of other tags are not converted
+    tags = ("a", "title", "html", "meta", "link")
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in self.tags:
+            return
+
+        attrs = self.get_attrs(attrs)
+
+        if tag == "a":
+            href = attrs.get("href")
+            if href:
+                href = href.strip()
+                if href != "":
+                    self._links[href] = True
+
+        elif tag == "title":
+            if self.info.title is None and self._title is None:
+                self._title = []
+
+        elif tag == "html":
+            if attrs.get("lang") and not self.info.language:
+                self.info.language = attrs["lang"].strip()
+
+        elif tag == "meta":
+            name = (attrs.get("name") or attrs.get("property") or "").lower()
+            if name in ("description", "og:description") and not self.info.description:
+                self.info.description = attrs.get("content")
+
+        elif tag == "link":
+            rel = (attrs.get("rel") or "").lower().split()
+            link_type = (attrs.get("type") or "").lower()
+            if "alternate" in rel and link_type in FEED_TYPES and attrs.get("href"):
+                self.info.feeds.append({"link" : attrs["href"].strip(),
+                                        "type" : link_type,
+                                        "title" : attrs.get("title")})
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self.finish_title()
+
+    def handle_data(self, data):
+        if self._title is not None:
+            self._title.append(data)
+
+    def get_attrs(self, attrs):
+        """ Returns map of attributes, first value of repeated attribute wins """
+        result = {}
+        for name, value in attrs:
+            if name not in result:
+                result[name] = value if value is not None else ""
+        return result
+
+    def finish_title(self):
+        if self._title is not None:
+            self.info.title = "".join(self._title).strip()
+            self._title = None
+
+    def get_info(self):
+        self.close()
+        self.finish_title()
+        self.info.links = list(self._links.keys())
+        return self.info
+
+
+def parse_html(text):
+    """ Returns HtmlInfo of the text """
+    parser = HtmlInfoParser()
+    if text:
+        parser.feed(text)
+    return parser.get_info()
+
+
+def parse_full_links(text):
+    """ Returns set of all https links which can be found in text, also in scripts """
+    if not text:
+        return set()
+    return set(FULL_LINK_PATTERN.findall(text))
@@ -0,0 +1,234 @@
+import time
+import logging
+import threading
+import zlib
+import http.client
+from urllib.parse import urlparse, urljoin
+
+from . import metrics
+
+
+def get_setting(name, default):
+    try:
+        from django.conf import settings
+        return getattr(settings, name, default)
+    except Exception:
+        return default
+
+
+class HttpResponse(object):
+    def __init__(self, url, status, headers, contents):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.contents = contents
+        # transfer statistics, connect time is 0 if connection was reused
+        self.connect_seconds = 0.0
+        self.download_seconds = 0.0
+        self.bytes_transferred = 0
+
+    def get_charset(self):
+        charset = self.headers.get_content_charset()
+        if charset:
+            return charset
+        return "utf-8"
+
+    def get_text(self):
+        try:
+            return self.contents.decode(self.get_charset(), errors = "replace")
+        except LookupError:
+            return self.contents.decode("utf-8", errors = "replace")
+
+
+class HttpClient(object):
+    """
+    HTTP client shared by the whole process.
+
+    Keeps idle keep-alive connections for each host, so that following requests
+    do not repeat TCP and TLS handshakes. Requests compressed transfer, and limits
+    size of responses.
+    """
+
+    obj = None
+    obj_lock = threading.Lock()
+
+    redirect_codes = (301, 302, 303, 307, 308)
+
+    def __init__(self, connect_timeout = 10, read_timeout = 30, max_size = 10 * 1024 * 1024, max_idle_per_host = 8, max_redirects = 5):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_size = max_size
+        self.max_idle_per_host = max_idle_per_host
+        self.max_redirects = max_redirects
+
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def get_object():
+        with HttpClient.obj_lock:
+            if not HttpClient.obj:
+                HttpClient.obj = HttpClient(
+                        connect_timeout = get_setting("RSSHISTORY_HTTP_CONNECT_TIMEOUT", 10),
+                        read_timeout = get_setting("RSSHISTORY_HTTP_READ_TIMEOUT", 30),
+                        max_size = get_setting("RSSHISTORY_HTTP_MAX_SIZE", 10 * 1024 * 1024))
+        return HttpClient.obj
+
+    def get_default_headers(self):
+        return {'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.11 (KHTML, like Gecko) Chrome/23.0.1271.64 Safari/537.11',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                'Accept-Encoding': 'gzip, deflate',
+                'Accept-Language': 'en-US,en;q=0.8',
+                'Connection': 'keep-alive'}
+
+    def get(self, url, headers = None):
+        """
+        Returns HttpResponse. Redirects are followed.
+        Raises exception if server cannot be reached, or response is too big.
+        """
+        request_headers = self.get_default_headers()
+        if headers:
+            request_headers.update(headers)
+
+        connect_seconds = 0.0
+        download_seconds = 0.0
+        bytes_transferred = 0
+
+        for redirect in range(self.max_redirects + 1):
+            try:
+                response = self.request(url, request_headers)
+            except Exception:
+                metrics.http_responses.inc(status = "error")
+                raise
+
+            metrics.http_responses.inc(status = response.status)
+            connect_seconds += response.connect_seconds
+            download_seconds += response.download_seconds
+            bytes_transferred += response.bytes_transferred
+
+            location = response.headers.get("Location")
+            if response.status not in self.redirect_codes or not location:
+                response.connect_seconds = connect_seconds
+                response.download_seconds = download_seconds
+                response.bytes_transferred = bytes_transferred
+                return response
+
+            url = urljoin(url, location)
+
+        raise IOError("Too many redirects: {0}".format(url))
+
+    def request(self, url, headers):
+        items = urlparse(url)
+        if items.scheme not in ("http", "https"):
+            raise ValueError("Unsupported url: {0}".format(url))
+
+        key = (items.scheme, items.netloc)
+        path = items.path or "/"
+        if items.query:
+            path += "?" + items.query
+
+        conn = self.get_connection(key)
+        reused = conn.sock is not None
+
+        try:
+            return self.send(conn, key, url, path, headers)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+
+        # idle connection was closed by server, try again with a new one
+        conn = self.create_connection(key)
+        try:
+            return self.send(conn, key, url, path, headers)
+        except Exception:
+            conn.close()
+            raise
+
+    def send(self, conn, key, url, path, headers):
+        connect_seconds = 0.0
+        try:
+            if conn.sock is None:
+                # includes name resolution
+                start = time.perf_counter()
+                conn.connect()
+                conn.sock.settimeout(self.read_timeout)
+                connect_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            conn.request("GET", path, headers = headers)
+            handle = conn.getresponse()
+
+            contents = handle.read(self.max_size + 1)
+            download_seconds = time.perf_counter() - start
+            bytes_transferred = len(contents)
+            if len(contents) > self.max_size:
+                raise IOError("Response too big: {0}".format(url))
+
+            contents = self.decode(handle.headers.get("Content-Encoding"), contents, url)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            raise
+        except Exception:
+            conn.close()
+            raise
+
+        if handle.will_close or not handle.isclosed():
+            conn.close()
+        else:
+            self.release_connection(key, conn)
+
+        response = HttpResponse(url, handle.status, handle.headers, contents)
+        response.connect_seconds = connect_seconds
+        response.download_seconds = download_seconds
+        response.bytes_transferred = bytes_transferred
+        return response
+
+    def decode(self, encoding, contents, url):
+        if not encoding:
+            return contents
+
+        encoding = encoding.strip().lower()
+        if encoding == "gzip":
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            # some servers send raw deflate, without zlib header
+            if contents[:1] == b"\x78":
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS)
+            else:
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        else:
+            return contents
+
+        data = decompressor.decompress(contents, self.max_size + 1)
+        if len(data) > self.max_size:
+            raise IOError("Response too big: {0}".format(url))
+        return data
+
+    def create_connection(self, key):
+        scheme, netloc = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout = self.connect_timeout)
+        return http.client.HTTPConnection(netloc, timeout = self.connect_timeout)
+
+    def get_connection(self, key):
+        with self._lock:
+            connections = self._idle.get(key)
+            if connections:
+                return connections.pop()
+
+        return self.create_connection(key)
+
+    def release_connection(self, key, conn):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append(conn)
+                return
+
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            for key in self._idle:
+                for conn in self._idle[key]:
+                    conn.close()
+            self._idle = {}
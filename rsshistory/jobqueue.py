@@ -0,0 +1,237 @@
+import os
+import socket
+import logging
+from datetime import timedelta
+
+from .threads import ThreadJobQueue
+from .dateutils import DateUtils
+
+
+class DbJobQueue(ThreadJobQueue):
+    """
+    Work queue stored in the database, in BackgroundJob table, so that it survives restarts.
+
+    Workers lease jobs for lease_seconds. Job which lease has expired, because worker died,
+    is available again. Failed jobs are retried at time given by retry_policy, after max_attempts
+    they are moved to dead state. Dead job is not queued again until it is removed, see remove_dead,
+    or until it is added with high priority.
+
+    Items are model objects. Only their id is stored, item is read from model when leased,
+    together with select_related relations.
+    """
+
+    lease_seconds = 30 * 60
+    max_attempts = 5
+    dead_retention_days = 7
+
+    def __init__(self, job_name, model, retry_policy = None, select_related = ()):
+        """ retry_policy is a function (item, attempts) -> date of next attempt, by default job is retried at once """
+        super().__init__()
+        self.job_name = job_name
+        self.model = model
+        self.retry_policy = retry_policy
+        self.select_related = tuple(select_related)
+        self.owner = "{0}:{1}".format(socket.gethostname(), os.getpid())
+        self._leased = {}
+
+    def get_objects(self):
+        if self.select_related:
+            return self.model.objects.select_related(*self.select_related)
+        return self.model.objects.all()
+
+    def get_jobs(self):
+        from .models import BackgroundJob
+        return BackgroundJob.objects.filter(job = self.job_name)
+
+    def get_active_jobs(self):
+        from .models import BackgroundJob
+        return self.get_jobs().filter(status__in = [BackgroundJob.STATUS_PENDING, BackgroundJob.STATUS_LEASED])
+
+    def put(self, item, priority = ThreadJobQueue.PRIORITY_NORMAL):
+        self.put_many([item], priority)
+
+    def put_many(self, items, priority = ThreadJobQueue.PRIORITY_NORMAL):
+        """ Adds items with a constant number of queries """
+        from .models import BackgroundJob
+
+        if len(items) == 0:
+            return
+
+        now = DateUtils.get_datetime_now_utc()
+
+        jobs = []
+        for item in items:
+            key = str(self.get_key(item))
+            jobs.append(BackgroundJob(job = self.job_name, key = key, key_hash = BackgroundJob.get_key_hash(self.job_name, key),
+                    priority = priority, date_created = now, date_available = now))
+
+        # unique key hash, existing jobs are not added again, also if other process adds them at the same time
+        BackgroundJob.objects.bulk_create(jobs, ignore_conflicts = True)
+
+        existing = BackgroundJob.objects.filter(key_hash__in = [job.key_hash for job in jobs])
+
+        if priority > ThreadJobQueue.PRIORITY_NORMAL:
+            # dead object is queued again only by user
+            existing.filter(status = BackgroundJob.STATUS_DEAD).update(
+                    status = BackgroundJob.STATUS_PENDING, priority = priority, attempts = 0,
+                    date_created = now, date_available = now, date_dead = None)
+
+        # job is already waiting, or being processed. Waiting job with higher priority is not delayed
+        existing.filter(status = BackgroundJob.STATUS_PENDING, priority__lt = priority).update(
+                priority = priority, date_available = now)
+
+    def get_available_jobs(self):
+        from django.db.models import Q
+        from .models import BackgroundJob
+
+        now = DateUtils.get_datetime_now_utc()
+
+        pending = Q(status = BackgroundJob.STATUS_PENDING, date_available__lte = now)
+        expired = Q(status = BackgroundJob.STATUS_LEASED, lease_until__lt = now)
+
+        return self.get_jobs().filter(pending | expired).order_by('-priority', 'date_created')
+
+    def lease(self):
+        """ Returns leased job, or None. Other workers, or processes cannot lease the same job """
+        from .models import BackgroundJob
+
+        for job in self.get_available_jobs()[:10]:
+            now = DateUtils.get_datetime_now_utc()
+            lease_until = now + timedelta(seconds = self.lease_seconds)
+            current = BackgroundJob.objects.filter(id = job.id, status = job.status, lease_until = job.lease_until)
+
+            attempts = job.attempts
+            if job.status == BackgroundJob.STATUS_LEASED:
+                # previous worker did not finish, count it as an attempt
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    if current.update(status = BackgroundJob.STATUS_DEAD, attempts = attempts, lease_until = None,
+                            lease_owner = None, date_dead = now, last_error = "Lease expired") == 1:
+                        self.log_dead(job, attempts, "lease expired")
+                    continue
+
+            updated = current.update(
+                    status = BackgroundJob.STATUS_LEASED,
+                    lease_until = lease_until,
+                    lease_owner = self.owner,
+                    attempts = attempts)
+
+            if updated == 1:
+                job.attempts = attempts
+                return job
+
+    def log_dead(self, job, attempts, error):
+        from .models import PersistentInfo
+        PersistentInfo.error("Job {0} {1} failed {2} times, moved to dead jobs: {3}".format(job.job, job.key, attempts, error))
+
+    def get(self):
+        while True:
+            job = self.lease()
+            if job is None:
+                return None
+
+            item = self.get_objects().filter(id = job.key).first()
+            if item is None:
+                # object was removed in the meantime
+                job.delete()
+                continue
+
+            with self._lock:
+                self._leased[job.key] = job.id
+            return item
+
+    def pop_leased(self, item):
+        with self._lock:
+            return self._leased.pop(str(self.get_key(item)), None)
+
+    def done(self, item):
+        from .models import BackgroundJob
+
+        job_id = self.pop_leased(item)
+        if job_id is not None:
+            BackgroundJob.objects.filter(id = job_id).delete()
+
+        super().done(item)
+
+    def failed(self, item, error):
+        from .models import BackgroundJob
+
+        job_id = self.pop_leased(item)
+        job = BackgroundJob.objects.filter(id = job_id).first()
+        if job:
+            now = DateUtils.get_datetime_now_utc()
+
+            job.attempts += 1
+            job.last_error = str(error)[:2000]
+            job.lease_until = None
+            job.lease_owner = None
+
+            if job.attempts >= self.max_attempts:
+                job.status = BackgroundJob.STATUS_DEAD
+                job.date_dead = now
+                self.log_dead(job, job.attempts, str(error))
+            else:
+                job.status = BackgroundJob.STATUS_PENDING
+                job.date_available = self.get_retry_date(item, job.attempts)
+
+            job.save()
+
+        super().failed(item, error)
+
+    def release(self, item):
+        """ Job is available again, without counting an attempt. Called when worker stops """
+        job_id = self.pop_leased(item)
+        if job_id is not None:
+            self.release_jobs([job_id])
+
+    def release_leased(self):
+        """ Releases jobs leased by this queue object, which were not finished. Returns their number """
+        with self._lock:
+            job_ids = list(self._leased.values())
+            self._leased = {}
+
+        return self.release_jobs(job_ids)
+
+    def release_jobs(self, job_ids):
+        from .models import BackgroundJob
+
+        return BackgroundJob.objects.filter(id__in = job_ids, status = BackgroundJob.STATUS_LEASED).update(
+                status = BackgroundJob.STATUS_PENDING, lease_until = None, lease_owner = None,
+                date_available = DateUtils.get_datetime_now_utc())
+
+    def get_retry_date(self, item, attempts):
+        if self.retry_policy:
+            return self.retry_policy(item, attempts)
+        return DateUtils.get_datetime_now_utc()
+
+    def remove_dead(self):
+        """ Removes jobs which are dead for dead_retention_days. Returns number of removed jobs """
+        from .models import BackgroundJob
+
+        date_before = DateUtils.get_datetime_now_utc() - timedelta(days = self.dead_retention_days)
+        deleted, details = self.get_jobs().filter(status = BackgroundJob.STATUS_DEAD, date_dead__lt = date_before).delete()
+        return deleted
+
+    def peek(self):
+        job = self.get_available_jobs().first()
+        if job:
+            return self.get_objects().filter(id = job.key).first()
+
+    def get_items(self):
+        keys = self.get_active_jobs().order_by('-priority', 'date_created').values_list('key', flat=True)
+        return list(self.get_objects().filter(id__in = list(keys)))
+
+    def size(self):
+        return self.get_active_jobs().count()
+
+    def get_dead_count(self):
+        from .models import BackgroundJob
+        return self.get_jobs().filter(status = BackgroundJob.STATUS_DEAD).count()
+
+    def get_oldest_age(self):
+        job = self.get_active_jobs().order_by('date_created').first()
+        if job is None:
+            return 0
+
+        age = DateUtils.get_datetime_now_utc() - job.date_created
+        return age.total_seconds()
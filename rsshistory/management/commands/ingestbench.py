@@ -0,0 +1,56 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...apps import CatalogConfig
+from ...prjconfig import Configuration
+from ...benchmarks.feedserver import FeedServerConfig
+from ...benchmarks.ingestbench import IngestBenchmark
+
+
+class Command(BaseCommand):
+    help = "Measures ingest throughput with synthetic feeds from a local server, in a separate test database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sources", type = int, default = 100, help = "number of sources")
+        parser.add_argument("--type", choices = ["rss", "atom", "parsing"], default = "rss", help = "type of sources")
+        parser.add_argument("--workers", type = int, default = 4, help = "number of sources processed in parallel")
+        parser.add_argument("--rounds", type = int, default = 2, help = "number of times sources are processed")
+        parser.add_argument("--entries", type = int, default = 50, help = "entries in a feed, or links on a page")
+        parser.add_argument("--size", type = int, default = 500, help = "size of entry description")
+        parser.add_argument("--latency", type = float, default = 0.0, help = "response delay of server in seconds")
+        parser.add_argument("--error-rate", type = float, default = 0.0, help = "part of failing requests")
+        parser.add_argument("--verbose", action = "store_true", help = "show output of processing")
+
+    def handle(self, *args, **options):
+        server_config = FeedServerConfig(entries_per_feed = options["entries"],
+                                         description_size = options["size"],
+                                         latency = options["latency"],
+                                         error_rate = options["error_rate"],
+                                         links_per_page = options["entries"])
+
+        # workers in threads cannot share in-memory sqlite database
+        db_file = None
+        if connection.vendor == "sqlite":
+            db_file = tempfile.NamedTemporaryFile(suffix = ".sqlite3", delete = False)
+            db_file.close()
+            connection.settings_dict.setdefault("TEST", {})["NAME"] = db_file.name
+
+        old_name = connection.creation.create_test_db(verbosity = 0, autoclobber = True)
+        try:
+            benchmark = IngestBenchmark(Configuration.get_object(CatalogConfig.name),
+                                        num_sources = options["sources"],
+                                        feed_type = options["type"],
+                                        workers = options["workers"],
+                                        rounds = options["rounds"],
+                                        server_config = server_config,
+                                        verbose = options["verbose"])
+
+            for round_index, result in enumerate(benchmark.run()):
+                self.stdout.write(benchmark.format_result(round_index, result))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity = 0)
+            if db_file:
+                os.unlink(db_file.name)
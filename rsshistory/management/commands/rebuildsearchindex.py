@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ...search import SearchBackend
+
+
+class Command(BaseCommand):
+    help = "Indexes all entries for full text search"
+
+    def handle(self, *args, **options):
+        if not SearchBackend.create_index(connection):
+            self.stdout.write("Database does not support full text index, search uses icontains")
+            return
+
+        backend = SearchBackend.get_object()
+        count = backend.rebuild()
+        self.stdout.write("Indexed entries: {0}".format(count))
@@ -0,0 +1,54 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from ...apps import CatalogConfig
+from ...prjconfig import Configuration
+from ... import metrics
+
+
+class Command(BaseCommand):
+    help = "Runs source fetch workers. Scheduler runs in only one worker process, on any host"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type = int, default = None, help = "number of fetch threads, RSSHISTORY_FETCH_WORKERS by default")
+        parser.add_argument("--no-scheduler", action = "store_true", help = "only process queued sources, do not schedule fetches")
+        parser.add_argument("--metrics-port", type = int, default = None, help = "serve metrics of the worker on this port")
+        parser.add_argument("--stop-timeout", type = int, default = 30, help = "seconds for which sources being processed are awaited on stop")
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def stop(signum, frame):
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        from ...models import PersistentInfo, RssSourceOperationalData
+        PersistentInfo.cleanup()
+        PersistentInfo.create("Worker ready: {0}".format(CatalogConfig.name))
+
+        updated = RssSourceOperationalData.backfill_sources()
+        if updated:
+            self.stdout.write("Operational data linked to sources: {0}".format(updated))
+
+        c = Configuration.get_object(CatalogConfig.name)
+        c.start_threads(options["workers"], scheduler = not options["no_scheduler"])
+
+        metrics_server = None
+        if options["metrics_port"]:
+            metrics_server = metrics.MetricsServer(options["metrics_port"], before_render = c.update_metrics,
+                                                   groups = (metrics.FETCHER, metrics.QUEUE)).start()
+
+        self.stdout.write("Worker started, threads: {0}".format(len(c.get_threads())))
+
+        try:
+            while not stop_event.is_set():
+                stop_event.wait(1)
+        finally:
+            self.stdout.write("Stopping worker")
+            if metrics_server:
+                metrics_server.stop()
+            c.close(options["stop_timeout"])
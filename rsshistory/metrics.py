@@ -0,0 +1,256 @@
+"""
+In-process metrics, exported in Prometheus text format.
+
+Values are kept in memory of the process, updating them costs one lock acquisition.
+Metrics belong to groups, a process exports only groups which it updates: web processes
+do not fetch, so fetcher metrics are served only by the worker process.
+"""
+import threading
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{0}="{1}"'.format(name, escape_label(value)) for name, value in labels) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric(object):
+    metric_type = "untyped"
+
+    def __init__(self, name, help_text, labelnames = (), group = None):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.group = group
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get_key(self, labels):
+        if set(labels.keys()) != set(self.labelnames):
+            raise ValueError("Metric {0} expects labels {1}".format(self.name, self.labelnames))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def get_value(self, **labels):
+        with self._lock:
+            return self._values.get(self.get_key(labels), 0)
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+    def get_samples(self):
+        """ Returns list of (suffix, labels, value) """
+        with self._lock:
+            items = list(self._values.items())
+
+        return [("", list(zip(self.labelnames, key)), value) for key, value in items]
+
+    def render(self):
+        lines = ["# HELP {0} {1}".format(self.name, self.help_text),
+                 "# TYPE {0} {1}".format(self.name, self.metric_type)]
+
+        for suffix, labels, value in self.get_samples():
+            lines.append("{0}{1}{2} {3}".format(self.name, suffix, format_labels(labels), format_value(value)))
+
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def inc(self, amount = 1, **labels):
+        key = self.get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def set(self, value, **labels):
+        key = self.get_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self, name, help_text, labelnames = (), buckets = None, group = None):
+        super().__init__(name, help_text, labelnames, group)
+        self.buckets = tuple(sorted(buckets if buckets else self.default_buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self.get_key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = {"buckets" : [0] * len(self.buckets), "sum" : 0.0, "count" : 0}
+                self._values[key] = data
+
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data["buckets"][index] += 1
+                    break
+
+            data["sum"] += value
+            data["count"] += 1
+
+    def get_value(self, **labels):
+        """ Returns number of observations """
+        with self._lock:
+            data = self._values.get(self.get_key(labels))
+            return data["count"] if data else 0
+
+    def get_samples(self):
+        with self._lock:
+            items = [(key, list(data["buckets"]), data["sum"], data["count"]) for key, data in self._values.items()]
+
+        samples = []
+        for key, buckets, total, count in items:
+            labels = list(zip(self.labelnames, key))
+
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, buckets):
+                cumulative += bucket_count
+                samples.append(("_bucket", labels + [("le", format_value(bound))], cumulative))
+
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, count))
+        return samples
+
+
+class MetricsRegistry(object):
+    obj = None
+    obj_lock = threading.Lock()
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def get_object():
+        with MetricsRegistry.obj_lock:
+            if not MetricsRegistry.obj:
+                MetricsRegistry.obj = MetricsRegistry()
+        return MetricsRegistry.obj
+
+    def register(self, metric):
+        """ Returns metric registered with the same name, if there is one """
+        with self._lock:
+            if metric.name not in self._metrics:
+                self._metrics[metric.name] = metric
+            return self._metrics[metric.name]
+
+    def render(self, groups = None):
+        """ Renders metrics of the given groups, or all metrics """
+        with self._lock:
+            metrics = [metric for metric in self._metrics.values() if groups is None or metric.group in groups]
+
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+class MetricsServer(object):
+    """
+    Serves metrics of a process without web server, for example of worker process.
+    before_render is called before each read, to update gauges.
+    """
+
+    def __init__(self, port, host = "", before_render = None, groups = None):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.before_render = before_render
+        self.groups = groups
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target = self.httpd.serve_forever, daemon = True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle(self, handler):
+        try:
+            if self.before_render:
+                self.before_render()
+            data = MetricsRegistry.get_object().render(self.groups).encode("utf-8")
+            status = 200
+        except Exception as E:
+            data = str(E).encode("utf-8")
+            status = 500
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+def counter(name, help_text, labelnames = (), group = None):
+    return MetricsRegistry.get_object().register(Counter(name, help_text, labelnames, group))
+
+
+def gauge(name, help_text, labelnames = (), group = None):
+    return MetricsRegistry.get_object().register(Gauge(name, help_text, labelnames, group))
+
+
+def histogram(name, help_text, labelnames = (), buckets = None, group = None):
+    return MetricsRegistry.get_object().register(Histogram(name, help_text, labelnames, buckets, group))
+
+
+FETCHER = "fetcher"
+QUEUE = "queue"
+WEB = "web"
+
+# fetcher, kept by worker process
+sources_processed = counter("rsshistory_sources_processed_total", "Number of processed sources", ("result",), group = FETCHER)
+fetch_seconds = histogram("rsshistory_fetch_seconds", "Time of processing a source, for each stage", ("stage",), group = FETCHER)
+http_responses = counter("rsshistory_http_responses_total", "Number of HTTP responses by status, 'error' if there was no response", ("status",), group = FETCHER)
+entries_inserted = counter("rsshistory_entries_inserted_total", "Number of entries inserted by fetcher", group = FETCHER)
+
+worker_alive = gauge("rsshistory_worker_alive", "1 if worker thread is running", ("worker",), group = FETCHER)
+worker_busy = gauge("rsshistory_worker_busy", "1 if worker thread processes an item", ("worker",), group = FETCHER)
+worker_processed = gauge("rsshistory_worker_processed", "Number of items processed by worker thread", ("worker",), group = FETCHER)
+worker_idle_seconds = gauge("rsshistory_worker_seconds_since_active", "Time since worker thread loop was last active", ("worker",), group = FETCHER)
+
+page_cache_hits = gauge("rsshistory_page_cache_hits", "Number of page cache hits", group = FETCHER)
+page_cache_misses = gauge("rsshistory_page_cache_misses", "Number of page cache misses", group = FETCHER)
+
+# queue, read from database by any process
+source_queue_depth = gauge("rsshistory_source_queue_depth", "Number of sources waiting in queue, or being processed", group = QUEUE)
+source_queue_dead = gauge("rsshistory_source_queue_dead", "Number of sources which failed too many times", group = QUEUE)
+source_queue_oldest_seconds = gauge("rsshistory_source_queue_oldest_seconds", "Age of the oldest source in queue", group = QUEUE)
+scheduler_heartbeat_age_seconds = gauge("rsshistory_scheduler_heartbeat_age_seconds", "Time since scheduler process refreshed its lock", group = QUEUE)
+
+# web, kept by each web process
+http_requests = counter("rsshistory_http_requests_total", "Number of handled web requests", ("status",), group = WEB)
+request_seconds = histogram("rsshistory_request_seconds", "Time of handling web request", group = WEB)
+request_db_seconds = histogram("rsshistory_request_db_seconds", "Database time of web request", group = WEB)
+request_db_queries = histogram("rsshistory_request_db_queries", "Number of database queries of web request", buckets = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000), group = WEB)
@@ -0,0 +1,45 @@
+import time
+
+from django.db import connection
+
+from . import metrics
+
+
+class QueryTimer(object):
+    """ Database execute wrapper, measures time of queries of one request """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+class MetricsMiddleware(object):
+    """
+    Records time of web requests, and time spent in database.
+    Enabled by adding 'rsshistory.middleware.MetricsMiddleware' to MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+
+        metrics.request_seconds.observe(time.perf_counter() - start)
+        metrics.request_db_seconds.observe(timer.seconds)
+        metrics.request_db_queries.observe(timer.queries)
+        metrics.http_requests.inc(status = response.status_code)
+
+        return response
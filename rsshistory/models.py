@@ -46,9 +46,31 @@ class RssSourceDataModel(models.Model):
            return False
 
     def get_op_data(self):
-        objs = RssSourceOperationalData.objects.filter(url = self.url)
-        if objs.exists():
-            return objs[0]
+        """ Operational data are cached in the object, use select_related('operational_data') for lists """
+        try:
+            return self.operational_data
+        except RssSourceOperationalData.DoesNotExist:
+            pass
+
+        # data created before relation existed, they are looked for once for object
+        if getattr(self, "_op_data_missing", False):
+            return None
+
+        obj = RssSourceOperationalData.objects.filter(url = self.url, source_obj = None).first()
+        if obj:
+            obj.source_obj = self
+            obj.save(update_fields = ['source_obj'])
+            self.operational_data = obj
+            return obj
+
+        self._op_data_missing = True
+
+    def get_or_create_op_data(self):
+        obj = self.get_op_data()
+        if not obj:
+            obj = RssSourceOperationalData(url = self.url, source_obj = self)
+            self.operational_data = obj
+        return obj
 
     def get_date_fetched(self):
         obj = self.get_op_data()
@@ -65,19 +87,80 @@ class RssSourceDataModel(models.Model):
         if obj:
             return obj.number_of_entries
 
-    def set_operational_info(self, date_fetched, number_of_entries, import_seconds):
+    def get_number_of_new_entries(self):
         obj = self.get_op_data()
         if obj:
+            return obj.number_of_new_entries
+
+    def set_fetch_stats(self, date_fetched, import_seconds, stats):
+        """ Stores FetchStats of the last fetch """
+        obj = self.get_or_create_op_data()
+
+        if not stats.error:
             obj.date_fetched = date_fetched
-            obj.import_seconds = import_seconds
-            obj.number_of_entries = number_of_entries
-            obj.save()
-        else:
-            op = RssSourceOperationalData(url = self.url,
-                    date_fetched = date_fetched,
-                    import_seconds = import_seconds,
-                    number_of_entries = number_of_entries)
-            op.save()
+
+        obj.import_seconds = import_seconds
+        obj.number_of_entries = stats.num_entries
+        obj.number_of_new_entries = stats.num_new_entries
+        obj.number_of_duplicate_entries = stats.num_duplicate_entries
+        obj.connect_seconds = stats.get_seconds("connect")
+        obj.download_seconds = stats.get_seconds("download")
+        obj.parse_seconds = stats.get_seconds("parse")
+        obj.dedupe_seconds = stats.get_seconds("dedupe")
+        obj.db_seconds = stats.get_seconds("db")
+        obj.bytes_transferred = stats.bytes_transferred
+        obj.number_of_cached_pages = stats.num_cached_pages
+        obj.last_error = stats.error[:1000] if stats.error else None
+        obj.save()
+
+    def get_date_next_fetch(self):
+        obj = self.get_op_data()
+        if obj:
+            return obj.date_next_fetch
+
+    def get_fetch_interval(self):
+        obj = self.get_op_data()
+        if obj:
+            return obj.fetch_interval
+
+    def get_consecutive_errors(self):
+        obj = self.get_op_data()
+        if obj:
+            return obj.consecutive_errors
+        return 0
+
+    def set_schedule(self, date_next_fetch, fetch_interval, consecutive_errors):
+        obj = self.get_or_create_op_data()
+
+        obj.date_next_fetch = date_next_fetch
+        obj.fetch_interval = fetch_interval
+        obj.consecutive_errors = consecutive_errors
+        obj.save()
+
+    def get_conditional_headers(self):
+        """ Headers for conditional GET, so that unchanged feed is not transferred """
+        headers = {}
+        obj = self.get_op_data()
+        if obj:
+            if obj.etag:
+                headers['If-None-Match'] = obj.etag
+            if obj.last_modified:
+                headers['If-Modified-Since'] = obj.last_modified
+        return headers
+
+    def get_body_hash(self):
+        obj = self.get_op_data()
+        if obj:
+            return obj.body_hash
+
+    def set_fetch_cache_info(self, date_fetched, etag, last_modified, body_hash):
+        obj = self.get_or_create_op_data()
+
+        obj.date_fetched = date_fetched
+        obj.etag = etag
+        obj.last_modified = last_modified
+        obj.body_hash = body_hash
+        obj.save()
 
     def get_favicon(self):
        if self.favicon:
@@ -97,9 +180,37 @@ class RssSourceDataModel(models.Model):
 class RssSourceOperationalData(models.Model):
 
     url = models.CharField(max_length=2000, unique=True)
+    source_obj = models.OneToOneField(RssSourceDataModel, on_delete=models.CASCADE, related_name='operational_data', null=True, blank=True)
     date_fetched = models.DateTimeField(null = True)
     import_seconds = models.IntegerField(null = True)
     number_of_entries = models.IntegerField(null = True)
+    number_of_new_entries = models.IntegerField(null = True)
+    # conditional GET data
+    etag = models.CharField(max_length=1000, null = True)
+    last_modified = models.CharField(max_length=1000, null = True)
+    body_hash = models.CharField(max_length=64, null = True)
+    # scheduling data, interval is in minutes
+    date_next_fetch = models.DateTimeField(null = True)
+    fetch_interval = models.IntegerField(null = True)
+    consecutive_errors = models.IntegerField(default = 0)
+    # statistics of the last fetch, also failed one
+    connect_seconds = models.FloatField(null = True)
+    download_seconds = models.FloatField(null = True)
+    parse_seconds = models.FloatField(null = True)
+    dedupe_seconds = models.FloatField(null = True)
+    db_seconds = models.FloatField(null = True)
+    bytes_transferred = models.IntegerField(null = True)
+    # pages of parsing source read from page cache
+    number_of_cached_pages = models.IntegerField(null = True)
+    number_of_duplicate_entries = models.IntegerField(null = True)
+    last_error = models.CharField(max_length=1000, null = True)
+
+    def backfill_sources():
+        """ Sets source of data created before relation existed. Returns number of updated rows """
+        from django.db.models import OuterRef, Subquery
+
+        sources = RssSourceDataModel.objects.filter(url = OuterRef('url')).values('id')[:1]
+        return RssSourceOperationalData.objects.filter(source_obj = None).update(source_obj = Subquery(sources))
 
 
 class RssSourceEntryDataModel(models.Model):
@@ -123,11 +234,28 @@ class RssSourceEntryDataModel(models.Model):
 
     class Meta:
         ordering = ['-date_published', 'source', 'title']
+        indexes = [
+            # entries of a source in a time range: daily files, scheduler, removal of old entries
+            models.Index(fields=['source', 'date_published']),
+            # highlights
+            models.Index(fields=['persistent', 'date_published']),
+            # list ordering, entries of all sources in a time range
+            models.Index(fields=['-date_published']),
+        ]
 
     def get_absolute_url(self):
         """Returns the URL to access a particular author instance."""
         return reverse('rsshistory:entry-detail', args=[str(self.id)])
 
+    def delete(self, *args, **kwargs):
+        """ Querysets of entries are deleted by search.delete_entries """
+        from . import search
+
+        entry_id = self.id
+        result = super().delete(*args, **kwargs)
+        search.remove_entries([entry_id])
+        return result
+
     def get_source_name(self):
         if self.source_obj:
             return self.source_obj.title
@@ -135,8 +263,38 @@ class RssSourceEntryDataModel(models.Model):
             return self.source
 
     def get_tag_string(self):
+        if hasattr(self, "_tag_string"):
+            return self._tag_string
         return RssEntryTagsDataModel.get_tag_string(self.link)
 
+    def prepare_list(entries):
+        """
+        Loads tags of all entries with one query, and computes favicons once for each source.
+        Entries should be loaded with select_related('source_obj').
+        """
+        entries = list(entries)
+
+        tags = {}
+        tag_objs = RssEntryTagsDataModel.objects.filter(link__in = [entry.link for entry in entries]).order_by('id')
+        for link, tag in tag_objs.values_list('link', 'tag'):
+            tags.setdefault(link, []).append(tag)
+
+        favicons = {}
+        for entry in entries:
+            if entry.link in tags:
+                entry._tag_string = RssEntryTagsDataModel.get_delim().join(tags[entry.link])
+            else:
+                entry._tag_string = None
+
+            if entry.source_obj_id is None:
+                entry._favicon = entry.get_favicon()
+            else:
+                if entry.source_obj_id not in favicons:
+                    favicons[entry.source_obj_id] = entry.source_obj.get_favicon()
+                entry._favicon = favicons[entry.source_obj_id]
+
+        return entries
+
     def get_tag_map(self):
         result = []
         tags = RssEntryTagsDataModel.objects.filter(link = self.link)
@@ -164,6 +322,9 @@ class RssSourceEntryDataModel(models.Model):
                     self.save()
 
     def get_favicon(self):
+        if getattr(self, "_favicon", None):
+            return self._favicon
+
         if self.source_obj:
             return self.source_obj.get_favicon()
 
@@ -253,6 +414,59 @@ class ConfigurationEntry(models.Model):
             return False
 
 
+class BackgroundJob(models.Model):
+    """
+    Job waiting for processing by a thread.
+    """
+    STATUS_PENDING = 0
+    STATUS_LEASED = 1
+    STATUS_DEAD = 2
+
+    # name of thread which processes the job, for example 'process-source'
+    job = models.CharField(max_length=100)
+    # identifies object of the job
+    key = models.CharField(max_length=1000)
+    # hash of job and key, one job for an object, also if many processes add it at the same time.
+    # Index of long text columns would be too long for some databases
+    key_hash = models.CharField(max_length=64, unique=True)
+    priority = models.IntegerField(default = 0)
+    status = models.IntegerField(default = STATUS_PENDING)
+    attempts = models.IntegerField(default = 0)
+    date_created = models.DateTimeField(default = datetime.now)
+    # job will not be processed before that time, used for retries
+    date_available = models.DateTimeField(default = datetime.now)
+    lease_until = models.DateTimeField(null = True)
+    lease_owner = models.CharField(max_length=1000, null = True)
+    last_error = models.CharField(max_length=2000, null = True)
+    # dead jobs are removed after some time, then the object can be queued again
+    date_dead = models.DateTimeField(null = True)
+
+    class Meta:
+        ordering = ['-priority', 'date_created']
+        indexes = [
+            models.Index(fields=['job', 'status', 'date_available']),
+        ]
+
+    def get_key_hash(job, key):
+        import hashlib
+        return hashlib.sha256("{0}\n{1}".format(job, key).encode("utf-8")).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.key_hash = BackgroundJob.get_key_hash(self.job, self.key)
+        super().save(*args, **kwargs)
+
+
+class ProcessLock(models.Model):
+    """
+    Lock shared by processes and hosts through the database, for example for the scheduler.
+    Lock is held until lock_until, owner has to refresh it.
+    """
+    name = models.CharField(max_length=1000, unique=True)
+    owner = models.CharField(max_length=1000, null = True)
+    lock_until = models.DateTimeField(null = True)
+    date_heartbeat = models.DateTimeField(null = True)
+
+
 from pytz import timezone
 
 class PersistentInfo(models.Model):
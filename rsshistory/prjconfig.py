@@ -15,6 +15,12 @@ from .dateutils import DateUtils
 from .prjgitrepo import *
 from .models import PersistentInfo
 from .sources.basepluginbuilder import BasePluginBuilder
+from .scheduler import SourceScheduler
+from .jobqueue import DbJobQueue
+from .dblock import DbLock
+from .rssarchive import RssArchive
+from .fetchstats import FetchStats
+from . import metrics
 
 
 __version__ = "0.4.0"
@@ -22,6 +28,8 @@ __version__ = "0.4.0"
 
 class Configuration(object):
    obj = None
+   # gauges of queue are counted in database, scrapes in between reuse them
+   queue_metrics_seconds = 30
 
    def __init__(self, app_name):
        self.app_name = str(app_name)
@@ -30,8 +38,26 @@ class Configuration(object):
        self.version = __version__
        self.server_log_file = self.directory / "log_{0}.txt".format(app_name)
 
-       self.enable_logging()
-       self.create_threads()
+       self.scheduler = SourceScheduler()
+       self.scheduler_lock = DbLock("scheduler")
+       self.rss_archive = None
+       self.last_maintenance = None
+       self.last_archive_prune = None
+       self.last_queue_metrics = None
+
+       from .models import RssSourceDataModel
+
+       # all source workers, also in other processes, consume the same queue
+       self.source_queue = DbJobQueue("process-source", RssSourceDataModel, self.scheduler.get_retry_date, ['operational_data'])
+       # threads are started only by worker process, see start_threads
+       self.threads = []
+       # sources which are crawled, they are processed by own thread, not by fetch workers.
+       # Job stays leased while source is crawled, so it is not queued again, and it is retried after restart
+       self.crawl_queue = DbJobQueue("crawl-source", RssSourceDataModel, self.scheduler.get_retry_date, ['operational_data'])
+
+       import threading
+       # each fetch worker keeps own downloader, with its event loop and thread pool
+       self.thread_data = threading.local()
 
    def get_object(app_name):
        app_name = str(app_name)
@@ -86,26 +112,146 @@ class Configuration(object):
    def get_data_path(self):
        return self.directory / 'data' / self.app_name
 
-   def create_threads(self):
-       download_rss = ThreadJobCommon("process-source")
-       refresh_thread = ThreadJobCommon("refresh-thread", 3600, True) #3600 is 1 hour
+   def get_rss_archive(self):
+       if not self.rss_archive:
+           self.rss_archive = RssArchive(self.get_export_path() / "downloaded_rss")
+       return self.rss_archive
+
+   def prune_rss_archive(self):
+       """ Removes archived feeds older than RSSHISTORY_RSS_ARCHIVE_DAYS, once a day """
+       from django.conf import settings
+
+       days = int(getattr(settings, "RSSHISTORY_RSS_ARCHIVE_DAYS", 365))
+       now = DateUtils.get_datetime_now_utc()
+       if days <= 0 or (self.last_archive_prune and now - self.last_archive_prune < timedelta(days = 1)):
+           return
+       self.last_archive_prune = now
+
+       removed = self.get_rss_archive().prune(now - timedelta(days = days))
+       if removed:
+           PersistentInfo.create("Removed old archived feeds: {0}".format(removed))
+
+   def get_number_of_fetch_workers(self):
+       from django.conf import settings
+       workers = getattr(settings, "RSSHISTORY_FETCH_WORKERS", 4)
+       return max(1, int(workers))
+
+   def get_fetch_batch_size(self):
+       from django.conf import settings
+       batch_size = getattr(settings, "RSSHISTORY_FETCH_BATCH_SIZE", 10)
+       return max(1, int(batch_size))
+
+   def get_downloader(self):
+       """
+       Returns downloader of calling thread. Limits apply to one batch of one worker,
+       at most fetch workers * batch size feeds are downloaded at once.
+       """
+       downloader = getattr(self.thread_data, "downloader", None)
+       if downloader is None:
+          from django.conf import settings
+          from .downloader import AsyncDownloader
+          max_connections = getattr(settings, "RSSHISTORY_DOWNLOAD_CONNECTIONS", 100)
+          max_per_host = getattr(settings, "RSSHISTORY_DOWNLOAD_PER_HOST", 4)
+          downloader = AsyncDownloader(max_connections, max_per_host)
+          self.thread_data.downloader = downloader
+       return downloader
+
+   def start_threads(self, workers = None, scheduler = True):
+       """
+       Starts fetch workers. Called by worker process, web processes do not fetch.
+       Scheduler runs only in process which holds scheduler lock.
+       """
+       self.enable_logging()
 
-       self.threads = [
-               download_rss,
-               refresh_thread
-               ]
+       if workers is None:
+           workers = self.get_number_of_fetch_workers()
 
-       for athread in self.threads:
+       threads = []
+       for worker_id in range(workers):
+           threads.append(ThreadJobCommon("process-source", queue = self.source_queue, worker_id = worker_id,
+                                          batch_size = self.get_fetch_batch_size()))
+       threads.append(ThreadJobCommon("crawl-source", queue = self.crawl_queue))
+
+       if scheduler:
+           threads.append(ThreadJobCommon("scheduler-lock", DbLock.timeout_seconds / 4, True))
+           threads.append(ThreadJobCommon("refresh-thread", 60 * SourceScheduler.min_interval_minutes, True))
+
+       for athread in threads:
            athread.set_config(self)
            athread.start()
 
+       self.threads.extend(threads)
+
    def get_threads(self):
        return self.threads
 
-   def close(self):
+   def get_source_queue_size(self):
+       """ Returns number of sources waiting in queue, and being processed """
+       return self.source_queue.size()
+
+   def get_number_of_sources_fetched(self, minutes):
+       """ Counts fetches of all worker processes """
+       from .models import RssSourceOperationalData
+       start = DateUtils.get_datetime_now_utc() - timedelta(minutes = minutes)
+       return RssSourceOperationalData.objects.filter(date_fetched__gte = start).count()
+
+   def update_queue_metrics(self):
+       """ Sets gauges of queue. They are read from database, at most once in queue_metrics_seconds """
+       now = time.monotonic()
+       if self.last_queue_metrics and now - self.last_queue_metrics < self.queue_metrics_seconds:
+           return
+       self.last_queue_metrics = now
+
+       metrics.source_queue_depth.set(self.get_source_queue_size())
+       metrics.source_queue_dead.set(self.source_queue.get_dead_count())
+       metrics.source_queue_oldest_seconds.set(int(self.source_queue.get_oldest_age()))
+
+       lock = self.scheduler_lock.get_lock()
+       if lock and lock.owner and lock.date_heartbeat:
+           age = DateUtils.get_datetime_now_utc() - lock.date_heartbeat
+           metrics.scheduler_heartbeat_age_seconds.set(int(age.total_seconds()))
+
+   def update_metrics(self):
+       """ Sets gauges of worker process, called before metrics are read """
+       from .webtools import PageCache
+
+       self.update_queue_metrics()
+
+       for athread in self.get_threads():
+           worker = athread.get_worker_name()
+           metrics.worker_alive.set(1 if athread.is_alive() else 0, worker = worker)
+           metrics.worker_busy.set(1 if athread.is_busy() else 0, worker = worker)
+           metrics.worker_processed.set(athread.get_processed_count(), worker = worker)
+           metrics.worker_idle_seconds.set(int(athread.get_seconds_since_active()), worker = worker)
+
+       cache_stats = PageCache.get_object().get_stats()
+       metrics.page_cache_hits.set(cache_stats["hits"])
+       metrics.page_cache_misses.set(cache_stats["misses"])
+
+   def close(self, timeout = 30):
+       """
+       Stops threads, and waits for them at most timeout seconds.
+       Sources which were not processed by then are released, without counting a failed attempt.
+       """
        for athread in self.threads:
            athread.close()
 
+       deadline = time.monotonic() + timeout
+       for athread in self.threads:
+           athread.join(max(0, deadline - time.monotonic()))
+
+       released = self.source_queue.release_leased() + self.crawl_queue.release_leased()
+       if released:
+           logging.info("Released unfinished sources: {0}".format(released))
+
+       if self.scheduler_lock.is_held():
+           self.scheduler_lock.release()
+
+   def t_prepare_items(self, thread, items):
+      """ Feeds of sources leased together are downloaded concurrently """
+      if thread == "process-source":
+          self.download_rss_sources(items)
+
    def t_process_item(self, thread, item):
       from datetime import date, timedelta
 
@@ -115,19 +261,22 @@ class Configuration(object):
           print("thread {0}".format(thread))
 
       if thread == "process-source":
-          try:
-             self.t_process_source(item)
-             today = DateUtils.get_iso_today()
-             if not item.export_to_cms:
-                return
-
-             self.write_files_for_source_for_day(item.url, today)
-          except Exception as e:
-             log = logging.getLogger(self.app_name)
-             PersistentInfo.error("Exception during parsing page contents {0}".format(item.url) )
-             log.critical(e, exc_info=True)
+          if self.is_crawled_source(item):
+             # crawl waits between requests to the domain, it would hold fetch worker for minutes
+             self.crawl_queue.put(item)
+             return
+
+          # failure is raised to the worker, so that the job is retried
+          self.t_process_source_files(item)
+      elif thread == "crawl-source":
+          self.t_process_source_files(item)
+      elif thread == "scheduler-lock":
+         self.scheduler_lock.acquire()
       elif thread == "refresh-thread":
          try:
+             # other process could be the scheduler
+             if not self.scheduler_lock.acquire():
+                 return
              self.t_refresh(item)
          except Exception as e:
             log = logging.getLogger(self.app_name)
@@ -140,159 +289,314 @@ class Configuration(object):
          log.critical(e, exc_info=True)
          raise NotImplemented
 
-   def check_source_fetch_time(self, source):
-       start_time = DateUtils.get_datetime_now_utc()
+   def t_process_source_files(self, source):
+      self.t_process_source(source)
+
+      try:
+         today = DateUtils.get_iso_today()
+         if not source.export_to_cms:
+            return
 
-       date_fetched = source.get_date_fetched()
-       if date_fetched:
-           time_since_update = start_time - date_fetched
-           mins = time_since_update / timedelta(minutes = 1)
+         self.write_files_for_source_for_day(source.url, today)
+      except Exception as e:
+         log = logging.getLogger(self.app_name)
+         PersistentInfo.error("Exception during writing source files {0}".format(source.url) )
+         log.critical(e, exc_info=True)
 
-           if mins >= 10:
-               return True
-           return False
+   def is_crawled_source(self, source):
+       plugin = BasePluginBuilder.get(source.get_domain())
+       return not plugin.is_rss_source() and plugin.get_crawl_depth() > 0
 
-       return True
+   def check_source_fetch_time(self, source):
+       return self.scheduler.is_due(source)
 
    def t_process_source(self, source):
+       stats = FetchStats()
+       start_time = DateUtils.get_datetime_now_utc()
+
        try:
            print("process source: {0}".format(source.title))
 
-           if self.check_source_fetch_time(source) == False:
-               print("not yet time for source: {0}".format(source.title))
-               return
-
-           start_time = DateUtils.get_datetime_now_utc()
-
            plugin = BasePluginBuilder.get(source.get_domain())
-           num_entries = 0
 
            if plugin.is_rss_source():
-               num_entries = self.t_process_rss_source(source)
+               self.t_process_rss_source(source, stats)
            else:
-               num_entries = self.t_process_parser_source(source)
-
-           stop_time = DateUtils.get_datetime_now_utc()
-           total_time = stop_time - start_time
-           total_time.total_seconds()
+               self.t_process_parser_source(source, stats)
 
-           if num_entries != 0:
-               source.set_operational_info(stop_time, num_entries, total_time.total_seconds())
+           self.scheduler.fetch_done(source, stats.num_new_entries)
 
        except Exception as e:
           log = logging.getLogger(self.app_name)
-          queue_size = self.threads[0].get_queue_size()
+          queue_size = self.get_source_queue_size()
           PersistentInfo.error("Source: {0} {1} NOK; Queue: {2} {3}".format(source.url, source.title, queue_size, str(e)))
-          log.critical(e, exc_info=True)
 
-   def t_process_rss_source(self, source):
-       try:
-           import feedparser
-           url = source.url
+          stats.error = str(e)
+          self.scheduler.fetch_failed(source)
+          raise
 
-           feed = feedparser.parse(url)
+       finally:
+          stop_time = DateUtils.get_datetime_now_utc()
+          total_time = stop_time - start_time
 
-           num_entries = len(feed.entries)
+          metrics.sources_processed.inc(result = "error" if stats.error else "ok")
+          metrics.fetch_seconds.observe(total_time.total_seconds(), stage = "total")
+          for stage in FetchStats.stages:
+             metrics.fetch_seconds.observe(stats.get_seconds(stage), stage = stage)
 
-           if num_entries == 0:
-               PersistentInfo.error("Source: {0} {1} Has no data; Queue: {2}".format(source.url, source.title, queue_size))
-           else:
-               rss_path = self.get_export_path() / "downloaded_rss"
-               rss_path.mkdir(parents = True, exist_ok = True)
+          try:
+             source.set_fetch_stats(stop_time, total_time.total_seconds(), stats)
+          except Exception as e:
+             log = logging.getLogger(self.app_name)
+             log.critical(e, exc_info=True)
 
-               file_name = url + ".txt"
-               file_name = self.get_url_clean_name(file_name)
+   def t_process_rss_source(self, source, stats):
+       """ Fills stats with data of the fetch """
+       import feedparser
+       url = source.url
 
-               file_path = rss_path / file_name
-               file_path.write_text(str(feed))
+       response = getattr(source, "_download_response", None)
+       if response is None:
+           response = self.get_downloader().fetch_blocking(url, source.get_conditional_headers())
 
-               for entry in feed.entries:
-                   self.process_rss_entry(source, entry)
+       stats.add_transfer(response)
 
-           return num_entries
-       except Exception as e:
-          log = logging.getLogger(self.app_name)
-          queue_size = self.threads[0].get_queue_size()
-          PersistentInfo.error("Source: {0} {1} NOK; Queue: {2} {3}".format(source.url, source.title, queue_size, str(e)))
-          log.critical(e, exc_info=True)
+       if response.is_not_modified():
+           print("source not modified: {0}".format(source.title))
+           return
+
+       if not response.is_valid():
+           raise IOError("Could not download, status: {0}".format(response.status))
+
+       body_hash = response.get_body_hash()
+
+       archive = self.get_rss_archive()
+       archive.store(self.get_url_clean_name(url), response.contents, DateUtils.get_datetime_now_utc(), body_hash)
+
+       if body_hash == source.get_body_hash():
+           print("source contents not changed: {0}".format(source.title))
+           source.set_fetch_cache_info(DateUtils.get_datetime_now_utc(), response.get_etag(), response.get_last_modified(), body_hash)
+           return
+
+       with stats.measure("parse"):
+           feed = feedparser.parse(response.contents)
+
+       stats.num_entries = len(feed.entries)
 
-   def t_process_parser_source(self, source):
+       if stats.num_entries == 0:
+           queue_size = self.get_source_queue_size()
+           PersistentInfo.error("Source: {0} {1} Has no data; Queue: {2}".format(source.url, source.title, queue_size))
+       else:
+           self.process_rss_entries(source, feed.entries, stats)
+
+           source.set_fetch_cache_info(DateUtils.get_datetime_now_utc(), response.get_etag(), response.get_last_modified(), body_hash)
+
+   def t_process_parser_source(self, source, stats):
+       """ Fills stats with data of the fetch """
        from .webtools import Page
-       from .models import RssSourceEntryDataModel
-       try:
-           plugin = BasePluginBuilder.get(source.get_domain())
-           links = plugin.get_links()
-           num_entries = len(links)
 
-           for link in links:
-               objs = RssSourceEntryDataModel.objects.filter(link = link)
-               if objs.exists():
-                   continue
+       plugin = BasePluginBuilder.get(source.get_domain())
+       if plugin.get_crawl_depth() > 0:
+           return self.t_crawl_parser_source(source, plugin, stats)
+
+       # plugin is shared by threads, transfer data are read from own page
+       page = Page(plugin.get_address())
+       start = time.perf_counter()
+       contents = page.get_contents()
+       stats.add_pages([page], time.perf_counter() - start)
+
+       with stats.measure("parse"):
+           links = plugin.get_links(contents)
+       stats.num_entries = len(links)
 
-               p = Page(link)
-               title = p.get_title()
+       with stats.measure("dedupe"):
+           existing_links = self.get_existing_links(links)
+       stats.num_duplicate_entries = len(existing_links)
+
+       new_links = []
+       for link in links:
+           if link not in existing_links:
+               new_links.append(link)
+
+       start = time.perf_counter()
+       pages = self.fetch_pages(new_links)
+       stats.add_pages(pages.values(), time.perf_counter() - start)
+
+       entries_props = []
+       for link in new_links:
+           page = pages[link]
+
+           with stats.measure("parse"):
+               title = page.get_title()
                if title:
-                   print("{0} {1}".format(link, title))
+                   entries_props.append(plugin.get_link_data(source, link, page))
 
-                   props = plugin.get_link_data(source, link)
+           if title:
+               print("{0} {1}".format(link, title))
+           else:
+               print("Could not read title: {0}".format(link))
 
-                   o = RssSourceEntryDataModel(
-                       source = props['source'],
-                       title = props['title'],
-                       description = props['description'],
-                       link = props['link'],
-                       date_published = props['published'],
-                       language = props['language'],
-                       source_obj = source)
+       with stats.measure("db"):
+           self.store_entries(source, entries_props)
+       stats.num_new_entries = len(entries_props)
 
-                   o.save()
-               else:
-                   print("Could not read title: {0}".format(link))
+   def t_crawl_parser_source(self, source, plugin, stats):
+       """ Crawls site of source, entries are stored in batches while crawling. Time of crawling is download time """
+       from django.conf import settings
+       from .webcrawler import WebCrawler
 
-           return num_entries
-       except Exception as e:
-          log = logging.getLogger(self.app_name)
-          queue_size = self.threads[0].get_queue_size()
-          PersistentInfo.error("Source: {0} {1} NOK; Queue: {2} {3}".format(source.url, source.title, queue_size, str(e)))
-          log.critical(e, exc_info=True)
+       workers = getattr(settings, "RSSHISTORY_PAGE_FETCH_WORKERS", 16)
+       crawler = WebCrawler(plugin.get_address(), plugin.get_crawl_depth() + 1, plugin.get_crawl_max_pages(), workers)
+       crawler.link_filter = plugin.is_link_valid_domain
 
-   def process_rss_entry(self, source, feed_entry):
-       try:
-          from .models import RssSourceEntryDataModel
+       entries_props = []
+       pages = []
+       start = time.perf_counter()
 
-          plugin = BasePluginBuilder.get(source.get_domain())
+       def on_page(url, page, depth):
+           pages.append(page)
 
-          props = plugin.get_feed_entry_map(source, feed_entry)
+           if depth == 0 or not plugin.is_link_valid(url):
+               return
+
+           with stats.measure("parse"):
+               title = page.get_title()
+               if not title:
+                   return
 
-          objs = RssSourceEntryDataModel.objects.filter(link = props['link'])
+               entries_props.append(plugin.get_link_data(source, url, page))
 
-          if not objs.exists():
-              if str(feed_entry.title).strip() == "" or feed_entry.title == "undefined":
-                  return False
+           stats.num_entries += 1
 
-              if not plugin.is_link_valid(props['link']):
-                  return False
+           if len(entries_props) >= 50:
+               self.store_new_entries(source, entries_props, stats)
+               entries_props.clear()
 
-              o = RssSourceEntryDataModel(
-                  source = props['source'],
-                  title = props['title'],
-                  description = props['description'],
-                  link = props['link'],
-                  date_published = props['published'],
-                  language = props['language'],
-                  source_obj = source)
+       crawler.crawl(on_page)
+       self.store_new_entries(source, entries_props, stats)
 
-              o.save()
+       # processing of pages is done during crawling
+       seconds = time.perf_counter() - start - stats.get_seconds("parse") - stats.get_seconds("dedupe") - stats.get_seconds("db")
+       stats.add_pages(pages, seconds)
 
-              return True
+   def store_new_entries(self, source, entries_props, stats):
+       """ Stores entries which are not yet in database. Adds counts to stats """
+       with stats.measure("dedupe"):
+           existing_links = self.get_existing_links([props['link'] for props in entries_props])
+
+       new_entries_props = []
+       for props in entries_props:
+           if props['link'] not in existing_links:
+               new_entries_props.append(props)
+
+       with stats.measure("db"):
+           self.store_entries(source, new_entries_props)
+
+       stats.num_new_entries += len(new_entries_props)
+       stats.num_duplicate_entries += len(existing_links)
+
+   def get_rss_entry_props(self, plugin, source, feed_entry):
+       """ Returns properties of a feed entry, or None if entry should not be stored """
+       try:
+          if str(feed_entry.title).strip() == "" or feed_entry.title == "undefined":
+              return None
+
+          props = plugin.get_feed_entry_map(source, feed_entry)
+
+          if not plugin.is_link_valid(props['link']):
+              return None
+
+          return props
 
        except Exception as e:
           log = logging.getLogger(self.app_name)
-          queue_size = self.threads[0].get_queue_size()
-          PersistentInfo.error("Entry: {0} {1} NOK/Queue: {2}; Entry {3} {4} {5}".format(source.url, source.title, queue_size, feed_entry.link, feed_entry.title, str(e)))
+          queue_size = self.get_source_queue_size()
+          PersistentInfo.error("Entry: {0} {1} NOK/Queue: {2}; Entry {3} {4} {5}".format(source.url, source.title, queue_size, feed_entry.get('link'), feed_entry.get('title'), str(e)))
           log.critical(e, exc_info=True)
 
-          return False
+   def process_rss_entries(self, source, feed_entries, stats):
+       """
+       Stores new entries of a feed.
+       All links are checked with one query, new entries are inserted in one transaction.
+       Numbers of new entries, and of entries that were already present are added to stats.
+       """
+       plugin = BasePluginBuilder.get(source.get_domain())
+
+       entries_props = {}
+       with stats.measure("parse"):
+           for feed_entry in feed_entries:
+               props = self.get_rss_entry_props(plugin, source, feed_entry)
+               if props and props['link'] not in entries_props:
+                   entries_props[props['link']] = props
+
+       with stats.measure("dedupe"):
+           existing_links = self.get_existing_links(entries_props.keys())
+
+       new_entries_props = []
+       for link in entries_props:
+           if link not in existing_links:
+               new_entries_props.append(entries_props[link])
+
+       with stats.measure("db"):
+           self.store_entries(source, new_entries_props)
+
+       stats.num_new_entries += len(new_entries_props)
+       stats.num_duplicate_entries += len(existing_links)
+
+   def get_existing_links(self, links):
+       """ Returns set of links, which are already in database. Uses one query """
+       from .models import RssSourceEntryDataModel
+
+       objs = RssSourceEntryDataModel.objects.filter(link__in = list(links))
+       return set(objs.values_list('link', flat=True))
+
+   def store_entries(self, source, entries_props):
+       """ Inserts entries in one transaction """
+       from django.db import transaction
+       from .models import RssSourceEntryDataModel
+
+       new_entries = []
+       for props in entries_props:
+           new_entries.append(RssSourceEntryDataModel(
+               source = props['source'],
+               title = props['title'],
+               description = props['description'],
+               link = props['link'],
+               date_published = props['published'],
+               language = props['language'],
+               source_obj = source))
+
+       with transaction.atomic():
+           # other worker could have inserted the same link in the meantime
+           RssSourceEntryDataModel.objects.bulk_create(new_entries, ignore_conflicts = True)
+
+       metrics.entries_inserted.inc(len(new_entries))
+
+       self.update_search_index([entry.link for entry in new_entries])
+
+   def update_search_index(self, links):
+       """ Entries are stored even if index cannot be updated, index can be rebuilt """
+       from . import search
+       search.update_links(links)
+
+   def fetch_pages(self, links):
+       """ Downloads pages concurrently, each link once. Returns map link -> Page """
+       from concurrent.futures import ThreadPoolExecutor
+       from django.conf import settings
+       from .webtools import Page
+
+       pages = {}
+       for link in links:
+           pages[link] = Page(link)
+
+       if len(pages) == 0:
+           return pages
+
+       max_workers = getattr(settings, "RSSHISTORY_PAGE_FETCH_WORKERS", 16)
+       with ThreadPoolExecutor(max_workers = max_workers) as executor:
+           list(executor.map(lambda page: page.is_valid(), pages.values()))
+
+       return pages
 
    def write_files_for_source_for_day(self, source_url, day_iso):
        from .models import RssSourceEntryDataModel
@@ -346,9 +650,35 @@ class Configuration(object):
            if self.check_source_fetch_time(item) == False:
                return False
 
-       self.threads[0].add_to_process_list(item)
+       if force:
+           self.source_queue.put(item, ThreadJobQueue.PRIORITY_HIGH)
+       else:
+           self.source_queue.put(item)
        return True
 
+   def download_rss_sources(self, sources):
+       """
+       Downloads feeds of RSS sources concurrently. Response is kept in the source object,
+       which is processed by the same worker, and is released with it.
+       """
+       urls = []
+       headers = {}
+       for source in sources:
+           plugin = BasePluginBuilder.get(source.get_domain())
+           if plugin.is_rss_source():
+               urls.append(source.url)
+               headers[source.url] = source.get_conditional_headers()
+
+       if len(urls) < 2:
+           return
+
+       responses = self.get_downloader().download(urls, headers)
+
+       for source in sources:
+           response = responses.get(source.url)
+           if response and response.status is not None:
+               source._download_response = response
+
    def check_if_git_update(self):
        try:
            ob = ConfigurationEntry.objects.all()
@@ -384,11 +714,23 @@ class Configuration(object):
        PersistentInfo.create("Refreshing RSS data")
 
        from .models import RssSourceDataModel
-       sources = RssSourceDataModel.objects.all()
-       for source in sources:
-           self.download_rss(source)
+       sources = RssSourceDataModel.objects.all().select_related('operational_data')
+
+       # workers download feeds of sources they lease. Scheduled fetches have normal priority,
+       # so that refresh requested by user is processed before them
+       due_sources = [source for source in sources if self.check_source_fetch_time(source)]
+       self.source_queue.put_many(due_sources)
+
+       # sources are checked often, maintenance is done once an hour
+       now = DateUtils.get_datetime_now_utc()
+       if self.last_maintenance and now - self.last_maintenance < timedelta(hours = 1):
+           return
+       self.last_maintenance = now
 
        self.clear_old_entries()
+       self.source_queue.remove_dead()
+       self.crawl_queue.remove_dead()
+       self.prune_rss_archive()
 
        self.check_if_git_update()
        #self.fix_tags()
@@ -524,6 +866,7 @@ class Configuration(object):
        log = logging.getLogger(self.app_name)
 
        from .models import RssSourceDataModel, RssSourceEntryDataModel
+       from . import search
        #sources = RssSourceDataModel.objects.filter(remove_after_days)
        sources = RssSourceDataModel.objects.all()
        for source in sources:
@@ -539,7 +882,7 @@ class Configuration(object):
                entries = RssSourceEntryDataModel.objects.filter(source=source.url, persistent=False, date_published__lt=days_before)
                if entries.exists():
                    PersistentInfo.create("Removing old RSS data for source: {0} {1}".format(source.url, source.title))
-                   entries.delete()
+                   search.delete_entries(entries)
 
    def push_to_git(self, conf):
        self.push_daily_repo(conf)
@@ -0,0 +1,127 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from datetime import datetime
+
+
+class RssArchive(object):
+    """
+    Archive of raw feed data, as it was downloaded.
+
+    Data is compressed and stored under its sha256 hash, so identical data is stored once.
+    For each source there is an index file, each line describes a fetch: date, hash, size.
+    Fetches of unchanged data only add a line to index. Old lines, and data which they
+    do not reference, are removed by prune.
+    """
+
+    # data not referenced by index is removed after this time, it could be stored just now
+    orphan_seconds = 60 * 60
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+
+    def get_hash(self, contents):
+        return hashlib.sha256(contents).hexdigest()
+
+    def get_object_path(self, body_hash):
+        return self.directory / "objects" / body_hash[:2] / (body_hash + ".gz")
+
+    def get_index_path(self, index_name):
+        return self.directory / "index" / (index_name + ".jsonl")
+
+    def store(self, index_name, contents, date_fetched, body_hash = None):
+        """ Stores data, if it is not already present, and adds fetch to index. Returns hash """
+        if body_hash is None:
+            body_hash = self.get_hash(contents)
+
+        object_path = self.get_object_path(body_hash)
+        if not object_path.exists():
+            object_path.parent.mkdir(parents = True, exist_ok = True)
+
+            # write to temporary file first, so that readers never see partial data
+            temp_path = object_path.with_name("{0}.{1}.{2}.tmp".format(object_path.name, os.getpid(), threading.get_ident()))
+            temp_path.write_bytes(gzip.compress(contents, mtime = 0))
+            os.replace(temp_path, object_path)
+        else:
+            # prune, which runs at the same time, does not remove data referenced again
+            try:
+                os.utime(object_path)
+            except OSError:
+                pass
+
+        self.add_to_index(index_name, date_fetched, body_hash, len(contents))
+
+        return body_hash
+
+    def add_to_index(self, index_name, date_fetched, body_hash, size):
+        index_path = self.get_index_path(index_name)
+
+        line = json.dumps({"date" : date_fetched.isoformat(), "hash" : body_hash, "size" : size})
+
+        with self._lock:
+            index_path.parent.mkdir(parents = True, exist_ok = True)
+            with open(index_path, "a", encoding = "utf-8") as handle:
+                handle.write(line + "\n")
+
+    def get_history(self, index_name):
+        """ Returns list of fetches of a source, oldest first """
+        index_path = self.get_index_path(index_name)
+        if not index_path.exists():
+            return []
+
+        history = []
+        with open(index_path, encoding = "utf-8") as handle:
+            for line in handle:
+                if line.strip() != "":
+                    history.append(json.loads(line))
+        return history
+
+    def read(self, body_hash):
+        object_path = self.get_object_path(body_hash)
+        if object_path.exists():
+            return gzip.decompress(object_path.read_bytes())
+
+    def prune(self, date_before):
+        """
+        Removes fetches older than date_before from indexes, and data which is not referenced anymore.
+        Returns number of removed data files. Called by scheduler, which is one in the system.
+        """
+        referenced = set()
+
+        for index_path in self.directory.glob("index/*.jsonl"):
+            index_name = index_path.stem
+            history = self.get_history(index_name)
+
+            kept = [fetch for fetch in history if datetime.fromisoformat(fetch["date"]) >= date_before]
+            # the last fetch is kept, so that the current data of a source is always available
+            if len(kept) == 0 and len(history) > 0:
+                kept = history[-1:]
+
+            if len(kept) != len(history):
+                temp_path = index_path.with_name("{0}.{1}.tmp".format(index_path.name, os.getpid()))
+                with self._lock:
+                    temp_path.write_text("".join(json.dumps(fetch) + "\n" for fetch in kept), encoding = "utf-8")
+                    os.replace(temp_path, index_path)
+
+            referenced.update(fetch["hash"] for fetch in kept)
+
+        removed = 0
+        now = time.time()
+        for object_path in self.directory.glob("objects/*/*.gz"):
+            body_hash = object_path.name[:-3]
+            if body_hash in referenced:
+                continue
+
+            try:
+                if now - object_path.stat().st_mtime > self.orphan_seconds:
+                    object_path.unlink()
+                    removed += 1
+            except OSError:
+                pass
+
+        return removed
@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+from .dateutils import DateUtils
+
+
+class SourceScheduler(object):
+    """
+    Decides when a source should be fetched next.
+
+    Fetch interval follows the publishing rate of a source, learned from its entry history.
+    Sources which do not provide new entries, or fail, are fetched less often.
+    """
+
+    min_interval_minutes = 10
+    max_interval_minutes = 24 * 60
+    history_days = 7
+    quiet_backoff = 1.5
+
+    def clamp(self, minutes):
+        return int(max(self.min_interval_minutes, min(self.max_interval_minutes, minutes)))
+
+    def get_publish_interval_minutes(self, source):
+        """ Returns mean time between entries of a source, in the last days """
+        from .models import RssSourceEntryDataModel
+
+        start = DateUtils.get_datetime_now_utc() - timedelta(days = self.history_days)
+        count = RssSourceEntryDataModel.objects.filter(source = source.url, date_published__gte = start).count()
+
+        if count == 0:
+            return self.max_interval_minutes
+
+        return self.history_days * 24 * 60 / count
+
+    def get_interval_minutes(self, source, num_new_entries):
+        # fetch twice per publishing interval, so that entries are not late
+        interval = self.get_publish_interval_minutes(source) / 2
+
+        if num_new_entries == 0:
+            previous = source.get_fetch_interval()
+            if previous:
+                interval = max(interval, previous * self.quiet_backoff)
+
+        return self.clamp(interval)
+
+    def fetch_done(self, source, num_new_entries):
+        interval = self.get_interval_minutes(source, num_new_entries)
+        next_fetch = DateUtils.get_datetime_now_utc() + timedelta(minutes = interval)
+
+        source.set_schedule(next_fetch, interval, 0)
+
+    def fetch_failed(self, source):
+        errors = source.get_consecutive_errors() + 1
+        interval = self.clamp(self.min_interval_minutes * (2 ** errors))
+        next_fetch = DateUtils.get_datetime_now_utc() + timedelta(minutes = interval)
+
+        source.set_schedule(next_fetch, interval, errors)
+
+    def get_retry_date(self, source, attempts):
+        """ Failed fetch is retried when source is due, see fetch_failed """
+        next_fetch = source.get_date_next_fetch()
+        if next_fetch:
+            return next_fetch
+        return DateUtils.get_datetime_now_utc() + timedelta(minutes = self.min_interval_minutes)
+
+    def is_due(self, source):
+        next_fetch = source.get_date_next_fetch()
+        if next_fetch:
+            return DateUtils.get_datetime_now_utc() >= next_fetch
+
+        date_fetched = source.get_date_fetched()
+        if date_fetched:
+            time_since_update = DateUtils.get_datetime_now_utc() - date_fetched
+            return time_since_update >= timedelta(minutes = self.min_interval_minutes)
+
+        return True
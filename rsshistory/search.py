@@ -0,0 +1,318 @@
+"""
+Full text search over entries: title, description and tags.
+
+Index is kept in a separate table, FTS5 table in SQLite, or tsvector table with GIN index in
+PostgreSQL. Table is created after migrate, see signals.py. Other databases have no index,
+search falls back to icontains.
+"""
+import re
+import time
+import logging
+import threading
+
+
+class SearchBackend(object):
+    """ Base of full text index. Entry id is key of index rows """
+
+    table = "rsshistory_entry_search"
+    # common words match most of entries, only the newest matches are ranked
+    max_candidates = 20000
+    batch_size = 500
+
+    obj = None
+    obj_lock = threading.Lock()
+    # database without full text support is checked once, missing table again after this time
+    obj_supported = True
+    obj_check_time = None
+    recheck_seconds = 60
+
+    def get_object():
+        """ Returns backend for configured database, or None if database has no full text index """
+        if SearchBackend.obj is None and SearchBackend.obj_supported:
+            with SearchBackend.obj_lock:
+                now = time.monotonic()
+                check_time = SearchBackend.obj_check_time
+                if SearchBackend.obj is None and (check_time is None or now - check_time >= SearchBackend.recheck_seconds):
+                    SearchBackend.obj_check_time = now
+                    SearchBackend.obj = SearchBackend.create_backend()
+        return SearchBackend.obj
+
+    def reset():
+        """ Called when index table is created """
+        with SearchBackend.obj_lock:
+            SearchBackend.obj = None
+            SearchBackend.obj_supported = True
+            SearchBackend.obj_check_time = None
+
+    def get_backend_class(vendor):
+        if vendor == "sqlite":
+            return SqliteSearchBackend
+        elif vendor == "postgresql":
+            return PostgresSearchBackend
+
+    def create_backend():
+        from django.db import connection
+
+        backend_class = SearchBackend.get_backend_class(connection.vendor)
+        if backend_class is None:
+            SearchBackend.obj_supported = False
+            return None
+
+        if SearchBackend.table not in connection.introspection.table_names():
+            logging.error("Full text search is not available, index table does not exist. Run migrate")
+            return None
+        return backend_class()
+
+    def create_index(connection):
+        """ Creates index table, if database supports it. Called after migrate """
+        backend_class = SearchBackend.get_backend_class(connection.vendor)
+        if backend_class is None:
+            return False
+
+        with connection.cursor() as cursor:
+            for sql in backend_class().get_create_sql():
+                cursor.execute(sql)
+
+        SearchBackend.reset()
+        return True
+
+    def get_create_sql(self):
+        return []
+
+    def get_documents(self, entry_ids):
+        """ Returns list of (id, title, description, tags) """
+        from .models import RssSourceEntryDataModel, RssEntryTagsDataModel
+
+        entries = list(RssSourceEntryDataModel.objects.filter(id__in = entry_ids).values_list('id', 'link', 'title', 'description'))
+
+        tags = {}
+        links = [entry[1] for entry in entries]
+        for link, tag in RssEntryTagsDataModel.objects.filter(link__in = links).values_list('link', 'tag'):
+            tags.setdefault(link, []).append(tag)
+
+        return [(entry_id, title or "", description or "", " ".join(tags.get(link, []))) for entry_id, link, title, description in entries]
+
+    def update_entries(self, entry_ids):
+        """ Indexes entries again, entries which do not exist are removed from index """
+        from django.db import connection
+
+        entry_ids = list(entry_ids)
+        for start in range(0, len(entry_ids), self.batch_size):
+            batch = entry_ids[start:start + self.batch_size]
+            documents = self.get_documents(batch)
+
+            with connection.cursor() as cursor:
+                self.delete_rows(cursor, batch)
+                if documents:
+                    cursor.executemany(self.get_insert_sql(), documents)
+
+    def update_links(self, links):
+        from .models import RssSourceEntryDataModel
+
+        self.update_entries(RssSourceEntryDataModel.objects.filter(link__in = list(links)).values_list('id', flat = True))
+
+    def remove_entries(self, entry_ids):
+        from django.db import connection
+
+        entry_ids = list(entry_ids)
+        with connection.cursor() as cursor:
+            for start in range(0, len(entry_ids), self.batch_size):
+                self.delete_rows(cursor, entry_ids[start:start + self.batch_size])
+
+    def rebuild(self):
+        """ Indexes all entries. Returns number of indexed entries """
+        from django.db import connection
+        from .models import RssSourceEntryDataModel
+
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {0}".format(self.table))
+
+        entry_ids = list(RssSourceEntryDataModel.objects.order_by().values_list('id', flat = True))
+        self.update_entries(entry_ids)
+        return len(entry_ids)
+
+    def filter(self, entries, text):
+        """
+        Returns entries matching text, the best first.
+
+        Match is a subquery of the entries query, so filters of entries are applied before
+        candidates are limited. Rank is read by join with the index table.
+        """
+        from django.db.models.expressions import RawSQL
+
+        query = self.get_query(text)
+        if not query:
+            return entries.none()
+
+        matches = entries.filter(id__in = RawSQL(self.get_match_sql(), [query]))
+        candidates = matches.order_by('-id').values('id')[:self.max_candidates]
+
+        entry_table = entries.model._meta.db_table
+        return entries.filter(id__in = candidates).extra(
+                select = {"search_rank" : self.get_rank_sql()},
+                select_params = self.get_rank_params(query),
+                tables = [self.table],
+                where = self.get_join_where(entry_table),
+                params = [query],
+                order_by = [self.get_rank_order(), "-id"])
+
+
+class SqliteSearchBackend(SearchBackend):
+
+    # title is more important than tags, tags than description
+    weights = (10.0, 1.0, 5.0)
+
+    def get_create_sql(self):
+        return ["CREATE VIRTUAL TABLE IF NOT EXISTS {0} USING fts5(title, description, tags, tokenize = 'unicode61 remove_diacritics 2')".format(self.table)]
+
+    def get_insert_sql(self):
+        return "INSERT INTO {0} (rowid, title, description, tags) VALUES (%s, %s, %s, %s)".format(self.table)
+
+    def delete_rows(self, cursor, entry_ids):
+        if entry_ids:
+            cursor.execute("DELETE FROM {0} WHERE rowid IN ({1})".format(self.table, ", ".join(["%s"] * len(entry_ids))), entry_ids)
+
+    def get_match_sql(self):
+        return "SELECT rowid FROM {0} WHERE {0} MATCH %s".format(self.table)
+
+    def get_join_where(self, entry_table):
+        return ["{0}.rowid = {1}.id".format(self.table, entry_table),
+                "{0} MATCH %s".format(self.table)]
+
+    def get_rank_sql(self):
+        return "bm25({0}, {1}, {2}, {3})".format(self.table, *self.weights)
+
+    def get_rank_params(self, query):
+        return []
+
+    def get_rank_order(self):
+        # lower bm25 is better
+        return "search_rank"
+
+    def get_query(self, text):
+        """
+        Converts user text to FTS5 query. Text in quotes is a phrase, other words must all be present.
+        Every term is quoted, so FTS5 operators in user text have no effect.
+        """
+        terms = []
+        for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text):
+            term = (phrase or word).strip()
+            if term:
+                terms.append('"{0}"'.format(term.replace('"', '""')))
+        return " ".join(terms)
+
+
+class PostgresSearchBackend(SearchBackend):
+
+    def get_create_sql(self):
+        return ["CREATE TABLE IF NOT EXISTS {0} (entry_id integer PRIMARY KEY, document tsvector NOT NULL)".format(self.table),
+                "CREATE INDEX IF NOT EXISTS {0}_document ON {0} USING GIN (document)".format(self.table)]
+
+    def get_insert_sql(self):
+        return ("INSERT INTO {0} (entry_id, document) VALUES (%s, "
+                "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'C') || setweight(to_tsvector('simple', %s), 'B'))"
+                .format(self.table))
+
+    def delete_rows(self, cursor, entry_ids):
+        if entry_ids:
+            cursor.execute("DELETE FROM {0} WHERE entry_id = ANY(%s)".format(self.table), [list(entry_ids)])
+
+    def get_match_sql(self):
+        return "SELECT entry_id FROM {0} WHERE document @@ websearch_to_tsquery('simple', %s)".format(self.table)
+
+    def get_join_where(self, entry_table):
+        return ["{0}.entry_id = {1}.id".format(self.table, entry_table),
+                "{0}.document @@ websearch_to_tsquery('simple', %s)".format(self.table)]
+
+    def get_rank_sql(self):
+        return "ts_rank({0}.document, websearch_to_tsquery('simple', %s))".format(self.table)
+
+    def get_rank_params(self, query):
+        return [query]
+
+    def get_rank_order(self):
+        return "-search_rank"
+
+    def get_query(self, text):
+        """ websearch_to_tsquery supports phrases in quotes """
+        return text.strip()
+
+
+def filter_entries(entries, text):
+    """ Returns entries matching text, ordered by rank if there is full text index """
+    from django.db.models import Q
+
+    backend = SearchBackend.get_object()
+    if backend is None:
+        return entries.filter(Q(title__icontains = text) | Q(description__icontains = text))
+
+    return backend.filter(entries, text)
+
+
+def update_links(links):
+    """ Entries are stored even if index cannot be updated, index can be rebuilt """
+    from django.db import transaction
+
+    backend = SearchBackend.get_object()
+    if backend is None or len(links) == 0:
+        return
+
+    try:
+        # failure is rolled back to savepoint, transaction of caller can continue
+        with transaction.atomic():
+            backend.update_links(links)
+    except Exception as E:
+        log_index_error(E)
+
+
+def update_entries(entry_ids):
+    from django.db import transaction
+
+    backend = SearchBackend.get_object()
+    if backend is None or len(entry_ids) == 0:
+        return
+
+    try:
+        # failure is rolled back to savepoint, transaction of caller can continue
+        with transaction.atomic():
+            backend.update_entries(entry_ids)
+    except Exception as E:
+        log_index_error(E)
+
+
+def remove_entries(entry_ids):
+    from django.db import transaction
+
+    backend = SearchBackend.get_object()
+    if backend is None or len(entry_ids) == 0:
+        return
+
+    try:
+        # failure is rolled back to savepoint, transaction of caller can continue
+        with transaction.atomic():
+            backend.remove_entries(entry_ids)
+    except Exception as E:
+        log_index_error(E)
+
+
+def delete_entries(entries):
+    """ Deletes queryset of entries, they are removed from index in batches """
+    entry_ids = list(entries.order_by().values_list('id', flat = True))
+    entries.delete()
+    remove_entries(entry_ids)
+
+
+def delete_sources(sources):
+    """ Deletes queryset of sources, entries of sources are deleted with them """
+    from .models import RssSourceEntryDataModel
+
+    entry_ids = list(RssSourceEntryDataModel.objects.filter(source_obj__in = sources).order_by().values_list('id', flat = True))
+    sources.delete()
+    remove_entries(entry_ids)
+
+
+def log_index_error(error):
+    from .models import PersistentInfo
+
+    PersistentInfo.error("Could not update search index: {0}".format(str(error)))
+    logging.critical(error, exc_info=True)
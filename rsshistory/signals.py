@@ -0,0 +1,35 @@
+"""
+Signal handlers, connected in CatalogConfig.ready.
+
+Bulk operations do not send signals, code which uses them updates the search index itself.
+Deletes of entries are not handled here, receiver would disable fast deletes, see search.delete_entries.
+"""
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+
+from .models import RssSourceDataModel, RssSourceEntryDataModel
+
+
+@receiver(post_migrate)
+def create_search_index(sender, using, **kwargs):
+    """ Migrations are not kept by the app, index table is created after migrate """
+    from django.db import connections
+    from .search import SearchBackend
+
+    if sender.name == "rsshistory":
+        SearchBackend.create_index(connections[using])
+
+
+@receiver(post_save, sender = RssSourceEntryDataModel)
+def entry_saved(sender, instance, **kwargs):
+    from . import search
+
+    search.update_entries([instance.id])
+
+
+@receiver(post_save, sender = RssSourceDataModel)
+@receiver(post_delete, sender = RssSourceDataModel)
+def source_changed(sender, instance, **kwargs):
+    from .facets import SourceFacets
+
+    SourceFacets.invalidate()
@@ -1,13 +1,32 @@
 
+from urllib.parse import urlparse, urljoin
+
 from ..webtools import Page
 
-class BasePlugin(Page):
+
+class BasePlugin(object):
+    """
+    Processing of sources of a domain. Plugin objects are shared by threads, so they do not
+    keep contents of pages, pages are read by own Page objects.
+    """
+    crawl_depth = 0
+
     def __init__(self):
-        super().__init__(self.get_address())
+        pass
 
     def get_address(self):
         return "https://google.com"
 
+    def get_domain(self):
+        items = urlparse(self.get_address())
+        return items.scheme + "://" + items.netloc
+
+    def get_page(self):
+        return Page(self.get_address())
+
+    def get_contents(self):
+        return self.get_page().get_contents()
+
     def get_processing_type(self):
         return "RSS"
 
@@ -19,11 +38,42 @@ class BasePlugin(Page):
     def is_link_valid(self, address):
         return True
 
-    def get_link_data(self, source, link):
+    def is_link_valid_domain(self, address):
+        return address.startswith(self.get_domain())
+
+    def get_links(self, contents = None):
+        """ Returns set of valid links of main page. contents can be passed, if page was already read """
+        from ..htmlinfo import parse_html
+
+        if contents is None:
+            contents = self.get_contents()
+
+        links = set()
+        for text in parse_html(contents).links:
+            text = urljoin(self.get_address(), text)
+            if len(text) > 1 and self.is_link_valid(text):
+                links.add(text)
+        return links
+
+    def get_crawl_depth(self):
+        """
+        Number of link levels followed beyond links of main page, for parsing sources.
+        RSSHISTORY_CRAWL_DEPTH can set it for plugin address.
+        """
+        from django.conf import settings
+        depths = getattr(settings, "RSSHISTORY_CRAWL_DEPTH", {})
+        return int(depths.get(self.get_address(), self.crawl_depth))
+
+    def get_crawl_max_pages(self):
+        return 200
+
+    def get_link_data(self, source, link, link_ob = None):
+        """ link_ob is Page of link, if it was already downloaded """
         from ..dateutils import DateUtils
         output_map = {}
 
-        link_ob = Page(link)
+        if link_ob is None:
+            link_ob = Page(link)
 
         title = link_ob.get_title()
 
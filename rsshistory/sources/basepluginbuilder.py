@@ -1,21 +1,44 @@
+import threading
+import importlib
 
-from .baseplugin import BasePlugin
-from .codeprojectplugin import CodeProjectPlugin
-from .instalkiplugin import InstalkiPlugin
-from .niezaleznaplugin import NiezaleznaPlugin
-from .tvn24plugin import TVN24Plugin
 
 class BasePluginBuilder(object):
 
-    plugins = [CodeProjectPlugin,
-               InstalkiPlugin,
-               NiezaleznaPlugin,
-               TVN24Plugin]
+    # map address -> plugin class, in module of this package
+    plugins = {"https://www.codeproject.com" : "codeprojectplugin.CodeProjectPlugin",
+               "https://www.instalki.pl" : "instalkiplugin.InstalkiPlugin",
+               "https://niezalezna.pl" : "niezaleznaplugin.NiezaleznaPlugin",
+               "https://tvn24.pl" : "tvn24plugin.TVN24Plugin"}
+    default_plugin = "baseplugin.BasePlugin"
+
+    # map address -> plugin instance, or name of plugin class, which is created on first use
+    registry = None
+    # map name of plugin class -> plugin instance
+    instances = {}
+    lock = threading.Lock()
+
+    def get_registry():
+        if BasePluginBuilder.registry is None:
+            with BasePluginBuilder.lock:
+                if BasePluginBuilder.registry is None:
+                    BasePluginBuilder.registry = dict(BasePluginBuilder.plugins)
+
+        return BasePluginBuilder.registry
+
+    def get_instance(class_name):
+        with BasePluginBuilder.lock:
+            plugin = BasePluginBuilder.instances.get(class_name)
+            if plugin is None:
+                module_name, plugin_class = class_name.rsplit(".", 1)
+                module = importlib.import_module("." + module_name, __package__)
+                plugin = getattr(module, plugin_class)()
+                BasePluginBuilder.instances[class_name] = plugin
+            return plugin
 
     def get(name):
-        for plugin_def in BasePluginBuilder.plugins:
-            plugin = plugin_def()
-            if name == plugin.get_address():
-                return plugin
+        """ Plugin instances are shared, they should not keep state of processing """
+        plugin = BasePluginBuilder.get_registry().get(name, BasePluginBuilder.default_plugin)
 
-        return BasePlugin()
+        if isinstance(plugin, str):
+            return BasePluginBuilder.get_instance(plugin)
+        return plugin
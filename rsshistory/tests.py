@@ -1,3 +1,1710 @@
+import time
+import tempfile
+import threading
+from unittest import mock
+
 from django.test import TestCase
+from django.db import connection
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import RssSourceDataModel, RssSourceEntryDataModel, RssEntryTagsDataModel, PersistentInfo
+from .forms import EntryChoiceForm, SourcesChoiceForm
+
+
+class EntryChoiceFormTest(TestCase):
+
+    number_of_sources = 300
+
+    def setUp(self):
+        sources = []
+        entries = []
+        for index in range(self.number_of_sources):
+            url = "https://source{0}.example.com/feed".format(index)
+            sources.append(RssSourceDataModel(url = url, title = "Source {0}".format(index), category = "News", subcategory = "World"))
+            entries.append(RssSourceEntryDataModel(source = url, title = "Entry {0}".format(index), description = "",
+                                                   link = "https://source{0}.example.com/entry".format(index)))
+
+        sources.append(RssSourceDataModel(url = "https://other.example.com/feed", title = "Other", category = "Tech", subcategory = "Software"))
+        entries.append(RssSourceEntryDataModel(source = "https://other.example.com/feed", title = "Other entry", description = "",
+                                               link = "https://other.example.com/entry"))
+
+        RssSourceDataModel.objects.bulk_create(sources)
+        RssSourceEntryDataModel.objects.bulk_create(entries)
+
+    def test_category_filter_is_one_query(self):
+        form = EntryChoiceForm(args = {"category" : "News"})
+
+        with CaptureQueriesContext(connection) as context:
+            entries = list(form.get_filtered_objects())
+
+        self.assertEqual(len(entries), self.number_of_sources)
+        self.assertEqual(len(context.captured_queries), 1)
+
+        sql = context.captured_queries[0]["sql"]
+        self.assertNotIn(" OR ", sql)
+        self.assertIn("IN (SELECT", sql)
+
+    def test_category_without_sources_is_empty(self):
+        form = EntryChoiceForm(args = {"category" : "Missing"})
+        self.assertEqual(form.get_filtered_objects().count(), 0)
+
+    def test_category_filter_uses_source_index(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("Query plan is checked for SQLite")
+
+        form = EntryChoiceForm(args = {"category" : "News"})
+        plan = form.get_filtered_objects().explain()
+
+        self.assertIn("(source=?)", plan)
+        self.assertNotIn("SCAN rsshistory_rsssourceentrydatamodel\n", plan + "\n")
+
+
+class EntriesListQueriesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def create_entries(self, start, count):
+        source = RssSourceDataModel.objects.create(url = "https://source{0}.example.com/feed".format(start),
+                title = "Source {0}".format(start), category = "News", subcategory = "World")
+
+        for index in range(start, start + count):
+            link = "https://example.com/entry/{0}".format(index)
+            entry = RssSourceEntryDataModel.objects.create(source = source.url, title = "Entry {0}".format(index),
+                    description = "", link = link, source_obj = source)
+
+            RssEntryTagsDataModel.objects.create(link = link, author = "test", tag = "first", link_obj = entry)
+            RssEntryTagsDataModel.objects.create(link = link, author = "test", tag = "second", link_obj = entry)
+
+    def get_number_of_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('rsshistory:entries'))
+
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_number_of_queries_does_not_depend_on_rows(self):
+        self.create_entries(0, 5)
+        # first request creates objects, which are kept for the process
+        self.get_number_of_queries()
+
+        few_rows = self.get_number_of_queries()
+
+        self.create_entries(100, 150)
+        # new source invalidates filter facets
+        self.get_number_of_queries()
+        many_rows = self.get_number_of_queries()
+
+        self.assertEqual(few_rows, many_rows)
+
+    def test_tags_are_shown(self):
+        self.create_entries(0, 1)
+
+        response = self.client.get(reverse('rsshistory:entries'))
+        self.assertContains(response, "first,second")
+
+
+class SourceFacetsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+        for index in range(3):
+            source = RssSourceDataModel.objects.create(url = "https://source{0}.example.com/feed".format(index),
+                    title = "Source {0}".format(index), category = "News", subcategory = "World")
+            for entry_index in range(index + 1):
+                RssSourceEntryDataModel.objects.create(source = source.url, title = "Entry", description = "",
+                        link = "https://source{0}.example.com/{1}".format(index, entry_index), source_obj = source)
+
+        RssSourceDataModel.objects.create(url = "https://other.example.com/feed", title = "Other", category = "Tech", subcategory = "")
+
+    def get_choices(self, form_class, args, field):
+        form = form_class(args = args)
+        form.create()
+        return list(form.fields[field].widget.choices)
+
+    def test_choices_have_numbers_of_entries(self):
+        choices = self.get_choices(EntryChoiceForm, {}, 'category')
+        self.assertEqual(choices, [("Any", "Any"), ("News", "News (6)"), ("Tech", "Tech (0)")])
+
+        choices = self.get_choices(SourcesChoiceForm, {"category" : "Tech"}, 'subcategory')
+        self.assertEqual(choices, [("Any", "Any")])
+
+    def test_facets_are_computed_by_one_query(self):
+        from .facets import SourceFacets
+
+        with CaptureQueriesContext(connection) as context:
+            facets = SourceFacets.compute({})
+
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(facets['category'], [("News", 6), ("Tech", 0)])
+        self.assertEqual(facets['subcategory'], [("World", 6)])
+        self.assertEqual(facets['title'], [("Other", 0), ("Source 0", 1), ("Source 1", 2), ("Source 2", 3)])
+
+    def test_entries_without_source_object_are_counted(self):
+        from .facets import SourceFacets
+
+        RssSourceEntryDataModel.objects.create(source = "https://other.example.com/feed", title = "Entry", description = "",
+                link = "https://other.example.com/old")
+
+        facets = SourceFacets.compute({})
+
+        self.assertEqual(facets['category'], [("News", 6), ("Tech", 1)])
+        entries = EntryChoiceForm(args = {"category" : "Tech"}).get_filtered_objects()
+        self.assertEqual(entries.count(), 1)
+
+    def test_cached_form_does_not_query_sources(self):
+        self.get_choices(EntryChoiceForm, {"category" : "News"}, 'title')
+
+        with CaptureQueriesContext(connection) as context:
+            choices = self.get_choices(EntryChoiceForm, {"category" : "News"}, 'title')
+
+        self.assertEqual(len(choices), 4)
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_source_change_invalidates_facets(self):
+        self.get_choices(SourcesChoiceForm, {}, 'category')
+
+        RssSourceDataModel.objects.create(url = "https://new.example.com/feed", title = "New", category = "Science", subcategory = "")
+
+        choices = self.get_choices(SourcesChoiceForm, {}, 'category')
+        self.assertIn(("Science", "Science (0)"), choices)
+
+        RssSourceDataModel.objects.get(url = "https://new.example.com/feed").delete()
+
+        choices = self.get_choices(SourcesChoiceForm, {}, 'category')
+        self.assertNotIn(("Science", "Science (0)"), choices)
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        from .search import SearchBackend
+
+        self.backend = SearchBackend.get_object()
+        if self.backend is None:
+            self.skipTest("Database has no full text index")
+
+    def create_entry(self, source, index, title, description = ""):
+        return RssSourceEntryDataModel.objects.create(source = source.url, title = title, description = description,
+                link = "{0}/entry/{1}".format(source.url, index), source_obj = source)
+
+    def search(self, args):
+        return list(EntryChoiceForm(args = args).get_filtered_objects())
+
+    def test_filters_are_applied_before_candidates_are_limited(self):
+        news = RssSourceDataModel.objects.create(url = "https://news.example.com", title = "News", category = "News", subcategory = "World")
+        tech = RssSourceDataModel.objects.create(url = "https://tech.example.com", title = "Tech", category = "Tech", subcategory = "Software")
+
+        for index in range(2):
+            self.create_entry(tech, index, "python tips {0}".format(index))
+        # newer matches of other category
+        for index in range(10):
+            self.create_entry(news, index, "python news {0}".format(index))
+
+        with mock.patch.object(type(self.backend), "max_candidates", 5):
+            entries = self.search({"category" : "Tech", "search" : "python"})
+
+        self.assertEqual(sorted(entry.title for entry in entries), ["python tips 0", "python tips 1"])
+
+    def test_title_match_is_ranked_first(self):
+        source = RssSourceDataModel.objects.create(url = "https://news.example.com", title = "News", category = "News", subcategory = "World")
+        self.create_entry(source, 0, "Daily report", "weather for today")
+        self.create_entry(source, 1, "Weather", "")
+        self.create_entry(source, 2, "Football", "")
+
+        entries = self.search({"search" : "weather"})
+
+        self.assertEqual([entry.title for entry in entries], ["Weather", "Daily report"])
+
+    def test_index_follows_saves_and_deletes(self):
+        source = RssSourceDataModel.objects.create(url = "https://news.example.com", title = "News", category = "News", subcategory = "World")
+        entry = self.create_entry(source, 0, "Election results")
+        self.assertEqual(len(self.search({"search" : "election"})), 1)
+
+        entry.title = "Final results"
+        entry.save()
+        self.assertEqual(len(self.search({"search" : "election"})), 0)
+        self.assertEqual(len(self.search({"search" : "final"})), 1)
+
+        entry.delete()
+        self.assertEqual(len(self.search({"search" : "final"})), 0)
+
+    def test_removed_entries_are_removed_from_index_in_batch(self):
+        from datetime import timedelta
+        from .prjconfig import Configuration
+        from .dateutils import DateUtils
+
+        config = Configuration.get_object("rsshistory")
+        source = RssSourceDataModel.objects.create(url = "https://news.example.com", title = "News", category = "News",
+                subcategory = "World", remove_after_days = "7")
+        old_date = DateUtils.get_datetime_now_utc() - timedelta(days = 30)
+
+        def clear(count):
+            for index in range(count):
+                entry = self.create_entry(source, index, "Old report {0}".format(index))
+                RssSourceEntryDataModel.objects.filter(id = entry.id).update(date_published = old_date)
+
+            with CaptureQueriesContext(connection) as queries:
+                config.clear_old_entries()
+            return len(queries)
+
+        self.assertEqual(clear(5), clear(50))
+        self.assertEqual(len(self.search({"search" : "report"})), 0)
+
+    def test_source_entries_are_removed_from_index(self):
+        from .search import delete_sources
+
+        source = RssSourceDataModel.objects.create(url = "https://news.example.com", title = "News", category = "News", subcategory = "World")
+        for index in range(3):
+            self.create_entry(source, index, "Election results {0}".format(index))
+
+        delete_sources(RssSourceDataModel.objects.filter(id = source.id))
+
+        self.assertEqual(RssSourceEntryDataModel.objects.count(), 0)
+        self.assertEqual(self.backend.filter(RssSourceEntryDataModel.objects.all(), "election").count(), 0)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM {0}".format(self.backend.table))
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_removed_tags_are_not_searchable(self):
+        from django.contrib.auth.models import User
+        from .models import RssEntryTagsDataModel
+        from .search import update_entries
+
+        source = RssSourceDataModel.objects.create(url = "https://news.example.com", title = "News", category = "News", subcategory = "World")
+        entry = self.create_entry(source, 0, "Daily report")
+        RssEntryTagsDataModel.objects.create(link = entry.link, author = "admin", tag = "propaganda", link_obj = entry)
+        update_entries([entry.id])
+        self.assertEqual(len(self.search({"search" : "propaganda"})), 1)
+
+        self.client.force_login(User.objects.create_user("admin", is_staff = True))
+        self.client.get(reverse('rsshistory:entry-notstar', args = [entry.id]))
+
+        self.assertEqual(RssEntryTagsDataModel.objects.count(), 0)
+        self.assertEqual(len(self.search({"search" : "propaganda"})), 0)
+
+    def test_missing_index_table_is_checked_again(self):
+        from .search import SearchBackend
+
+        SearchBackend.reset()
+        self.addCleanup(SearchBackend.reset)
+
+        with mock.patch.object(connection.introspection, "table_names", return_value = []):
+            self.assertIsNone(SearchBackend.get_object())
+        self.assertIsNone(SearchBackend.get_object())
+
+        SearchBackend.obj_check_time -= SearchBackend.recheck_seconds
+        self.assertIsNotNone(SearchBackend.get_object())
+
+    def test_index_error_does_not_break_save(self):
+        source = RssSourceDataModel.objects.create(url = "https://news.example.com", title = "News", category = "News", subcategory = "World")
+
+        with mock.patch.object(type(self.backend), "update_entries", side_effect = IOError("index is broken")):
+            entry = self.create_entry(source, 0, "Election results")
+
+        self.assertTrue(RssSourceEntryDataModel.objects.filter(id = entry.id).exists())
+        self.assertTrue(PersistentInfo.objects.filter(info__contains = "index is broken").exists())
+
+
+class AsyncDownloaderTest(TestCase):
+
+    latency = 0.2
+
+    def setUp(self):
+        from .benchmarks.feedserver import FeedServer, FeedServerConfig
+
+        self.server = FeedServer(FeedServerConfig(entries_per_feed = 2, latency = self.latency)).start()
+        self.addCleanup(self.server.stop)
+
+    def get_urls(self, count):
+        return [self.server.get_url("/rss/{0}.xml".format(index)) for index in range(count)]
+
+    def test_requests_to_host_are_limited(self):
+        from .downloader import AsyncDownloader
+
+        responses = AsyncDownloader(max_connections = 10, max_per_host = 2).download(self.get_urls(6))
+
+        self.assertEqual(len(responses), 6)
+        self.assertTrue(all(response.is_valid() for response in responses.values()))
+        self.assertEqual(self.server.max_in_flight, 2)
+
+    def test_feeds_are_downloaded_concurrently(self):
+        from .downloader import AsyncDownloader
+
+        start = time.perf_counter()
+        responses = AsyncDownloader(max_connections = 10, max_per_host = 6).download(self.get_urls(6))
+        elapsed = time.perf_counter() - start
+
+        self.assertTrue(all(response.is_valid() for response in responses.values()))
+        self.assertLess(elapsed, 6 * self.latency / 2)
+
+    def test_event_loop_is_reused(self):
+        from .downloader import AsyncDownloader
+
+        downloader = AsyncDownloader(max_connections = 10, max_per_host = 2)
+        self.addCleanup(downloader.close)
+
+        downloader.download(self.get_urls(2))
+        loop = downloader.loop
+        executor = downloader.executor
+        responses = downloader.download(self.get_urls(4))
+
+        self.assertTrue(all(response.is_valid() for response in responses.values()))
+        self.assertIs(downloader.loop, loop)
+        self.assertIs(downloader.executor, executor)
+
+    def test_feed_is_same_and_not_modified_in_later_request(self):
+        from .downloader import AsyncDownloader
+
+        downloader = AsyncDownloader()
+        url = self.get_urls(1)[0]
+
+        first = downloader.fetch_blocking(url)
+        with mock.patch("time.time", return_value = 0):
+            second = downloader.fetch_blocking(url)
+        not_modified = downloader.fetch_blocking(url, {"If-None-Match" : first.get_etag()})
+        not_modified_since = downloader.fetch_blocking(url, {"If-Modified-Since" : first.get_last_modified()})
+
+        self.assertEqual(first.contents, second.contents)
+        self.assertTrue(not_modified.is_not_modified())
+        self.assertTrue(not_modified_since.is_not_modified())
+
+    def test_worker_downloads_feeds_of_its_batch(self):
+        from .prjconfig import Configuration
+        from .rssarchive import RssArchive
+        from .fetchstats import FetchStats
+
+        sources = []
+        for url in self.get_urls(3):
+            sources.append(RssSourceDataModel.objects.create(url = url, title = url, category = "News", subcategory = "World"))
+
+        c = Configuration.get_object("rsshistory")
+        c.download_rss_sources(sources)
+
+        self.assertEqual(self.server.requests, 3)
+        self.assertTrue(all(source._download_response.is_valid() for source in sources))
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        with mock.patch.object(c, "rss_archive", RssArchive(directory.name)):
+            stats = FetchStats()
+            c.t_process_rss_source(sources[0], stats)
+
+        # downloaded feed is used, it is not requested again
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(stats.num_new_entries, 2)
+
+
+class RecordingConfig(object):
+    """ Configuration of test threads, records processed items """
+
+    def __init__(self, seconds = 0):
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.processed = []
+        self.threads = set()
+        self.batches = []
+
+    def t_prepare_items(self, thread, items):
+        with self.lock:
+            self.batches.append(list(items))
+
+    def t_process_item(self, thread, item):
+        time.sleep(self.seconds)
+        with self.lock:
+            self.processed.append(item)
+            self.threads.add(threading.current_thread().name)
+
+
+def wait_for(condition, timeout = 10):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+class WorkerPoolTest(TestCase):
+
+    def start_workers(self, queue, config, count, batch_size = 1):
+        from .threads import ThreadJobCommon
+
+        workers = []
+        for worker_id in range(count):
+            worker = ThreadJobCommon("process-source", 0.01, queue = queue, worker_id = worker_id, batch_size = batch_size)
+            worker.set_config(config)
+            workers.append(worker)
+
+        for worker in workers:
+            worker.start()
+            self.addCleanup(worker.close)
+        return workers
+
+    def test_workers_share_queue(self):
+        from .threads import ThreadJobQueue
+
+        queue = ThreadJobQueue()
+        for item in range(20):
+            queue.put(item)
+
+        config = RecordingConfig(seconds = 0.02)
+        workers = self.start_workers(queue, config, 4)
+
+        self.assertTrue(wait_for(lambda: len(config.processed) == 20))
+        self.assertEqual(sorted(config.processed), list(range(20)))
+        self.assertGreater(len(config.threads), 1)
+        self.assertTrue(wait_for(lambda: queue.get_processed_count() == 20))
+        self.assertEqual(sum(worker.get_processed_count() for worker in workers), 20)
+
+    def test_stopped_worker_releases_rest_of_batch(self):
+        from .threads import ThreadJobCommon, ThreadJobQueue
+
+        queue = ThreadJobQueue()
+        for item in range(5):
+            queue.put(item)
+
+        worker = ThreadJobCommon("process-source", queue = queue, batch_size = 5)
+
+        class StoppingConfig(RecordingConfig):
+            def t_process_item(self, thread, item):
+                super().t_process_item(thread, item)
+                worker.close()
+
+        config = StoppingConfig()
+        worker.set_config(config)
+        worker.handle_process_item()
+
+        self.assertEqual(config.processed, [0])
+        self.assertEqual(queue.get_items(), [1, 2, 3, 4])
+
+    def test_worker_takes_items_in_batches(self):
+        from .threads import ThreadJobQueue
+
+        queue = ThreadJobQueue()
+        for item in range(5):
+            queue.put(item)
+
+        config = RecordingConfig()
+        self.start_workers(queue, config, 1, batch_size = 3)
+
+        self.assertTrue(wait_for(lambda: len(config.processed) == 5))
+        self.assertEqual(config.batches, [[0, 1, 2], [3, 4]])
+
+    def test_failed_item_does_not_stop_worker(self):
+        from .threads import ThreadJobQueue
+
+        class FailingConfig(RecordingConfig):
+            def t_process_item(self, thread, item):
+                if item == 1:
+                    raise IOError("cannot process")
+                super().t_process_item(thread, item)
+
+        queue = ThreadJobQueue()
+        for item in range(3):
+            queue.put(item)
+
+        config = FailingConfig()
+        self.start_workers(queue, config, 1)
+
+        self.assertTrue(wait_for(lambda: queue.get_processed_count() == 3))
+        self.assertEqual(config.processed, [0, 2])
+
+
+class LocalServer(object):
+    """
+    HTTP server with responses of a test. Route is a tuple (status, headers, body), or a function
+    of request headers which returns it. Body is sent in chunks, if headers have Transfer-Encoding.
+    """
+
+    def __init__(self):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        self.routes = {}
+        self.requests = []
+        self.connections = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                server.connections += 1
+                super().setup()
+
+            def do_GET(self):
+                server.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        # clients close connections of responses which are too big
+        self.httpd.handle_error = lambda request, client_address: None
+        threading.Thread(target = self.httpd.serve_forever, args = (0.05,), daemon = True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def get_url(self, path):
+        host, port = self.httpd.server_address[:2]
+        return "http://{0}:{1}{2}".format(host, port, path)
+
+    def add(self, path, body, status = 200, headers = None):
+        self.routes[path] = (status, headers or {}, body)
+
+    def get_requests(self, path):
+        return [headers for request_path, headers in self.requests if request_path == path]
+
+    def handle(self, handler):
+        self.requests.append((handler.path, dict(handler.headers)))
+
+        route = self.routes.get(handler.path, (404, {}, b"Not found"))
+        if callable(route):
+            route = route(handler.headers)
+        status, headers, body = route
+
+        handler.send_response(status)
+        for name in headers:
+            handler.send_header(name, headers[name])
+
+        if headers.get("Transfer-Encoding") == "chunked":
+            handler.end_headers()
+            for start in range(0, len(body), 10):
+                chunk = body[start:start + 10]
+                handler.wfile.write("{0:x}\r\n".format(len(chunk)).encode("ascii") + chunk + b"\r\n")
+            handler.wfile.write(b"0\r\n\r\n")
+        else:
+            handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+
+
+RSS_FEED = (b'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>Feed</title><link>https://example.com</link>'
+            b'<item><title>First</title><link>https://example.com/first</link><description>First entry</description></item>'
+            b'<item><title>Second</title><link>https://example.com/second</link><description>Second entry</description></item>'
+            b'</channel></rss>')
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        from .prjconfig import Configuration
+        from .rssarchive import RssArchive
+
+        self.server = LocalServer()
+        self.addCleanup(self.server.stop)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.config = Configuration.get_object("rsshistory")
+        patcher = mock.patch.object(self.config, "rss_archive", RssArchive(directory.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_source(self, path):
+        return RssSourceDataModel.objects.create(url = self.server.get_url(path), title = "Feed", category = "News", subcategory = "World")
+
+    def fetch(self, source):
+        from .fetchstats import FetchStats
+
+        stats = FetchStats()
+        self.config.t_process_rss_source(RssSourceDataModel.objects.get(id = source.id), stats)
+        return stats
+
+    def test_not_modified_feed_is_not_parsed(self):
+        def feed(headers):
+            if headers.get("If-None-Match") == '"v1"':
+                return (304, {"ETag" : '"v1"'}, b"")
+            return (200, {"ETag" : '"v1"', "Content-Type" : "application/rss+xml"}, RSS_FEED)
+
+        self.server.routes["/feed.xml"] = feed
+        source = self.create_source("/feed.xml")
+
+        self.assertEqual(self.fetch(source).num_new_entries, 2)
+
+        stats = self.fetch(source)
+        self.assertEqual(stats.num_entries, 0)
+        self.assertEqual(self.server.get_requests("/feed.xml")[1].get("If-None-Match"), '"v1"')
+
+    def test_unchanged_body_is_not_parsed(self):
+        self.server.add("/feed.xml", RSS_FEED, headers = {"Content-Type" : "application/rss+xml"})
+        source = self.create_source("/feed.xml")
+
+        self.assertEqual(self.fetch(source).num_entries, 2)
+        self.assertEqual(self.fetch(source).num_entries, 0)
+        self.assertEqual(RssSourceEntryDataModel.objects.count(), 2)
+
+
+class FeedEntriesInsertTest(TestCase):
+
+    def setUp(self):
+        from .prjconfig import Configuration
+
+        self.config = Configuration.get_object("rsshistory")
+        self.source = RssSourceDataModel.objects.create(url = "https://news.example.com/feed", title = "News", category = "News", subcategory = "World")
+
+    def get_feed_entries(self, count):
+        import feedparser
+
+        items = []
+        for index in range(count):
+            items.append("<item><title>Entry {0}</title><link>https://news.example.com/{0}</link><description>Text</description></item>".format(index))
+        # the same link twice in a feed
+        items.append("<item><title>Entry 0</title><link>https://news.example.com/0</link><description>Text</description></item>")
+
+        return feedparser.parse("<rss version='2.0'><channel><title>News</title>{0}</channel></rss>".format("".join(items))).entries
+
+    def process(self, count):
+        from .fetchstats import FetchStats
+
+        stats = FetchStats()
+        with CaptureQueriesContext(connection) as context:
+            self.config.process_rss_entries(self.source, self.get_feed_entries(count), stats)
+        return stats, len(context.captured_queries)
+
+    def test_new_entries_are_counted(self):
+        RssSourceEntryDataModel.objects.create(source = self.source.url, title = "Entry 1", description = "", link = "https://news.example.com/1")
+
+        stats, queries = self.process(5)
+
+        self.assertEqual(stats.num_new_entries, 4)
+        self.assertEqual(stats.num_duplicate_entries, 1)
+        self.assertEqual(RssSourceEntryDataModel.objects.filter(source = self.source.url).count(), 5)
+        self.assertEqual(RssSourceEntryDataModel.objects.filter(source_obj = self.source).count(), 4)
+
+    def test_number_of_queries_does_not_depend_on_entries(self):
+        # the first call checks search index
+        self.process(1)
+
+        RssSourceEntryDataModel.objects.all().delete()
+        few_queries = self.process(5)[1]
+
+        RssSourceEntryDataModel.objects.all().delete()
+        # bulk insert of SQLite is split in batches by number of parameters
+        many_queries = self.process(50)[1]
+
+        self.assertEqual(few_queries, many_queries)
+
+
+class SourceSchedulerTest(TestCase):
+
+    def setUp(self):
+        from .scheduler import SourceScheduler
+
+        self.scheduler = SourceScheduler()
+        self.source = RssSourceDataModel.objects.create(url = "https://news.example.com/feed", title = "News", category = "News", subcategory = "World")
+
+    def add_entries(self, count, minutes = 60):
+        from datetime import timedelta
+        from .dateutils import DateUtils
+
+        now = DateUtils.get_datetime_now_utc()
+        entries = []
+        for index in range(count):
+            entries.append(RssSourceEntryDataModel(source = self.source.url, title = "Entry", description = "",
+                    link = "https://news.example.com/{0}".format(index), date_published = now - timedelta(minutes = index * minutes)))
+        RssSourceEntryDataModel.objects.bulk_create(entries)
+
+    def test_interval_follows_publishing_rate(self):
+        # 14 entries in 7 days is one in 12 hours, source is fetched twice as often
+        self.add_entries(14)
+        self.assertEqual(self.scheduler.get_interval_minutes(self.source, 1), 6 * 60)
+
+    def test_interval_is_limited(self):
+        self.source.set_schedule(None, 1200, 0)
+        self.assertEqual(self.scheduler.get_interval_minutes(self.source, 0), self.scheduler.max_interval_minutes)
+
+        self.add_entries(2000, minutes = 1)
+        self.assertEqual(self.scheduler.get_interval_minutes(self.source, 1), self.scheduler.min_interval_minutes)
+
+    def test_quiet_source_backs_off(self):
+        self.add_entries(14)
+        self.source.set_schedule(None, 400, 0)
+
+        self.assertEqual(self.scheduler.get_interval_minutes(self.source, 0), 600)
+        self.assertEqual(self.scheduler.get_interval_minutes(self.source, 3), 6 * 60)
+
+    def test_failing_source_backs_off(self):
+        intervals = []
+        for attempt in range(10):
+            self.scheduler.fetch_failed(self.source)
+            intervals.append(self.source.get_fetch_interval())
+
+        self.assertEqual(intervals[:3], [20, 40, 80])
+        self.assertEqual(intervals[-1], self.scheduler.max_interval_minutes)
+        self.assertEqual(self.source.get_consecutive_errors(), 10)
+
+        self.scheduler.fetch_done(self.source, 1)
+        self.assertEqual(self.source.get_consecutive_errors(), 0)
+
+    def test_failed_job_is_retried_when_source_is_due(self):
+        from .jobqueue import DbJobQueue
+        from .models import BackgroundJob
+
+        queue = DbJobQueue("test-job", RssSourceDataModel, self.scheduler.get_retry_date)
+        queue.put(self.source)
+
+        source = queue.get()
+        self.scheduler.fetch_failed(source)
+        queue.failed(source, IOError("cannot download"))
+
+        job = BackgroundJob.objects.get(job = "test-job", key = str(self.source.id))
+        self.assertEqual(job.date_available, source.get_date_next_fetch())
+        self.assertIsNone(queue.get())
+
+    def test_source_is_due(self):
+        from datetime import timedelta
+        from .dateutils import DateUtils
+
+        self.assertTrue(self.scheduler.is_due(self.source))
+
+        self.scheduler.fetch_done(self.source, 1)
+        self.assertFalse(self.scheduler.is_due(self.source))
+
+        self.source.set_schedule(DateUtils.get_datetime_now_utc() - timedelta(minutes = 1), 10, 0)
+        self.assertTrue(self.scheduler.is_due(self.source))
+
+
+class PriorityQueueTest(TestCase):
+
+    class Item(object):
+        def __init__(self, id):
+            self.id = id
+
+    def test_items_are_not_duplicated(self):
+        from .threads import ThreadJobQueue
+
+        queue = ThreadJobQueue()
+        queue.put(self.Item(1))
+        queue.put(self.Item(2))
+        queue.put(self.Item(1))
+
+        self.assertEqual(queue.size(), 2)
+        self.assertEqual([item.id for item in queue.get_items()], [1, 2])
+
+    def test_higher_priority_is_first(self):
+        from .threads import ThreadJobQueue
+
+        queue = ThreadJobQueue()
+        for id in range(3):
+            queue.put(self.Item(id))
+        queue.put(self.Item(3), ThreadJobQueue.PRIORITY_HIGH)
+        # priority of queued item is raised
+        queue.put(self.Item(2), ThreadJobQueue.PRIORITY_HIGH)
+
+        ids = []
+        while queue.size() > 0:
+            ids.append(queue.get().id)
+
+        self.assertEqual(ids, [3, 2, 0, 1])
+        self.assertIsNone(queue.get())
+
+    def test_manual_refresh_is_processed_before_scheduled(self):
+        from .prjconfig import Configuration
+
+        sources = []
+        for index in range(3):
+            sources.append(RssSourceDataModel.objects.create(url = "https://source{0}.example.com/feed".format(index),
+                    title = "Source {0}".format(index), category = "News", subcategory = "World"))
+
+        c = Configuration.get_object("rsshistory")
+        c.t_refresh(None)
+        self.assertEqual(c.get_source_queue_size(), 3)
+
+        c.download_rss(sources[2], True)
+        self.assertEqual(c.get_source_queue_size(), 3)
+
+        self.assertEqual(c.source_queue.get(), sources[2])
+
+
+class DbJobQueueTest(TestCase):
+
+    def setUp(self):
+        self.sources = []
+        for index in range(3):
+            self.sources.append(RssSourceDataModel.objects.create(url = "https://source{0}.example.com/feed".format(index),
+                    title = "Source {0}".format(index), category = "News", subcategory = "World"))
+
+    def get_queue(self, retry_policy = None):
+        from .jobqueue import DbJobQueue
+        return DbJobQueue("test-job", RssSourceDataModel, retry_policy)
+
+    def get_job(self, source):
+        from .models import BackgroundJob
+        return BackgroundJob.objects.get(job = "test-job", key = str(source.id))
+
+    def move_time(self, source, **fields):
+        """ Sets dates of job to the past """
+        from datetime import timedelta
+        from .models import BackgroundJob
+        from .dateutils import DateUtils
+
+        past = DateUtils.get_datetime_now_utc() - timedelta(seconds = 1)
+        BackgroundJob.objects.filter(job = "test-job", key = str(source.id)).update(**{field : past for field in fields})
+
+    def test_job_is_not_duplicated(self):
+        from django.db import IntegrityError, transaction
+        from .models import BackgroundJob
+
+        queue = self.get_queue()
+        queue.put(self.sources[0])
+        queue.put(self.sources[0])
+        self.assertEqual(queue.size(), 1)
+
+        # other process cannot insert the same job
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                BackgroundJob.objects.create(job = "test-job", key = str(self.sources[0].id))
+
+        # job being processed is not added again
+        self.assertEqual(queue.get(), self.sources[0])
+        queue.put(self.sources[0])
+        self.assertEqual(queue.size(), 1)
+
+        queue.done(self.sources[0])
+        self.assertEqual(queue.size(), 0)
+
+    def test_jobs_are_added_in_batch(self):
+        from .threads import ThreadJobQueue
+
+        queue = self.get_queue()
+        queue.put(self.sources[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            queue.put_many(self.sources, ThreadJobQueue.PRIORITY_HIGH)
+
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(queue.size(), 3)
+        self.assertEqual(self.get_job(self.sources[0]).priority, ThreadJobQueue.PRIORITY_HIGH)
+
+    def test_expired_lease_is_taken_by_other_worker(self):
+        queue = self.get_queue()
+        queue.put(self.sources[0])
+        self.assertEqual(queue.get(), self.sources[0])
+
+        other_queue = self.get_queue()
+        self.assertIsNone(other_queue.get())
+
+        self.move_time(self.sources[0], lease_until = True)
+        self.assertEqual(other_queue.get(), self.sources[0])
+        self.assertEqual(self.get_job(self.sources[0]).attempts, 1)
+
+    def test_expired_lease_counts_as_attempt(self):
+        from .models import BackgroundJob
+
+        queue = self.get_queue()
+        queue.put(self.sources[0])
+
+        for attempt in range(queue.max_attempts):
+            self.assertEqual(queue.get(), self.sources[0])
+            self.move_time(self.sources[0], lease_until = True)
+
+        # worker crashes every time, job is not retried forever
+        self.assertIsNone(queue.get())
+        self.assertEqual(self.get_job(self.sources[0]).status, BackgroundJob.STATUS_DEAD)
+
+    def test_released_job_does_not_count_as_attempt(self):
+        from .models import BackgroundJob
+
+        queue = self.get_queue()
+        queue.put(self.sources[0])
+        queue.put(self.sources[1])
+
+        self.assertEqual(queue.get(), self.sources[0])
+        self.assertEqual(queue.get(), self.sources[1])
+        queue.release(self.sources[0])
+        self.assertEqual(queue.release_leased(), 1)
+
+        for source in self.sources[:2]:
+            job = self.get_job(source)
+            self.assertEqual(job.status, BackgroundJob.STATUS_PENDING)
+            self.assertEqual(job.attempts, 0)
+            self.assertIsNone(job.lease_owner)
+
+        other_queue = self.get_queue()
+        self.assertEqual(other_queue.get(), self.sources[0])
+        self.assertEqual(other_queue.get(), self.sources[1])
+
+    def test_failed_job_is_retried_by_policy(self):
+        from datetime import timedelta
+        from .dateutils import DateUtils
+
+        retry_date = DateUtils.get_datetime_now_utc() + timedelta(minutes = 20)
+        queue = self.get_queue(lambda item, attempts: retry_date)
+        queue.put(self.sources[0])
+
+        queue.failed(queue.get(), IOError("cannot download"))
+
+        job = self.get_job(self.sources[0])
+        self.assertEqual(job.date_available, retry_date)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.last_error, "cannot download")
+        self.assertIsNone(queue.get())
+
+        self.move_time(self.sources[0], date_available = True)
+        self.assertEqual(queue.get(), self.sources[0])
+
+    def test_dead_job_is_not_queued_again(self):
+        from .models import BackgroundJob
+        from .threads import ThreadJobQueue
+
+        queue = self.get_queue()
+        queue.put(self.sources[0])
+        for attempt in range(queue.max_attempts):
+            queue.failed(queue.get(), IOError("cannot download"))
+
+        self.assertEqual(self.get_job(self.sources[0]).status, BackgroundJob.STATUS_DEAD)
+        self.assertEqual(queue.get_dead_count(), 1)
+
+        # scheduled fetch does not add it
+        queue.put(self.sources[0])
+        self.assertEqual(queue.size(), 0)
+        self.assertIsNone(queue.get())
+
+        # user does
+        queue.put(self.sources[0], ThreadJobQueue.PRIORITY_HIGH)
+        self.assertEqual(queue.get(), self.sources[0])
+        self.assertEqual(self.get_job(self.sources[0]).attempts, 0)
+
+    def test_old_dead_jobs_are_removed(self):
+        from datetime import timedelta
+        from .models import BackgroundJob
+        from .dateutils import DateUtils
+
+        queue = self.get_queue()
+        for source in self.sources:
+            queue.put(source)
+        BackgroundJob.objects.filter(job = "test-job").update(status = BackgroundJob.STATUS_DEAD, date_dead = DateUtils.get_datetime_now_utc())
+
+        old = DateUtils.get_datetime_now_utc() - timedelta(days = queue.dead_retention_days + 1)
+        BackgroundJob.objects.filter(key = str(self.sources[0].id)).update(date_dead = old)
+
+        self.assertEqual(queue.remove_dead(), 1)
+        self.assertEqual(queue.get_dead_count(), 2)
+
+        queue.put(self.sources[0])
+        self.assertEqual(queue.get(), self.sources[0])
+
+    def test_source_page_does_not_queue_source(self):
+        from .models import BackgroundJob
+
+        response = self.client.get(reverse('rsshistory:source-detail', args = [self.sources[0].id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(BackgroundJob.objects.count(), 0)
+
+
+class HttpClientTest(TestCase):
+
+    def setUp(self):
+        from .httpclient import HttpClient
+
+        self.server = LocalServer()
+        self.addCleanup(self.server.stop)
+
+        self.client_http = HttpClient(max_size = 1000)
+        self.addCleanup(self.client_http.close)
+
+    def get(self, path, headers = None):
+        return self.client_http.get(self.server.get_url(path), headers)
+
+    def test_compressed_response_is_decoded(self):
+        import gzip
+        import zlib
+
+        body = b"<html><title>Page</title></html>" * 10
+        self.server.add("/gzip", gzip.compress(body), headers = {"Content-Encoding" : "gzip"})
+        self.server.add("/deflate", zlib.compress(body), headers = {"Content-Encoding" : "deflate"})
+
+        gzip_response = self.get("/gzip")
+        self.assertEqual(gzip_response.contents, body)
+        self.assertLess(gzip_response.bytes_transferred, len(body))
+        self.assertIn("gzip", self.server.get_requests("/gzip")[0]["Accept-Encoding"])
+
+        self.assertEqual(self.get("/deflate").contents, body)
+
+    def test_chunked_response(self):
+        body = b"chunked body of a page"
+        self.server.add("/chunked", body, headers = {"Transfer-Encoding" : "chunked"})
+
+        response = self.get("/chunked")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.contents, body)
+
+    def test_not_modified_response(self):
+        self.server.add("/feed", b"", status = 304, headers = {"ETag" : '"v1"'})
+
+        response = self.get("/feed", {"If-None-Match" : '"v1"'})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.contents, b"")
+        self.assertEqual(self.server.get_requests("/feed")[0]["If-None-Match"], '"v1"')
+
+    def test_redirects_are_followed(self):
+        self.server.add("/old", b"", status = 301, headers = {"Location" : "/new"})
+        self.server.add("/new", b"new page")
+        self.server.add("/loop", b"", status = 302, headers = {"Location" : "/loop"})
+
+        response = self.get("/old")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.contents, b"new page")
+        self.assertEqual(response.url, self.server.get_url("/new"))
+
+        with self.assertRaises(IOError):
+            self.get("/loop")
+
+    def test_size_is_limited(self):
+        import gzip
+
+        self.server.add("/big", b"x" * 2000)
+        # small transfer, big after decompression
+        self.server.add("/bomb", gzip.compress(b"x" * 100000), headers = {"Content-Encoding" : "gzip"})
+        self.server.add("/big-chunked", b"x" * 2000, headers = {"Transfer-Encoding" : "chunked"})
+
+        for path in ["/big", "/bomb", "/big-chunked"]:
+            with self.assertRaises(IOError):
+                self.get(path)
+
+    def test_connection_is_reused(self):
+        self.server.add("/page", b"page")
+
+        self.get("/page")
+        self.get("/page")
+
+        self.assertEqual(len(self.server.get_requests("/page")), 2)
+        self.assertEqual(self.server.connections, 1)
+
+
+class PluginBuilderTest(TestCase):
+
+    def test_plugins_are_shared(self):
+        from .sources.basepluginbuilder import BasePluginBuilder
+        from .sources.codeprojectplugin import CodeProjectPlugin
+
+        plugin = BasePluginBuilder.get("https://www.codeproject.com")
+        self.assertIsInstance(plugin, CodeProjectPlugin)
+        self.assertIs(BasePluginBuilder.get("https://www.codeproject.com"), plugin)
+
+    def test_plugin_is_created_on_first_use(self):
+        from .sources.basepluginbuilder import BasePluginBuilder
+
+        BasePluginBuilder.instances.pop("tvn24plugin.TVN24Plugin", None)
+        BasePluginBuilder.get("https://www.codeproject.com")
+        self.assertNotIn("tvn24plugin.TVN24Plugin", BasePluginBuilder.instances)
+
+        plugin = BasePluginBuilder.get("https://tvn24.pl")
+        self.assertEqual(plugin.get_address(), "https://tvn24.pl")
+        self.assertIs(BasePluginBuilder.instances["tvn24plugin.TVN24Plugin"], plugin)
+
+    def test_plugin_does_not_keep_page_contents(self):
+        from .sources.basepluginbuilder import BasePluginBuilder
+
+        server = LocalServer()
+        self.addCleanup(server.stop)
+        server.add("/", b'<html><a href="/one">1</a></html>', headers = {"Content-Type" : "text/html"})
+
+        plugin = BasePluginBuilder.get("https://unknown.example.com")
+        with mock.patch.object(plugin, "get_address", return_value = server.get_url("")):
+            self.assertEqual(plugin.get_links(), {server.get_url("/one")})
+
+        self.assertFalse(hasattr(plugin, "contents"))
+
+    def test_unknown_domain_has_default_plugin(self):
+        from .sources.basepluginbuilder import BasePluginBuilder
+        from .sources.baseplugin import BasePlugin
+
+        plugin = BasePluginBuilder.get("https://unknown.example.com")
+        self.assertIs(type(plugin), BasePlugin)
+        self.assertIs(BasePluginBuilder.get("https://other.example.com"), plugin)
+        self.assertTrue(plugin.is_rss_source())
+
+
+class ParserSourceTest(TestCase):
+
+    def setUp(self):
+        from .prjconfig import Configuration
+        from .webtools import PageCache
+        from .sources.baseplugin import BasePlugin
+        from .sources.basepluginbuilder import BasePluginBuilder
+
+        self.server = LocalServer()
+        self.addCleanup(self.server.stop)
+
+        PageCache.get_object().clear()
+        self.addCleanup(PageCache.get_object().clear)
+
+        address = self.server.get_url("")
+
+        class ParserPlugin(BasePlugin):
+            def get_address(self):
+                return address
+
+            def get_processing_type(self):
+                return "parsing"
+
+            def is_link_valid(self, link):
+                return self.is_link_valid_domain(link)
+
+        self.plugin = ParserPlugin()
+        patcher = mock.patch.dict(BasePluginBuilder.get_registry(), {address : self.plugin})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.config = Configuration.get_object("rsshistory")
+        self.source = RssSourceDataModel.objects.create(url = address + "/", title = "Site", category = "News", subcategory = "World")
+
+    def add_page(self, path, title, links = ()):
+        body = "<html><head><title>{0}</title></head><body>{1}</body></html>".format(
+                title, "".join('<a href="{0}">link</a>'.format(link) for link in links))
+        self.server.add(path, body.encode("utf-8"), headers = {"Content-Type" : "text/html; charset=utf-8"})
+
+    def process(self):
+        from .fetchstats import FetchStats
+
+        stats = FetchStats()
+        self.config.t_process_parser_source(self.source, stats)
+        return stats
+
+    def test_new_links_are_downloaded_once(self):
+        self.add_page("/", "Main", ["/a", "/b", "/c", "https://other.example.com/d"])
+        for path in ["/a", "/b", "/c"]:
+            self.add_page(path, "Page " + path)
+
+        RssSourceEntryDataModel.objects.create(source = self.source.url, title = "Page /a", description = "", link = self.server.get_url("/a"))
+
+        stats = self.process()
+
+        self.assertEqual(stats.num_entries, 3)
+        self.assertEqual(stats.num_duplicate_entries, 1)
+        self.assertEqual(stats.num_new_entries, 2)
+
+        titles = RssSourceEntryDataModel.objects.filter(source_obj = self.source).values_list('title', flat = True)
+        self.assertEqual(sorted(titles), ["Page /b", "Page /c"])
+
+        self.assertEqual(len(self.server.get_requests("/a")), 0)
+        self.assertEqual(len(self.server.get_requests("/b")), 1)
+        self.assertEqual(len(self.server.get_requests("/")), 1)
+
+    def test_transfer_is_measured_by_responses(self):
+        self.add_page("/", "Main", ["/a"])
+        self.server.add("/a", b"<html><title>A</title></html>", headers = {"Content-Type" : "text/html"})
+
+        stats = self.process()
+
+        main_size = len(self.server.routes["/"][2])
+        self.assertEqual(stats.bytes_transferred, main_size + 29)
+        self.assertEqual(stats.num_cached_pages, 0)
+        self.assertGreater(stats.get_seconds("connect"), 0)
+        self.assertGreater(stats.get_seconds("download"), 0)
+
+        # second fetch reads the main page from cache
+        stats = self.process()
+
+        self.assertEqual(stats.bytes_transferred, 0)
+        self.assertEqual(stats.num_cached_pages, 1)
+
+    def test_crawled_source_is_processed_by_crawl_thread(self):
+        from django.test import override_settings
+
+        self.add_page("/", "Main", ["/category"])
+        self.add_page("/category", "Category", ["/article"])
+        self.add_page("/article", "Article")
+
+        queue = self.config.crawl_queue
+
+        with override_settings(RSSHISTORY_CRAWL_DEPTH = {self.plugin.get_address() : 1}):
+            self.config.t_process_item("process-source", self.source)
+
+            source = queue.get()
+            self.assertEqual(source, self.source)
+            self.assertEqual(len(self.server.get_requests("/")), 0)
+
+            # refresh during crawl does not queue it again
+            self.config.t_process_item("process-source", self.source)
+            self.assertEqual(queue.size(), 1)
+            self.assertIsNone(queue.get())
+
+            self.config.t_process_item("crawl-source", source)
+            queue.done(source)
+
+        self.assertEqual(queue.size(), 0)
+
+        titles = RssSourceEntryDataModel.objects.filter(source_obj = self.source).values_list('title', flat = True)
+        self.assertEqual(sorted(titles), ["Article", "Category"])
+
+
+class WebCrawlerTest(TestCase):
+
+    def setUp(self):
+        from .webtools import PageCache
+
+        self.server = LocalServer()
+        self.addCleanup(self.server.stop)
+
+        PageCache.get_object().clear()
+        self.addCleanup(PageCache.get_object().clear)
+
+    def add_page(self, path, links = ()):
+        body = "<html><head><title>{0}</title></head><body>{1}</body></html>".format(
+                path, "".join('<a href="{0}">link</a>'.format(link) for link in links))
+        self.server.add(path, body.encode("utf-8"), headers = {"Content-Type" : "text/html; charset=utf-8"})
+
+    def crawl(self, max_depth = 1, max_pages = 100, domain_delay = 0):
+        from .webcrawler import WebCrawler
+
+        crawler = WebCrawler(self.server.get_url("/"), max_depth, max_pages, 4, domain_delay)
+        crawler.link_filter = lambda link: link.startswith(self.server.get_url(""))
+
+        pages = {}
+        def on_page(url, page, depth):
+            pages[url[len(self.server.get_url("")):]] = depth
+
+        crawler.crawl(on_page)
+        return pages
+
+    def test_links_are_followed_to_max_depth(self):
+        self.add_page("/", ["/a"])
+        self.add_page("/a", ["/b"])
+        self.add_page("/b", ["/c"])
+        self.add_page("/c")
+
+        self.assertEqual(self.crawl(max_depth = 2), {"/" : 0, "/a" : 1, "/b" : 2})
+        self.assertEqual(len(self.server.get_requests("/c")), 0)
+
+    def test_page_is_downloaded_once(self):
+        self.add_page("/", ["/a", "/a#comments", "/b"])
+        self.add_page("/a", ["/", "/b"])
+        self.add_page("/b", ["/a"])
+
+        self.assertEqual(self.crawl(max_depth = 3), {"/" : 0, "/a" : 1, "/b" : 1})
+        for path in ["/", "/a", "/b"]:
+            self.assertEqual(len(self.server.get_requests(path)), 1)
+
+    def test_links_outside_of_domain_are_not_followed(self):
+        other = LocalServer()
+        self.addCleanup(other.stop)
+        other.add("/", b"<html><title>Other</title></html>", headers = {"Content-Type" : "text/html"})
+
+        self.add_page("/", ["/a", other.get_url("/")])
+        self.add_page("/a")
+
+        self.assertEqual(self.crawl(), {"/" : 0, "/a" : 1})
+        self.assertEqual(len(other.requests), 0)
+
+    def test_number_of_pages_is_limited(self):
+        links = ["/{0}".format(index) for index in range(10)]
+        self.add_page("/", links)
+        for link in links:
+            self.add_page(link)
+
+        self.assertEqual(len(self.crawl(max_pages = 4)), 4)
+
+    def test_requests_to_domain_are_delayed(self):
+        times = []
+        def route(headers):
+            times.append(time.monotonic())
+            return (200, {"Content-Type" : "text/html"}, b"<html><title>Page</title></html>")
+
+        self.add_page("/", ["/a", "/b"])
+        self.server.routes["/a"] = route
+        self.server.routes["/b"] = route
+
+        self.crawl(domain_delay = 0.2)
+
+        self.assertEqual(len(times), 2)
+        self.assertGreaterEqual(abs(times[1] - times[0]), 0.15)
+
+    def test_domains_are_downloaded_in_parallel(self):
+        from .webcrawler import WebCrawler
+
+        other = LocalServer()
+        self.addCleanup(other.stop)
+
+        times = {}
+        def get_route(name):
+            def route(headers):
+                times.setdefault(name, []).append(time.monotonic())
+                return (200, {"Content-Type" : "text/html"}, b"<html><title>Page</title></html>")
+            return route
+
+        self.add_page("/", ["/a1", "/a2", other.get_url("/b1"), other.get_url("/b2")])
+        for path in ["/a1", "/a2"]:
+            self.server.routes[path] = get_route("local")
+        for path in ["/b1", "/b2"]:
+            other.routes[path] = get_route("other")
+
+        crawler = WebCrawler(self.server.get_url("/"), 1, 100, 4, 0.3)
+        crawler.crawl(lambda url, page, depth: None)
+
+        self.assertEqual(len(times["local"]), 2)
+        self.assertEqual(len(times["other"]), 2)
+        # other domain does not wait for delays of the first one
+        self.assertLess(times["other"][0], times["local"][-1])
+
+
+class PageCacheTest(TestCase):
+
+    def get_directory(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return directory.name
+
+    def get_files(self, directory):
+        from pathlib import Path
+        return list(Path(directory).glob("*.txt"))
+
+    def test_least_recently_used_page_is_removed(self):
+        from .webtools import PageCache
+
+        cache = PageCache(max_entries = 2)
+        cache.set("https://example.com/a", "a")
+        cache.set("https://example.com/b", "b")
+        cache.get("https://example.com/a")
+        cache.set("https://example.com/c", "c")
+
+        self.assertEqual(cache.get("https://example.com/a"), "a")
+        self.assertIsNone(cache.get("https://example.com/b"))
+        # the same url after normalization
+        self.assertEqual(cache.get("HTTPS://Example.com:443/c#top"), "c")
+
+    def test_expired_page_is_not_returned(self):
+        from .webtools import PageCache
+
+        directory = self.get_directory()
+        cache = PageCache(ttl = 60, directory = directory)
+        cache.set("https://example.com/a", "a")
+
+        later = time.time() + 61
+        with mock.patch("rsshistory.webtools.time.time", return_value = later):
+            self.assertIsNone(cache.get("https://example.com/a"))
+
+        # expired file is removed when it is read
+        self.assertEqual(self.get_files(directory), [])
+
+    def test_disk_page_survives_restart(self):
+        from .webtools import PageCache
+
+        directory = self.get_directory()
+        PageCache(directory = directory).set("https://example.com/a", "a")
+
+        cache = PageCache(directory = directory)
+        self.assertEqual(cache.get("https://example.com/a"), "a")
+        self.assertEqual(cache.get_stats()["hits"], 1)
+
+    def test_disk_size_is_limited(self):
+        import os
+        from .webtools import PageCache
+
+        directory = self.get_directory()
+        cache = PageCache(directory = directory, max_disk_size = 250)
+
+        for index in range(5):
+            cache.set("https://example.com/{0}".format(index), "x" * 100)
+            # the oldest file is removed first
+            os.utime(cache.get_file_path(cache.normalize_url("https://example.com/{0}".format(index))), (index, time.time() - 10 + index))
+
+        cache.sweep()
+        cache.clear()
+
+        files = self.get_files(directory)
+        self.assertLessEqual(sum(file_path.stat().st_size for file_path in files), 250)
+        self.assertEqual(cache.get("https://example.com/4"), "x" * 100)
+        self.assertIsNone(cache.get("https://example.com/0"))
+
+    def test_sweep_removes_expired_files(self):
+        from .webtools import PageCache
+
+        directory = self.get_directory()
+        cache = PageCache(ttl = 60, directory = directory)
+        cache.set("https://example.com/a", "a")
+
+        with mock.patch("rsshistory.webtools.time.time", return_value = time.time() + 61):
+            cache.sweep()
+
+        self.assertEqual(self.get_files(directory), [])
+
+
+class RssArchiveTest(TestCase):
+
+    def setUp(self):
+        from .rssarchive import RssArchive
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive = RssArchive(directory.name)
+
+    def get_date(self, days_ago):
+        from datetime import timedelta
+        from .dateutils import DateUtils
+        return DateUtils.get_datetime_now_utc() - timedelta(days = days_ago)
+
+    def test_data_is_stored_once(self):
+        first = self.archive.store("feed", b"<rss>1</rss>", self.get_date(2))
+        self.archive.store("other", b"<rss>1</rss>", self.get_date(2))
+
+        self.assertEqual(self.archive.read(first), b"<rss>1</rss>")
+        self.assertEqual(len(list(self.archive.directory.glob("objects/*/*.gz"))), 1)
+
+    def test_unchanged_data_is_added_to_index(self):
+        from .rssarchive import RssArchive
+
+        dates = [self.get_date(days) for days in [3, 2, 1, 0]]
+        first = self.archive.store("feed", b"<rss>1</rss>", dates[0])
+        self.archive.store("feed", b"<rss>1</rss>", dates[1])
+        second = self.archive.store("feed", b"<rss>2</rss>", dates[2])
+        RssArchive(self.archive.directory).store("feed", b"<rss>2</rss>", dates[3])
+
+        history = self.archive.get_history("feed")
+        self.assertEqual([fetch["hash"] for fetch in history], [first, first, second, second])
+        self.assertEqual([fetch["date"] for fetch in history], [date.isoformat() for date in dates])
+        self.assertEqual(len(list(self.archive.directory.glob("objects/*/*.gz"))), 2)
+
+    def test_old_data_is_pruned(self):
+        import os
+
+        old_hash = self.archive.store("feed", b"<rss>old</rss>", self.get_date(10))
+        new_hash = self.archive.store("feed", b"<rss>new</rss>", self.get_date(1))
+        # the only fetch of a source is kept
+        quiet_hash = self.archive.store("quiet", b"<rss>quiet</rss>", self.get_date(10))
+
+        for body_hash in [old_hash, new_hash, quiet_hash]:
+            os.utime(self.archive.get_object_path(body_hash), (0, 0))
+
+        self.assertEqual(self.archive.prune(self.get_date(5)), 1)
+
+        self.assertIsNone(self.archive.read(old_hash))
+        self.assertEqual(self.archive.read(new_hash), b"<rss>new</rss>")
+        self.assertEqual(self.archive.read(quiet_hash), b"<rss>quiet</rss>")
+        self.assertEqual([fetch["hash"] for fetch in self.archive.get_history("feed")], [new_hash])
+
+
+class HtmlInfoTest(TestCase):
+
+    def test_links(self):
+        from .htmlinfo import parse_html
+
+        info = parse_html('<a href="/one">1</a><a title="a > b" href="/two">2</a>'
+                          '<a href=/three>3</a><a href="/one">again</a>')
+
+        self.assertEqual(info.links, ["/one", "/two", "/three"])
+
+    def test_comments_cdata_and_scripts_are_skipped(self):
+        from .htmlinfo import parse_html
+
+        info = parse_html('<!-- <a href="/commented"> --><![CDATA[<a href="/cdata">]]>'
+                          '<script>var s = "<a href=\'/script\'>";</script>'
+                          '<style>a[href="/style"] {}</style><a href="/visible">x</a>')
+
+        self.assertEqual(info.links, ["/visible"])
+
+    def test_page_properties(self):
+        from .htmlinfo import parse_html
+
+        info = parse_html('<html lang="pl"><head><title> A &amp; B </title>'
+                          '<meta name="description" content="Page description">'
+                          '<link rel="alternate" type="application/rss+xml" href="/feed" title="Feed">'
+                          '<link rel="stylesheet" type="text/css" href="/style.css">'
+                          '</head><body><title>Second</title></body></html>')
+
+        self.assertEqual(info.title, "A & B")
+        self.assertEqual(info.language, "pl")
+        self.assertEqual(info.description, "Page description")
+        self.assertEqual(info.feeds, [{"link" : "/feed", "type" : "application/rss+xml", "title" : "Feed"}])
+
+    def test_legacy_extractor_misses_links(self):
+        from .htmlinfo import parse_html
+        from .benchmarks.htmlbench import LegacyExtractor, create_page
+
+        page = ('<html lang="en"><body><!-- <a href="/commented">old</a> -->'
+                '<script>var s = \'<a href="/script">\';</script>'
+                '<a href="/plain">1</a><a class="link" href="/class">2</a>'
+                "<a href='/single'>3</a><a\nhref=\"/newline\">4</a></body></html>")
+        expected = {"/plain", "/class", "/single", "/newline"}
+
+        self.assertEqual(set(parse_html(page).links), expected)
+        self.assertNotEqual(LegacyExtractor().parse_a_hrefs(page), expected)
+        self.assertIn("/commented", LegacyExtractor().parse_a_hrefs(page))
+
+        page = create_page(30)
+        self.assertEqual(len(parse_html(page).links), 30)
+        self.assertEqual(len(LegacyExtractor().parse_a_hrefs(page)), 10)
+
+    def test_full_links(self):
+        from .htmlinfo import parse_full_links
+
+        links = parse_full_links('<script>var api = "https://api.example.com/v1";</script> https://example.com/text')
+
+        self.assertEqual(links, {"https://api.example.com/v1", "https://example.com/text"})
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        from .prjconfig import Configuration
+
+        self.config = Configuration.get_object("rsshistory")
+        self.config.last_queue_metrics = None
+
+    def test_histogram_is_rendered_with_cumulative_buckets(self):
+        from .metrics import Histogram
+
+        histogram = Histogram("test_seconds", "Test", ("stage",), buckets = (1, 5))
+        histogram.observe(0.5, stage = "parse")
+        histogram.observe(3, stage = "parse")
+
+        lines = histogram.render().splitlines()
+
+        self.assertIn('test_seconds_bucket{stage="parse",le="1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="parse",le="5"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="parse",le="+Inf"} 2', lines)
+        self.assertIn('test_seconds_sum{stage="parse"} 3.5', lines)
+        self.assertIn('test_seconds_count{stage="parse"} 2', lines)
+
+    def test_web_endpoint_does_not_publish_fetcher_metrics(self):
+        response = self.client.get(reverse('rsshistory:metrics'))
+        text = response.content.decode("utf-8")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("rsshistory_source_queue_depth", text)
+        self.assertIn("rsshistory_request_seconds", text)
+        self.assertNotIn("rsshistory_sources_processed_total", text)
+        self.assertNotIn("rsshistory_worker_alive", text)
+
+    def test_worker_server_publishes_fetcher_metrics(self):
+        import urllib.request
+        from . import metrics
+
+        server = metrics.MetricsServer(0, "127.0.0.1", self.config.update_metrics, (metrics.FETCHER, metrics.QUEUE)).start()
+        self.addCleanup(server.stop)
+
+        host, port = server.httpd.server_address[:2]
+        with urllib.request.urlopen("http://{0}:{1}/".format(host, port)) as response:
+            text = response.read().decode("utf-8")
+
+        self.assertIn("rsshistory_sources_processed_total", text)
+        self.assertIn("rsshistory_source_queue_depth", text)
+        self.assertNotIn("rsshistory_request_seconds", text)
+
+    def test_queue_gauges_are_counted_once_in_period(self):
+        self.config.update_queue_metrics()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.config.update_queue_metrics()
+        self.assertEqual(len(queries), 0)
+
+        self.config.last_queue_metrics -= self.config.queue_metrics_seconds
+        with CaptureQueriesContext(connection) as queries:
+            self.config.update_queue_metrics()
+        self.assertGreater(len(queries), 0)
+
+
+class DbLockTest(TestCase):
+
+    def get_lock(self, owner):
+        from .dblock import DbLock
+
+        lock = DbLock("test-lock")
+        lock.owner = owner
+        return lock
+
+    def test_lock_is_held_by_one_owner(self):
+        first = self.get_lock("host:1")
+        second = self.get_lock("host:2")
+
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        self.assertTrue(first.is_held())
+        self.assertFalse(second.is_held())
+
+        # owner refreshes its lock
+        self.assertTrue(first.acquire())
+        self.assertEqual(first.get_lock().owner, "host:1")
+
+    def test_released_lock_is_taken(self):
+        first = self.get_lock("host:1")
+        second = self.get_lock("host:2")
+
+        first.acquire()
+        first.release()
+
+        self.assertFalse(first.is_held())
+        self.assertTrue(second.acquire())
+
+    def test_expired_lock_is_taken(self):
+        from datetime import timedelta
+        from .models import ProcessLock
+        from .dateutils import DateUtils
+
+        first = self.get_lock("host:1")
+        second = self.get_lock("host:2")
+        first.acquire()
+
+        # owner stopped refreshing the lock
+        ProcessLock.objects.filter(name = "test-lock").update(lock_until = DateUtils.get_datetime_now_utc() - timedelta(seconds = 1))
+
+        self.assertTrue(second.acquire())
+        self.assertFalse(first.acquire())
+        self.assertEqual(second.get_lock().owner, "host:2")
+
+
+class OperationalDataTest(TestCase):
+
+    def setUp(self):
+        self.source = RssSourceDataModel.objects.create(url = "https://example.com/feed", title = "Source", category = "News", subcategory = "World")
+
+    def test_missing_data_are_looked_for_once(self):
+        source = RssSourceDataModel.objects.get(id = self.source.id)
+        self.assertIsNone(source.get_date_fetched())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(source.get_date_fetched())
+            self.assertIsNone(source.get_fetch_interval())
+        self.assertEqual(len(queries), 0)
+
+    def test_old_data_are_linked_to_source(self):
+        from .models import RssSourceOperationalData
+        from .dateutils import DateUtils
+
+        date_fetched = DateUtils.get_datetime_now_utc()
+        RssSourceOperationalData.objects.create(url = self.source.url, date_fetched = date_fetched)
+
+        source = RssSourceDataModel.objects.get(id = self.source.id)
+        self.assertEqual(source.get_date_fetched(), date_fetched)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(source.get_date_fetched(), date_fetched)
+        self.assertEqual(len(queries), 0)
+
+        self.assertEqual(RssSourceOperationalData.objects.get(url = self.source.url).source_obj, self.source)
+
+    def test_created_data_are_reused(self):
+        from .fetchstats import FetchStats
+        from .dateutils import DateUtils
+
+        source = RssSourceDataModel.objects.get(id = self.source.id)
+        source.set_fetch_stats(DateUtils.get_datetime_now_utc(), 1.0, FetchStats())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(source.get_import_seconds(), 1.0)
+        self.assertEqual(len(queries), 0)
+
+    def test_queue_reads_data_with_source(self):
+        from .jobqueue import DbJobQueue
+        from .models import RssSourceOperationalData
+        from .dateutils import DateUtils
+
+        date_fetched = DateUtils.get_datetime_now_utc()
+        RssSourceOperationalData.objects.create(url = self.source.url, source_obj = self.source, date_fetched = date_fetched)
+
+        queue = DbJobQueue("test-job", RssSourceDataModel, select_related = ['operational_data'])
+        queue.put(self.source)
+        source = queue.get()
 
-# Create your tests here.
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(source.get_date_fetched(), date_fetched)
+        self.assertEqual(len(queries), 0)
@@ -3,20 +3,143 @@ import logging
 import datetime
 import traceback
 import sys
+import time
+import heapq
+
+
+class ThreadJobQueue(object):
+   """
+   Priority work queue which can be shared by a pool of ThreadJobCommon workers.
+
+   Items are identified by their id attribute, if they have one. Adding an item which
+   is already queued does not create a duplicate, it can only raise its priority.
+   Items with higher priority are processed first, items of equal priority in order of arrival.
+   Keeps a global counter of processed items.
+   """
+
+   PRIORITY_NORMAL = 0
+   PRIORITY_HIGH = 10
+
+   def __init__(self):
+       self._lock = threading.Lock()
+       self._heap = []
+       self._entries = {}
+       self._counter = 0
+       self._processed = 0
+
+   def get_key(self, item):
+       if hasattr(item, "id"):
+           return item.id
+       return item
+
+   def put(self, item, priority = PRIORITY_NORMAL):
+       key = self.get_key(item)
+
+       with self._lock:
+           entry = self._entries.get(key)
+           if entry:
+               entry["item"] = item
+               if entry["priority"] >= priority:
+                   return
+               # old heap entry becomes stale, it is skipped when popped
+               added = entry["added"]
+           else:
+               added = time.time()
+
+           self._counter += 1
+           entry = {"item" : item, "priority" : priority, "order" : self._counter, "added" : added}
+           self._entries[key] = entry
+           heapq.heappush(self._heap, (-priority, self._counter, key))
+
+   def pop_stale(self):
+       while len(self._heap) > 0:
+           priority, order, key = self._heap[0]
+           entry = self._entries.get(key)
+           if entry and entry["order"] == order:
+               return key
+           heapq.heappop(self._heap)
+
+   def get(self):
+       with self._lock:
+           key = self.pop_stale()
+           if key is None:
+               return None
+
+           heapq.heappop(self._heap)
+           return self._entries.pop(key)["item"]
+
+   def get_batch(self, count):
+       """ Returns list of at most count items """
+       items = []
+       while len(items) < count:
+           item = self.get()
+           if item is None:
+               break
+           items.append(item)
+       return items
+
+   def peek(self):
+       with self._lock:
+           key = self.pop_stale()
+           if key is None:
+               return None
+           return self._entries[key]["item"]
+
+   def get_items(self):
+       with self._lock:
+           entries = sorted(self._entries.values(), key = lambda entry: (-entry["priority"], entry["order"]))
+           return [entry["item"] for entry in entries]
+
+   def size(self):
+       return len(self._entries)
+
+   def get_oldest_age(self):
+       """ Returns number of seconds the oldest item waits in queue """
+       with self._lock:
+           if len(self._entries) == 0:
+               return 0
+           oldest = min(entry["added"] for entry in self._entries.values())
+       return time.time() - oldest
+
+   def done(self, item):
+       """ Called by worker when item was processed """
+       self.item_processed()
+
+   def failed(self, item, error):
+       """ Called by worker when processing of item raised an exception """
+       self.item_processed()
+
+   def release(self, item):
+       """ Called by worker which stops before processing of item, item is queued again """
+       self.put(item)
+
+   def item_processed(self):
+       with self._lock:
+           self._processed += 1
+
+   def get_processed_count(self):
+       return self._processed
 
 
 class ThreadJobCommon(threading.Thread):
 
-   def __init__(self, name = "ThreadJobCommon", seconds_wait = 1, itemless = False):
+   def __init__(self, name = "ThreadJobCommon", seconds_wait = 1, itemless = False, queue = None, worker_id = None, batch_size = 1):
        threading.Thread.__init__(self)
        self._started_server_loop = False
-       self._process_list = []
+       if queue is None:
+           queue = ThreadJobQueue()
+       self._queue = queue
        self._process_item = None
+       self._processed = 0
        self._seconds_wait = seconds_wait
        self._close_event = threading.Event()
        self._itemless = itemless
+       # items taken from queue at once, they can be prepared together, see prepare_items
+       self._batch_size = batch_size
 
        self._thread_name = name
+       self._worker_id = worker_id
+       self._last_active = time.time()
        self.daemon = True
 
    def set_config(self, config):
@@ -30,6 +153,7 @@ class ThreadJobCommon(threading.Thread):
            self.start_server_loop()
 
        while not self._close_event.is_set():
+           self._last_active = time.time()
            if not self.handle_process_item():
                self._close_event.wait(self._seconds_wait)
 
@@ -43,26 +167,24 @@ class ThreadJobCommon(threading.Thread):
            logging.critical(E, exc_info=True)
            traceback.print_exc(file=sys.stdout)
 
-       if len(self._process_list) == 0:
+       items = self._queue.get_batch(self._batch_size)
+       if len(items) == 0:
            return False
 
-       item = self._process_list.pop(0)
-
        try:
-           self._process_item = item
-           self.process_item(item)
-           self._process_item = None
+           self.prepare_items(items)
        except Exception as E:
            logging.critical(E, exc_info=True)
            traceback.print_exc(file=sys.stdout)
 
-       try:
-           self.finished_item(item)
-       except Exception as E:
-           logging.critical(E, exc_info=True)
-           traceback.print_exc(file=sys.stdout)
+       for item in items:
+           if self._close_event.is_set():
+               # rest of batch is left to other workers
+               self._queue.release(item)
+           else:
+               self.handle_item(item)
 
-       if len(self._process_list) == 0:
+       if self._queue.size() == 0:
            try:
                self.finished_all()
            except Exception as E:
@@ -71,15 +193,55 @@ class ThreadJobCommon(threading.Thread):
 
        return True
 
+   def handle_item(self, item):
+       try:
+           self._process_item = item
+           self.process_item(item)
+           self._queue.done(item)
+       except Exception as E:
+           logging.critical(E, exc_info=True)
+           traceback.print_exc(file=sys.stdout)
+           self._queue.failed(item, E)
+
+       self._process_item = None
+       self._processed += 1
+
+       try:
+           self.finished_item(item)
+       except Exception as E:
+           logging.critical(E, exc_info=True)
+           traceback.print_exc(file=sys.stdout)
+
    def get_thread_name(self):
        return self._thread_name
 
+   def get_worker_name(self):
+       if self._worker_id is None:
+           return self._thread_name
+       return "{0}-{1}".format(self._thread_name, self._worker_id)
+
+   def get_processed_count(self):
+       return self._processed
+
+   def get_queue(self):
+       return self._queue
+
+   def is_busy(self):
+       return self._process_item is not None
+
+   def get_seconds_since_active(self):
+       """ Thread loop is active before each item, and after waiting """
+       return time.time() - self._last_active
+
    def log_error(self, text):
        logging.error(self._thread_name + ":" + text)
 
    def log_info(self, text):
        logging.info(self._thread_name + ":" + text)
 
+   def prepare_items(self, items):
+       self._config.t_prepare_items(self._thread_name, items)
+
    def process_item(self, item = None):
        self._config.t_process_item(self._thread_name, item)
 
@@ -89,23 +251,22 @@ class ThreadJobCommon(threading.Thread):
    def finished_all(self):
        self.log_info("All items were processed")
 
-   def add_to_process_list(self, item):
-       self._process_list.append(item)
+   def add_to_process_list(self, item, priority = ThreadJobQueue.PRIORITY_NORMAL):
+       self._queue.put(item, priority)
 
    def get_processs_list(self):
-       return self._process_list
+       return self._queue.get_items()
 
    def get_process_item(self):
        item = self._process_item
 
        if item is None:
-          if len(self._process_list) > 0:
-              item = self._process_list[0]
+          item = self._queue.peek()
        return item
 
    def get_queue_size(self):
-       count = len(self._process_list)
-       if self.get_process_item() is not None:
+       count = self._queue.size()
+       if self._process_item is not None:
           count += 1
        return count
 
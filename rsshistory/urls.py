@@ -46,6 +46,7 @@ urlpatterns = [
    path('truncate-errors', views.truncate_errors, name='truncate-errors'),
    path('data-errors', views.show_errors_page, name='data-errors'),
    path('show-tags', views.show_tags, name='show-tags'),
+   path('metrics', views.metrics_view, name='metrics'),
 
    # login
    path('accounts/', include('django.contrib.auth.urls')),
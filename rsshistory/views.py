@@ -62,7 +62,8 @@ class RssSourceListView(generic.ListView):
     def get_queryset(self):
 
         self.filter_form = SourcesChoiceForm(args = self.request.GET)
-        return self.filter_form.get_filtered_objects()
+        # operational data are shown for each row
+        return self.filter_form.get_filtered_objects().select_related('operational_data')
 
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get the context
@@ -88,9 +89,6 @@ class RssSourceDetailView(generic.DetailView):
         context = super(RssSourceDetailView, self).get_context_data(**kwargs)
         context = init_context(context)
 
-        c = Configuration.get_object(str(app_name))
-        c.download_rss(self.object)
-
         context['page_title'] += " - " + self.object.title
 
         return context
@@ -178,8 +176,6 @@ def edit_source(request, pk):
 
 
 def refresh_source(request, pk):
-    from .models import RssSourceOperationalData
-
     context = get_context(request)
     context['page_title'] += " - refresh source"
     context['pk'] = pk
@@ -193,11 +189,11 @@ def refresh_source(request, pk):
 
     ob = ft[0]
 
-    operational = RssSourceOperationalData.objects.filter(url = ob.url)
-    if operational.exists():
+    op = ob.get_op_data()
+    if op:
         print("saving")
-        op = operational[0]
         op.date_fetched = None
+        op.date_next_fetch = None
         op.save()
     else:
         print("not saving")
@@ -311,10 +307,12 @@ def remove_source(request, pk):
     if not request.user.is_staff:
         return render(request, app_name / 'missing_rights.html', context)
 
+    from . import search
+
     ft = RssSourceDataModel.objects.filter(id=pk)
     if ft.exists():
         source_url = ft[0].url
-        ft.delete()
+        search.delete_sources(ft)
         
         # TODO checkbox - or other button to remove corresponding entries
         #entries = RssSourceEntryDataModel.objects.filter(url = source_url)
@@ -335,9 +333,11 @@ def remove_all_sources(request):
     if not request.user.is_staff:
         return render(request, app_name / 'missing_rights.html', context)
 
+    from . import search
+
     ft = RssSourceDataModel.objects.all()
     if ft.exists():
-        ft.delete()
+        search.delete_sources(ft)
         context["summary_text"] = "Removing all sources ok"
     else:
         context["summary_text"] = "No source to remove"
@@ -377,6 +377,21 @@ def export_entries(request):
 
 
 
+def metrics_view(request):
+    """
+    Metrics in Prometheus text format. Gauges are updated when they are read.
+    Web process does not fetch, fetcher metrics are served by the worker process.
+    """
+    from django.http import HttpResponse
+    from . import metrics
+
+    c = Configuration.get_object(str(app_name))
+    c.update_queue_metrics()
+
+    text = metrics.MetricsRegistry.get_object().render((metrics.QUEUE, metrics.WEB))
+    return HttpResponse(text, content_type = "text/plain; version=0.0.4; charset=utf-8")
+
+
 def configuration(request):
     context = get_context(request)
     context['page_title'] += " - Configuration"
@@ -393,11 +408,18 @@ def configuration(request):
     from .models import PersistentInfo
     context['log_items'] = PersistentInfo.objects.all()
 
-    threads = c.get_threads()
-    for thread in threads:
-        items = thread.get_processs_list()
+    # workers run in worker process, counts are read from database
+    sources_fetched = c.get_number_of_sources_fetched(60)
 
-    context['thread_list'] = threads
+    context['scheduler_lock'] = c.scheduler_lock.get_lock()
+    context['source_queue_size'] = c.get_source_queue_size()
+    context['sources_processed'] = sources_fetched
+    context['sources_per_minute'] = "{0:.2f}".format(sources_fetched / 60)
+    context['source_queue_oldest'] = int(c.source_queue.get_oldest_age())
+    context['source_queue_dead'] = c.source_queue.get_dead_count()
+
+    from .webtools import PageCache
+    context['page_cache'] = PageCache.get_object().get_stats()
     context['server_path'] = Path(".").resolve()
     context['directory'] = Path(".").resolve()
 
@@ -431,12 +453,16 @@ class RssEntriesListView(generic.ListView):
 
     def get_queryset(self):
         self.filter_form = EntryChoiceForm(args = self.request.GET)
-        return self.filter_form.get_filtered_objects()
+        # source name, and favicon are shown for each row
+        return self.filter_form.get_filtered_objects().select_related('source_obj')
 
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get the context
         context = super(RssEntriesListView, self).get_context_data(**kwargs)
         context = init_context(context)
+
+        # tags of all rows are read with one query
+        context['entries_list'] = RssSourceEntryDataModel.prepare_list(context['entries_list'])
         # Create any data and add it to the context
 
         self.filter_form.create()
@@ -444,8 +470,7 @@ class RssEntriesListView(generic.ListView):
         self.filter_form.action_url = reverse('rsshistory:entries')
 
         c = Configuration.get_object(str(app_name))
-        thread = c.get_threads()[0]
-        queue_size = thread.get_queue_size()
+        queue_size = c.get_source_queue_size()
 
         context['filter_form'] = self.filter_form
         context['page_title'] += " - entries"
@@ -503,7 +528,8 @@ def make_not_persistent_entry(request, pk):
 
     ft = RssSourceEntryDataModel.objects.get(id=pk)
 
-    ft.tags.delete()
+    # tags are indexed with entry, entry is indexed again when it is saved below
+    ft.tags.all().delete()
 
     fav = ft.persistent
     ft.persistent = False
@@ -618,9 +644,11 @@ def remove_entry(request, pk):
     if not request.user.is_staff:
         return render(request, app_name / 'missing_rights.html', context)
 
+    from . import search
+
     entry = RssSourceEntryDataModel.objects.filter(id=pk)
     if entry.exists():
-        entry.delete()
+        search.delete_entries(entry)
 
         context["summary_text"] = "Remove ok"
     else:
@@ -821,8 +849,12 @@ def show_errors_page(request):
         print("fix_source_entry_links done")
 
     def fix_tags_links():
+        from . import search
+
         print("fix_tags_links")
 
+        removed_links = set()
+
         tags = RssEntryTagsDataModel.objects.all()
         for tag in tags:
             removed = False
@@ -832,11 +864,15 @@ def show_errors_page(request):
                 if not link.persistent:
                     print("Removed tag")
                     tag.delete()
+                    removed_links.add(tag.link)
                     removed = True
                     continue
 
             if removed:
                 continue
+
+        # tags are indexed with entries
+        search.update_links(removed_links)
         print("fix_tags_links done")
 
     def push_main_repo():
@@ -1,9 +1,209 @@
 
+import time
 import logging
+from collections import deque
+from urllib.parse import urlparse, urljoin, urldefrag
+from urllib.robotparser import RobotFileParser
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import htmlinfo
+
+
+class DomainRateLimiter(object):
+    """
+    Keeps minimal delay between requests to the same domain.
+    Nobody sleeps here, the caller asks for time to wait, and reserves a slot when it sends request.
+    """
+
+    def __init__(self, delay = 1.0):
+        self.delay = delay
+        self._next_time = {}
+
+    def get_wait(self, domain):
+        """ Returns number of seconds before domain can be requested """
+        return max(0, self._next_time.get(domain, 0) - time.monotonic())
+
+    def reserve(self, domain, delay = None):
+        if delay is None:
+            delay = self.delay
+        self._next_time[domain] = time.monotonic() + delay
+
+
+class WebCrawler(object):
+    """
+    Crawls pages, starting from start_url.
+
+    Keeps a frontier of links to visit for each domain, each link is visited once. Domains are
+    downloaded in parallel, by at most workers threads, with domain_delay between requests to
+    one domain. The delay is kept by the thread which calls crawl, download threads do not wait.
+    If link_filter keeps crawl in one domain, pages are downloaded one at a time, and workers
+    matter only for crawls of many domains. robots.txt is respected.
+    Crawl stops after max_depth levels of links, or after max_pages pages.
+
+    link_filter decides which links are followed.
+    """
+
+    user_agent = "*"
+
+    def __init__(self, start_url, max_depth = 1, max_pages = 100, workers = 8, domain_delay = 1.0):
+        self.start_url = start_url
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.workers = workers
+
+        self.limiter = DomainRateLimiter(domain_delay)
+        self.link_filter = None
+
+        # domain -> deque of (url, depth)
+        self.frontier = {}
+        self.visited = set()
+        self.robots = {}
+
+    def get_key(self, url):
+        url, fragment = urldefrag(url)
+        return url
+
+    def add(self, url, depth):
+        key = self.get_key(url)
+        if key in self.visited:
+            return
+
+        self.visited.add(key)
+        self.frontier.setdefault(self.get_domain(key), deque()).append((key, depth))
+
+    def pop_ready(self):
+        """
+        Returns ((url, depth), None) of a domain which can be requested now, or (None, seconds)
+        to the nearest free slot. Seconds are None if frontier is empty
+        """
+        slot_wait = None
+        for domain in list(self.frontier.keys()):
+            wait_seconds = self.limiter.get_wait(domain)
+            if wait_seconds > 0:
+                if slot_wait is None or wait_seconds < slot_wait:
+                    slot_wait = wait_seconds
+                continue
+
+            links = self.frontier[domain]
+            link = links.popleft()
+            if len(links) == 0:
+                del self.frontier[domain]
+            return link, None
+
+        return None, slot_wait
+
+    def get_domain(self, url):
+        items = urlparse(url)
+        return items.scheme + "://" + items.netloc
+
+    def get_robots(self, domain):
+        if domain not in self.robots:
+            from .httpclient import HttpClient
+
+            robots = RobotFileParser(domain + "/robots.txt")
+            try:
+                response = HttpClient.get_object().get(domain + "/robots.txt")
+                if response.status in (401, 403):
+                    robots.disallow_all = True
+                elif response.status == 200:
+                    robots.parse(response.get_text().splitlines())
+                else:
+                    robots.allow_all = True
+            except Exception as e:
+                logging.error("Could not read robots.txt of {0}: {1}".format(domain, str(e)))
+                robots.allow_all = True
+
+            self.robots[domain] = robots
+
+        return self.robots[domain]
+
+    def is_allowed(self, url):
+        robots = self.get_robots(self.get_domain(url))
+        return robots.can_fetch(self.user_agent, url)
+
+    def get_delay(self, url):
+        robots = self.get_robots(self.get_domain(url))
+        delay = robots.crawl_delay(self.user_agent)
+        if delay:
+            return max(float(delay), self.limiter.delay)
+
+    def fetch(self, url):
+        from .webtools import Page
+
+        page = Page(url)
+        page.is_valid()
+        return page
+
+    def get_links(self, page):
+        links = []
+        for link in page.get_html_info().links:
+            link = urljoin(page.url, link)
+
+            if not link.startswith("http"):
+                continue
+            if self.link_filter and not self.link_filter(link):
+                continue
+
+            links.append(link)
+        return links
+
+    def crawl(self, on_page):
+        """
+        Calls on_page(url, page, depth) for each downloaded page, as soon as it is available.
+        Returns number of downloaded pages.
+        """
+        self.add(self.start_url, 0)
+        fetched = 0
+
+        with ThreadPoolExecutor(max_workers = self.workers) as executor:
+            running = {}
+
+            while True:
+                # seconds to the next free slot of a domain in frontier
+                slot_wait = None
+
+                while len(running) < self.workers and fetched + len(running) < self.max_pages:
+                    link, slot_wait = self.pop_ready()
+                    if link is None:
+                        break
+
+                    url, depth = link
+                    if not self.is_allowed(url):
+                        continue
+
+                    self.limiter.reserve(self.get_domain(url), self.get_delay(url))
+                    running[executor.submit(self.fetch, url)] = (url, depth)
+
+                if len(running) == 0:
+                    if slot_wait is None:
+                        break
+                    time.sleep(slot_wait)
+                    continue
+
+                done, not_done = wait(running, timeout = slot_wait, return_when = FIRST_COMPLETED)
+
+                for future in done:
+                    url, depth = running.pop(future)
+                    fetched += 1
+
+                    try:
+                        page = future.result()
+                    except Exception as e:
+                        logging.error("Could not crawl {0}: {1}".format(url, str(e)))
+                        continue
+
+                    if not page.contents:
+                        continue
+
+                    on_page(url, page, depth)
+
+                    if depth < self.max_depth:
+                        for link in self.get_links(page):
+                            self.add(link, depth + 1)
+
+        return fetched
 
 
-import re
-import requests
 class WebLinkParser(object):
 
     def __init__(self, url, searchplace = None):
@@ -21,91 +221,39 @@ class WebLinkParser(object):
         if html == None: 
             html = self.get_page(self.searchplace)
 
-        searchstring = "https://"
-        links = set()
-
-        wh = 1
-        while wh:
-            wh2 = html.find(searchstring, wh)
-
-            where = set()
-            where.add(html.find("\"", wh2+1))
-            where.add(html.find("}", wh2+1))
-            where.add(html.find("<", wh2+1))
-            where.add(html.find(">", wh2+1))
-            where.add(html.find("\\", wh2+1))
-            where.add(html.find(")", wh2+1))
-            where.add(html.find("(", wh2+1))
-            where.discard(-1)
-            val = min(where)
-
-            foundstring = html[wh2: val]
-
-            if foundstring != searchstring:
-                links.add(foundstring)
-
-            if wh2 == -1:
-                break
-
-            wh = wh2 + 1
-
-        return links
+        return htmlinfo.parse_full_links(html)
 
     def parse_a_hrefs(self):
-        import re
-        import requests
-        links = set()
-
         page = self.get_page(self.searchplace)
 
-        wh = 1
-        while wh:
-            wh = page.find('<a href="', wh + 1)
+        return set(htmlinfo.parse_html(page).links)
 
-            if wh > 0:
-                #print(wh)
-                text = self.extract_html(page, '<a href="', '"', wh)
-                if text:
-                    links.add(text)
-                #print(text)
-            else:
-                break
-
-        return links
-
-    def parse_links_and_titles(self):
+    def parse_links_and_titles(self, max_depth = 1, max_pages = 1000):
         links_and_titles = []
 
-        links = self.parse_full_links()
-        links.update( self.parse_a_hrefs())
+        def on_page(url, page, depth):
+            if depth == 0:
+                return
 
-        links = self.process_links(links)
-
-        for link in links:
-            if not self.check_string(link):
-                continue
-
-            print("Reading link {0}".format(link))
-
-            text = self.get_page(link)
-            if not text:
-                continue
-
-            title = self.extract_html(text, "<title>", "</title>")
+            print("Reading link {0}".format(url))
 
+            title = page.get_title()
             if title:
-                links_and_titles.append( (title, link) )
+                links_and_titles.append( (title, url) )
+
+        self.crawl(on_page, max_depth, max_pages)
 
         return links_and_titles
 
+    def crawl(self, on_page, max_depth = 1, max_pages = 1000):
+        """ Crawls searchplace, links are followed if they pass check_string """
+        crawler = WebCrawler(self.searchplace, max_depth, max_pages)
+        crawler.link_filter = self.check_string
+        return crawler.crawl(on_page)
+
     def get_page(self, url):
-        import urllib.request, urllib.error, urllib.parse
-        try:
-            req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-            webContent = urllib.request.urlopen(req).read().decode('UTF-8')
-            return webContent
-        except Exception as e:
-           logging.critical(e, exc_info=True) 
+        from .webtools import Page
+        return Page(url).get_contents()
 
     def check_string(self, found_string):
         if found_string.find(self.domain) != 0:
@@ -179,12 +327,3 @@ class WebLinkParser(object):
 # for link_data in links_data:
 #     print("'{0}' '{1}'".format(link_data[0], link_data[1]))
 
-
-from .webtools import *
-
-
-domain = "https://niezalezna.pl"
-p = Page(domain)
-
-for link in p.get_links():
-    print(link)
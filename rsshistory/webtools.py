@@ -1,13 +1,189 @@
 import logging
 import re
-import urllib.request, urllib.error, urllib.parse
-from urllib.parse import urlparse
+import time
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from urllib.parse import urlparse, urlunparse, urljoin
+
+from .httpclient import HttpClient, get_setting
+from .htmlinfo import parse_html
+
+
+class PageCache(object):
+    """
+    Cache of downloaded pages, keyed by normalized url.
+
+    Entries expire after ttl seconds. When cache is full, least recently used entry is removed.
+    If directory is set, entries are also kept on disk, and survive restart. Expired files are
+    removed when they are read, and by sweep, which also removes the oldest files when directory
+    is bigger than max_disk_size.
+    """
+
+    obj = None
+    obj_lock = threading.Lock()
+
+    def __init__(self, max_entries = 500, ttl = 600, directory = None, max_disk_size = 100 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_size = max_disk_size
+        self.directory = None
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self._disk_lock = threading.Lock()
+        # size of directory, estimated between sweeps. Other processes can write to it too
+        self._disk_size = 0
+        self._last_sweep = 0
+
+        if directory:
+            self.directory = Path(directory)
+            self.directory.mkdir(parents = True, exist_ok = True)
+            self.sweep()
+
+    def get_object():
+        with PageCache.obj_lock:
+            if not PageCache.obj:
+                PageCache.obj = PageCache(
+                        max_entries = get_setting("RSSHISTORY_PAGE_CACHE_SIZE", 500),
+                        ttl = get_setting("RSSHISTORY_PAGE_CACHE_TTL", 600),
+                        directory = get_setting("RSSHISTORY_PAGE_CACHE_DIR", None),
+                        max_disk_size = get_setting("RSSHISTORY_PAGE_CACHE_DIR_SIZE", 100 * 1024 * 1024))
+        return PageCache.obj
+
+    def normalize_url(self, url):
+        items = urlparse(url.strip())
+        scheme = items.scheme.lower()
+        netloc = items.netloc.lower()
+
+        if scheme == "http" and netloc.endswith(":80"):
+            netloc = netloc[:-3]
+        if scheme == "https" and netloc.endswith(":443"):
+            netloc = netloc[:-4]
+
+        path = items.path
+        if path == "":
+            path = "/"
+
+        return urlunparse((scheme, netloc, path, items.params, items.query, ""))
+
+    def get_file_path(self, key):
+        return self.directory / (hashlib.sha256(key.encode("utf-8")).hexdigest() + ".txt")
+
+    def get(self, url):
+        key = self.normalize_url(url)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                if now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        contents = self.get_from_disk(key, now)
+
+        with self._lock:
+            if contents is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.set_memory(key, contents, now)
+            return contents
+
+    def get_from_disk(self, key, now):
+        if not self.directory:
+            return None
+
+        file_path = self.get_file_path(key)
+        try:
+            if now - file_path.stat().st_mtime < self.ttl:
+                return file_path.read_text(encoding = "utf-8")
+            file_path.unlink()
+        except OSError:
+            pass
+
+    def set(self, url, contents):
+        key = self.normalize_url(url)
+        now = time.time()
+
+        with self._lock:
+            self.set_memory(key, contents, now)
+
+        if self.directory:
+            try:
+                data = contents.encode("utf-8")
+                self.get_file_path(key).write_bytes(data)
+            except OSError as e:
+                logging.error("Could not write page cache: {0}".format(str(e)))
+                return
+
+            with self._disk_lock:
+                self._disk_size += len(data)
+                sweep = self._disk_size > self.max_disk_size or now - self._last_sweep > self.ttl
+
+            if sweep:
+                self.sweep()
+
+    def sweep(self):
+        """ Removes expired files, and the oldest files if directory is too big """
+        with self._disk_lock:
+            now = time.time()
+            self._last_sweep = now
+
+            files = []
+            for file_path in self.directory.glob("*.txt"):
+                try:
+                    stat = file_path.stat()
+                    if now - stat.st_mtime >= self.ttl:
+                        file_path.unlink()
+                    else:
+                        files.append((stat.st_mtime, stat.st_size, file_path))
+                except OSError:
+                    pass
+
+            size = sum(file_size for date, file_size, file_path in files)
+            for date, file_size, file_path in sorted(files):
+                if size <= self.max_disk_size:
+                    break
+                try:
+                    file_path.unlink()
+                    size -= file_size
+                except OSError:
+                    pass
+
+            self._disk_size = size
+
+    def set_memory(self, key, contents, date):
+        self._entries[key] = (date, contents)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last = False)
+
+    def get_stats(self):
+        return {"hits" : self.hits, "misses" : self.misses, "size" : len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
 
 class Page(object):
     def __init__(self, url):
         self.url = url
         self.contents = None
+        self.info = None
+        # HttpResponse of download, it is None if contents were read from PageCache
+        self.response = None
+        self.from_cache = False
 
     def is_valid(self):
         if not self.contents:
@@ -19,21 +195,36 @@ class Page(object):
             return False;
 
     def get_contents(self):
-        hdr = {'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.11 (KHTML, like Gecko) Chrome/23.0.1271.64 Safari/537.11',
-               'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-               'Accept-Charset': 'ISO-8859-1,utf-8;q=0.7,*;q=0.3',
-               'Accept-Encoding': 'none',
-               'Accept-Language': 'en-US,en;q=0.8',
-               'Connection': 'keep-alive'}
+        cache = PageCache.get_object()
+
+        contents = cache.get(self.url)
+        if contents is not None:
+            self.from_cache = True
+            return contents
 
         try:
-            req = urllib.request.Request(self.url, headers=hdr)
-            handle = urllib.request.urlopen(req)
-            thebytes = handle.read()
-            return thebytes.decode('UTF-8')
+            response = HttpClient.get_object().get(self.url)
+            self.response = response
+            if response.status != 200:
+                logging.error("Could not read page {0}, status {1}".format(self.url, response.status))
+                return None
+
+            contents = response.get_text()
+            cache.set(self.url, contents)
+            return contents
         except Exception as e:
            logging.critical(e, exc_info=True)
 
+    def get_html_info(self):
+        """ Page is parsed once, all data are extracted in one pass """
+        if self.info is None:
+            if not self.contents:
+                self.contents = self.get_contents()
+
+            self.info = parse_html(self.contents)
+
+        return self.info
+
     def get_language(self):
         if not self.contents:
             self.contents = self.get_contents()
@@ -41,15 +232,23 @@ class Page(object):
         if not self.contents:
             return 'en-US'
 
-        whlang = self.contents.find("lang")
-        if whlang >= 0:
-            lang = self.extract_html(self.contents, '"', '"', whlang)
-
+        lang = self.get_html_info().language
+        if lang:
             if lang.find("en") == -1 and lang.find("pl") == -1:
                 return 'en-US'
 
             return lang
 
+    def get_description(self):
+        return self.get_html_info().description
+
+    def get_feeds(self):
+        """ Returns RSS / Atom feeds advertised by page """
+        feeds = []
+        for feed in self.get_html_info().feeds:
+            feeds.append(urljoin(self.url, feed['link']))
+        return feeds
+
     def extract_html(self, text, tag, closingtag, wh = None):
         if not wh:
             wh = 0
@@ -75,12 +274,7 @@ class Page(object):
         if not self.contents:
             return None
 
-        wh1 = self.contents.find("<title", 0)
-        wh2 = self.contents.find("</title", wh1+1)
-
-        title = self.contents[wh1+7: wh2].strip()
-
-        return title
+        return self.get_html_info().title
 
     def is_link_valid(self, address):
         return self.is_link_valid_domain(address)
@@ -90,32 +284,22 @@ class Page(object):
             return False
         return True
 
-    def get_links(self):
-        import re
-        import requests
+    def get_links(self, contents = None):
+        """ contents can be passed, if page was already read """
         links = set()
 
-        page = self.get_contents()
-
-        wh = 1
-        while wh:
-            wh = page.find('<a href="', wh + 1)
-
-            if wh > 0:
-                #print(wh)
-                text = self.extract_html(page, '<a href="', '"', wh)
+        # plugins are shared, and call it for each refresh. Page is read through PageCache
+        if contents is None:
+            contents = self.get_contents()
+        info = parse_html(contents)
 
-                if text:
-                    text = text.strip()
-                    if text.startswith("/"):
-                        text = self.url + text
+        for text in info.links:
+            text = urljoin(self.url, text)
 
-                    if not self.is_link_valid(text):
-                        continue
+            if not self.is_link_valid(text):
+                continue
 
-                    if text != "" and len(text) > 1:
-                        links.add(text)
-            else:
-                break
+            if len(text) > 1:
+                links.add(text)
 
         return links